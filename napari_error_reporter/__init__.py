@@ -1,28 +1,32 @@
+from __future__ import annotations
+
 try:
     from ._version import version as __version__
 except ImportError:  # pragma: no cover
     __version__ = "unknown"
 
-import json
-import uuid
+# NOTE: napari imports this package during plugin discovery (to find napari.yaml),
+# so keep module-level imports cheap.  sentry_sdk, appdirs, Qt, and `_util` are
+# only imported when one of the names below is first used.
 from datetime import datetime
+from importlib import import_module
 from pathlib import Path
-from typing import Optional, cast
+from typing import TYPE_CHECKING, Any, Optional, cast
 
-import appdirs
-import sentry_sdk
+if TYPE_CHECKING:
+    from sentry_sdk import add_breadcrumb, capture_exception, capture_message
 
-from ._util import (
-    _DEFAULT_SETTINGS,
-    SENTRY_SETTINGS,
-    SettingsDict,
-    _try_get_admins,
-    get_release,
-    get_sample_event,
-    get_tags,
-)
+    from ._breadcrumbs import connect_viewer, record_breadcrumb
+    from ._metrics import dump_metrics, get_metrics
+    from ._opt_in_widget import OptInWidget
+    from ._reporter import PluginReporter, get_reporter
+    from ._settings import SettingsStore
+    from ._util import SettingsDict, get_release, get_sample_event
 
 INSTALLED = False
+# set when the admins fetched in the background differ from those the user agreed
+# to share reports with: nothing more is sent this session (see `_recheck_admins`)
+_ADMINS_CHANGED = False
 
 
 __all__ = [
@@ -30,94 +34,187 @@ __all__ = [
     "capture_exception",
     "capture_message",
     "add_breadcrumb",
+    "connect_viewer",
+    "dump_metrics",
+    "get_metrics",
+    "get_reporter",
     "get_sample_event",
     "get_release",
     "install_error_reporter",
     "OptInWidget",
+    "PluginReporter",
+    "record_breadcrumb",
     "settings_path",
 ]
 
+# public names that are resolved lazily, mapped to the module that provides them
+_LAZY_ATTRS = {
+    "capture_exception": "sentry_sdk",
+    "capture_message": "sentry_sdk",
+    "add_breadcrumb": "sentry_sdk",
+    "connect_viewer": "._breadcrumbs",
+    "record_breadcrumb": "._breadcrumbs",
+    "get_metrics": "._metrics",
+    "dump_metrics": "._metrics",
+    "get_reporter": "._reporter",
+    "PluginReporter": "._reporter",
+    "get_release": "._util",
+    "get_sample_event": "._util",
+    "OptInWidget": "._opt_in_widget",
+}
+
 
-capture_exception = sentry_sdk.capture_exception
-capture_message = sentry_sdk.capture_message
-add_breadcrumb = sentry_sdk.add_breadcrumb
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRS:
+        attr = getattr(import_module(_LAZY_ATTRS[name], __name__), name)
+        globals()[name] = attr  # cache, so __getattr__ isn't called again
+        return attr
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
 
 
 def settings_path() -> Path:
     """Return the path used for napari-error-reporter settings."""
+    import appdirs
+
     data = appdirs.user_data_dir("napari", False)
     return Path(data) / "error_reporting.json"
 
 
+def _admins_cache_path() -> Path:
+    """Return the path used to cache the ADMINS file between sessions."""
+    return settings_path().parent / "admins_cache.json"
+
+
+def _spool_dir() -> Path:
+    """Return the directory where unsent events are kept between sessions."""
+    return settings_path().parent / "spool"
+
+
+def _use_environment_cache() -> None:
+    """Persist release/tag discovery next to the settings file between sessions."""
+    from ._util import ENV_CACHE
+
+    ENV_CACHE.path = settings_path().parent / "environment_cache.json"
+
+
+# one store per settings file, so its in-memory cache outlives a single call
+_STORES: dict[Path, SettingsStore] = {}
+
+
+def _settings_store() -> SettingsStore:
+    from ._settings import SettingsStore
+    from ._util import _DEFAULT_SETTINGS
+
+    path = settings_path()
+    if path not in _STORES:
+        _STORES[path] = SettingsStore(path, _DEFAULT_SETTINGS)
+    return _STORES[path]
+
+
 def _load_settings() -> SettingsDict:
     """load saved settings."""
-    data: SettingsDict = _DEFAULT_SETTINGS
-    settings = settings_path()
-    if settings.exists():
-        try:
-            with open(settings) as fh:
-                _data = json.load(fh)
-                if "date" in _data:
-                    try:
-                        _data["date"] = datetime.fromisoformat(_data["date"])
-                    except Exception:  # pragma: no cover
-                        _data["date"] = datetime.now()
-                else:  # pragma: no cover
-                    _data["date"] = datetime.now()
-                data.update(_data)
-        except Exception:  # pragma: no cover
-            settings.unlink()
-    data["admins"] = set(data["admins"])
-    return data
-
-
-def _save_settings(settings: SettingsDict):
-    """Save settings dict to user space."""
-    dest = settings_path()
-    dest.parent.mkdir(exist_ok=True, parents=True)
-    _settings = cast(dict, settings.copy())
-    _settings["admins"] = list(settings["admins"])  # cast to list for serialization
-    _settings["date"] = settings["date"].isoformat()  # cast to string
-
-    with open(dest, "w") as fh:
-        json.dump(_settings, fh)
-
-
-def ask_opt_in(force=False) -> SettingsDict:
+    return cast("SettingsDict", _settings_store().load())
+
+
+def _save_settings(settings: SettingsDict, delay: Optional[float] = None):
+    """Save settings dict to user space (after `delay` seconds, see SettingsStore)."""
+    _settings_store().save(settings, delay)
+
+
+def ask_opt_in(force=False, headless: Optional[bool] = None) -> SettingsDict:
     """Show the dialog asking the user to opt in.
 
+    A decision in ``NAPARI_TELEMETRY_OPT_IN`` (or the ``NAPARI_TELEMETRY_CONFIG``
+    file) is used without asking (and isn't saved).
+
     Parameters
     ----------
     force : bool, optional
         If True, will show opt_in even if user has already opted in/out,
         by default False.
+    headless : bool, optional
+        If True, ask on the terminal instead of with a Qt dialog (no decision is
+        made if stdin isn't interactive).  By default, the terminal is used
+        unless Qt has already been imported.
 
     Returns
     -------
     SettingsDict
         A dict of settings (see SettingsDict class.)
     """
+    from ._headless import qt_loaded, scripted_decision
+    from ._util import _get_admins
+
+    _use_environment_cache()
     settings = _load_settings()
-    current_admins = _try_get_admins()
+    if not force and (scripted := scripted_decision()) is not None:
+        settings.update(scripted)  # type: ignore
+        return settings
+    if not force and settings.get("enabled") is False:
+        # if they've previously responded "No", bail here (without touching the
+        # network to fetch the current admins).
+        return settings
+
+    # (unknown on first launch: they are fetched in the background, then rechecked)
+    current_admins = _get_admins(_admins_cache_path(), on_fetched=_recheck_admins)
     admins_have_changed = bool(
         current_admins and settings["admins"] and current_admins != settings["admins"]
     )
 
-    if not force:
-        if settings.get("enabled") is False:
-            # if they've previously responded "No", bail here.
-            return settings
-        elif settings.get("enabled") and not admins_have_changed:
-            # if they've previously responded "Yes"
-            # and `force` is not True (to force showing the prompt again)
-            # and the admins haven't changed since the last acceptance
-            # then don't ask again.
-            return settings
+    if not force and settings.get("enabled") and not admins_have_changed:
+        # if they've previously responded "Yes"
+        # and `force` is not True (to force showing the prompt again)
+        # and the admins haven't changed since the last acceptance
+        # then don't ask again.
+        return settings
 
     # otherwise, update admins in the settings and show the widget
     if current_admins is not None:
         settings["admins"] = current_admins
 
+    if headless is None:
+        headless = not qt_loaded()
+    if headless:
+        from ._headless import prompt
+
+        answer = prompt(settings["admins"], admins_have_changed)
+        if answer is None:
+            return settings  # no decision: don't report, and ask again next time
+        enabled, lcls = answer["enabled"], answer["with_locals"]
+    else:
+        enabled, lcls = _ask_with_widget(settings, admins_have_changed)
+    settings.update({"enabled": enabled, "with_locals": lcls, "date": datetime.now()})
+    _save_settings(settings, delay=0)  # the user's answer is written right away
+    return settings
+
+
+def _recheck_admins(admins: set[str]) -> None:
+    """Re-evaluate the opt-in with the `admins` fetched in the background."""
+    global _ADMINS_CHANGED
+    settings = _load_settings()
+    if not settings.get("enabled") or admins == settings["admins"]:
+        return
+    if settings["admins"]:
+        # reports would go to people the user hasn't agreed to: ask again next
+        # time (keeping the old admins, so the prompt says that they changed)
+        _ADMINS_CHANGED = True
+        settings["enabled"] = None
+    else:
+        settings["admins"] = admins
+    _save_settings(settings, delay=0)
+
+
+def _drop_if_admins_changed(event: dict, hint: dict) -> Optional[dict]:
+    return None if _ADMINS_CHANGED else event
+
+
+def _ask_with_widget(
+    settings: SettingsDict, admins_have_changed: bool
+) -> tuple[Optional[bool], bool]:
     from ._opt_in_widget import OptInWidget
 
     dlg = OptInWidget(settings=settings, admins_have_changed=admins_have_changed)
@@ -126,28 +223,121 @@ def ask_opt_in(force=False) -> SettingsDict:
         enabled = True  # pragma: no cover
     elif dlg._no:
         enabled = False  # pragma: no cover
+    return enabled, dlg.send_locals.isChecked()
 
-    lcls = dlg.send_locals.isChecked()
-    settings.update({"enabled": enabled, "with_locals": lcls, "date": datetime.now()})
-    _save_settings(settings)
-    return settings
 
+def install_error_reporter(headless: Optional[bool] = None):
+    """Initialize the error reporter with sentry.io
+
+    Qt is never imported with `headless=True` (see `ask_opt_in`), or when an
+    opt-in decision is given by ``NAPARI_TELEMETRY_OPT_IN``.
 
-def install_error_reporter():
-    """Initialize the error reporter with sentry.io"""
+    If ``NAPARI_TELEMETRY_SUMMARY_INTERVAL`` is set (in seconds), events are
+    counted and sent in periodic summaries, rather than one by one (see
+    `_summary.SessionSummary`).
+    If ``NAPARI_TELEMETRY_HANG_THRESHOLD`` is set (in seconds), stalls of the Qt
+    event loop longer than that are reported too (see `_watchdog.HangWatchdog`).
+    """
     global INSTALLED
     if INSTALLED:
         return  # pragma: no cover
 
-    settings = ask_opt_in()
+    import atexit
+    import sys
+    import uuid
+
+    import sentry_sdk
+
+    from . import _multiprocess
+    from ._breadcrumbs import RECORDER
+    from ._dedup import Deduplicator
+    from ._deferred import DEFERRED, DEFERRED_CAPTURE
+    from ._locals import LocalsSerializer
+    from ._metrics import METRICS, dump_metrics
+    from ._plugins import PluginClassifier
+    from ._sampling import TracesSampler
+    from ._shutdown import ExitHandler, flush_transport
+    from ._summary import SUMMARY_INTERVAL, SessionSummary
+    from ._transport import SpoolTransport
+    from ._util import (
+        SENTRY_SETTINGS,
+        chain_before_send,
+        get_release,
+        get_tags,
+        strip_sensitive_data,
+        tag_git_dirty_async,
+    )
+    from ._watchdog import start_watchdog
+
+    if _multiprocess.install_worker():
+        # a worker process: events are reported by the main process
+        INSTALLED = True
+        return
+
+    settings = ask_opt_in(headless=headless)
     if not settings.get("enabled"):
         return
 
     _settings = SENTRY_SETTINGS.copy()
     _settings["release"] = get_release()
     _settings["with_locals"] = settings.get("with_locals", False)
+    _settings["traces_sampler"] = TracesSampler.from_settings(settings)
+    _settings["transport"] = SpoolTransport(_spool_dir(), str(_settings["dsn"]))
+    scrub = METRICS.wrap("scrub", strip_sensitive_data)
+    dedup = Deduplicator()
+    summary = SessionSummary(process=scrub) if SUMMARY_INTERVAL > 0 else None
+    if summary is not None:
+        # count events, and send them in periodic summaries
+        first: Any = METRICS.wrap("summary", summary)
+    else:
+        # drop repeated events before doing any more work on them
+        first = METRICS.wrap("dedup", dedup)
+    before_send = chain_before_send(_drop_if_admins_changed, first, scrub)
+    _settings["before_send"] = METRICS.wrap("before_send", before_send)
+    if DEFERRED_CAPTURE:
+        # uncaught exceptions are captured by DEFERRED.excepthook instead
+        from sentry_sdk.integrations import iter_default_integrations
+        from sentry_sdk.integrations.excepthook import ExcepthookIntegration
+
+        _settings["default_integrations"] = False
+        _settings["integrations"] = [
+            cls()
+            for cls in iter_default_integrations(False)
+            if cls is not ExcepthookIntegration
+        ]
     sentry_sdk.init(**_settings)
+    # get pending events to the transport, and upload what we can, within
+    # NAPARI_TELEMETRY_SHUTDOWN_BUDGET_MS (the rest is sent by the next session)
+    exit_handler = ExitHandler()
+    if DEFERRED_CAPTURE:
+        if not getattr(sys.excepthook, "_napari_error_reporter", False):
+            sys.excepthook = DEFERRED.excepthook(sys.excepthook)
+        exit_handler.add("capture", DEFERRED.flush)
+    if summary is not None:
+        exit_handler.add("summary", lambda _: summary.flush())
+    else:
+        exit_handler.add("dedup", lambda _: dedup.send_summaries())
+    transport = _settings["transport"]
+    exit_handler.add("transport", lambda timeout: flush_transport(transport, timeout))
+    atexit.register(dump_metrics)  # if NAPARI_TELEMETRY_METRICS_FILE is set
+    exit_handler.install()  # (runs before dump_metrics and sentry's own handler)
+    # (the ignores: our processors take plain dicts, not sentry's Event TypedDict)
+    scope = sentry_sdk.Hub.main.scope
+    # set in_app and the responsible plugin (needs abs_path, before scrubbing)
+    plugins = METRICS.wrap("plugins", PluginClassifier())
+    scope.add_event_processor(plugins)  # type: ignore[arg-type, misc]
+    if _settings["with_locals"]:
+        # render frame locals within a size budget, before sentry repr's them all
+        lcls = METRICS.wrap("locals", LocalsSerializer())
+        scope.add_event_processor(lcls)  # type: ignore[arg-type, misc]
+    # add breadcrumbs from `record_breadcrumb` when events are captured
+    breadcrumbs = METRICS.wrap("breadcrumbs", RECORDER)
+    scope.add_event_processor(breadcrumbs)  # type: ignore[arg-type, misc]
     for k, v in get_tags().items():
         sentry_sdk.set_tag(k, v)
     sentry_sdk.set_user({"id": uuid.getnode()})
+    tag_git_dirty_async()
+    start_watchdog()  # if NAPARI_TELEMETRY_HANG_THRESHOLD is set
+    if _multiprocess.MULTIPROCESS:
+        _multiprocess.start_aggregator(with_locals=bool(_settings["with_locals"]))
     INSTALLED = True
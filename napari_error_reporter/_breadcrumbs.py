@@ -0,0 +1,184 @@
+"""Low-overhead breadcrumbs for high-frequency napari events.
+
+`sentry_sdk.add_breadcrumb` builds a dict, a timestamp and runs hooks on every
+call, which adds up for events like dims slider drags or layer data updates.
+`BreadcrumbRecorder` instead overwrites preallocated records in a ring buffer,
+coalescing consecutive repeats of the same event, and only turns them into sentry
+breadcrumbs (as an event processor) when an event is actually captured.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# number of breadcrumbs kept by the recorder
+BREADCRUMBS_SIZE = int(os.getenv("NAPARI_TELEMETRY_BREADCRUMBS", "100"))
+
+
+class _Crumb:
+    __slots__ = ("category", "message", "data", "level", "first", "last", "count")
+
+    def __init__(self) -> None:
+        self.category = ""
+        self.message = ""
+        self.data: Any = None
+        self.level = "info"
+        self.first = 0.0
+        self.last = 0.0
+        self.count = 0
+
+    def materialize(self) -> Dict[str, Any]:
+        crumb: Dict[str, Any] = {
+            "type": "default",
+            "category": self.category,
+            "message": self.message,
+            "level": self.level,
+            "timestamp": _utc(self.last),
+        }
+        data = dict(self.data) if isinstance(self.data, dict) else {}
+        if self.data is not None and not isinstance(self.data, dict):
+            data["value"] = self.data
+        if self.count > 1:
+            data["count"] = self.count
+            data["duration"] = round(self.last - self.first, 3)
+        if data:
+            crumb["data"] = data
+        return crumb
+
+
+def _utc(timestamp: float) -> datetime:
+    # naive UTC, like sentry's own breadcrumbs (so that they sort together)
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def _sort_key(crumb: Dict[str, Any]) -> datetime:
+    ts = crumb.get("timestamp")
+    if isinstance(ts, datetime):
+        return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+    return datetime.min
+
+
+class BreadcrumbRecorder:
+    """Ring buffer of breadcrumbs, added to events when they are captured.
+
+    Use an instance as a sentry event processor.  Breadcrumbs from
+    `sentry_sdk.add_breadcrumb` are kept, and merged in time order.
+
+    Parameters
+    ----------
+    size : int
+        Number of breadcrumbs kept (older ones are overwritten).
+    """
+
+    def __init__(self, size: int = BREADCRUMBS_SIZE) -> None:
+        self.size = max(size, 1)
+        self._crumbs = [_Crumb() for _ in range(self.size)]
+        self._next = 0  # index of the slot to write next
+        self._len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def record(
+        self,
+        category: str,
+        message: str = "",
+        data: Any = None,
+        level: str = "info",
+    ) -> None:
+        """Record a breadcrumb.
+
+        If it has the same category and message as the previous one, the two are
+        coalesced: the count is incremented and `data` replaces the previous data.
+        `data` (a dict, or any value) is stored by reference, and only read when
+        an event is captured.
+        """
+        now = time.time()
+        with self._lock:
+            if self._len:
+                prev = self._crumbs[self._next - 1]
+                if prev.category == category and prev.message == message:
+                    prev.data = data
+                    prev.level = level
+                    prev.last = now
+                    prev.count += 1
+                    return
+            crumb = self._crumbs[self._next]
+            crumb.category = category
+            crumb.message = message
+            crumb.data = data
+            crumb.level = level
+            crumb.first = crumb.last = now
+            crumb.count = 1
+            self._next = (self._next + 1) % self.size
+            self._len = min(self._len + 1, self.size)
+
+    def breadcrumbs(self) -> List[Dict[str, Any]]:
+        """Return recorded breadcrumbs as sentry breadcrumb dicts, oldest first."""
+        with self._lock:
+            start = (self._next - self._len) % self.size
+            crumbs = [self._crumbs[(start + i) % self.size] for i in range(self._len)]
+            return [c.materialize() for c in crumbs]
+
+    def clear(self) -> None:
+        """Forget all recorded breadcrumbs."""
+        with self._lock:
+            self._len = 0
+
+    def __call__(
+        self, event: Dict[str, Any], hint: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        if event.get("type") == "transaction":
+            return event
+        values = event.setdefault("breadcrumbs", {}).setdefault("values", [])
+        values.extend(self.breadcrumbs())
+        values.sort(key=_sort_key)
+        del values[: -self.size]
+        return event
+
+
+RECORDER = BreadcrumbRecorder()
+
+
+def record_breadcrumb(
+    category: str, message: str = "", data: Any = None, level: str = "info"
+) -> None:
+    """Record a breadcrumb with the global recorder (see `BreadcrumbRecorder`)."""
+    RECORDER.record(category, message, data, level)
+
+
+def connect_viewer(viewer: Any, recorder: Optional[BreadcrumbRecorder] = None) -> None:
+    """Record breadcrumbs for layer changes and dims updates of a napari `viewer`.
+
+    Parameters
+    ----------
+    viewer : napari.Viewer
+        The viewer to connect.
+    recorder : BreadcrumbRecorder, optional
+        Recorder to use, by default the global one.
+    """
+    rec = RECORDER if recorder is None else recorder
+
+    def _on_step(event: Any) -> None:
+        rec.record("napari.dims", "current_step", event.value)
+
+    def _on_data(event: Any) -> None:
+        rec.record("napari.layer", f"data changed: {event.source.name}")
+
+    def _on_inserted(event: Any) -> None:
+        layer = event.value
+        rec.record("napari.layers", f"inserted {type(layer).__name__}: {layer.name}")
+        layer.events.data.connect(_on_data)
+
+    def _on_removed(event: Any) -> None:
+        layer = event.value
+        rec.record("napari.layers", f"removed {type(layer).__name__}: {layer.name}")
+        layer.events.data.disconnect(_on_data)
+
+    viewer.dims.events.current_step.connect(_on_step)
+    viewer.layers.events.inserted.connect(_on_inserted)
+    viewer.layers.events.removed.connect(_on_removed)
+    for layer in viewer.layers:
+        layer.events.data.connect(_on_data)
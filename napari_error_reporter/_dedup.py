@@ -0,0 +1,198 @@
+"""Client-side deduplication and rate limiting of events.
+
+A napari callback that fails inside a paint loop can raise the same exception
+hundreds of times per second.  `Deduplicator` is a `before_send` hook that drops
+repeats of an event (by fingerprint) and reports how often they were repeated.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from ._metrics import METRICS
+
+# seconds after which a repeated event is reported again (with a repeat count)
+DEDUP_WINDOW = float(os.getenv("NAPARI_TELEMETRY_DEDUP_WINDOW", "60"))
+# number of recent fingerprints remembered
+DEDUP_CACHE_SIZE = int(os.getenv("NAPARI_TELEMETRY_DEDUP_CACHE_SIZE", "256"))
+# events per minute (and burst size) allowed for a single fingerprint
+FINGERPRINT_RATE = float(os.getenv("NAPARI_TELEMETRY_FINGERPRINT_RATE", "1"))
+FINGERPRINT_BURST = float(os.getenv("NAPARI_TELEMETRY_FINGERPRINT_BURST", "1"))
+# events per minute (and burst size) allowed in total
+GLOBAL_RATE = float(os.getenv("NAPARI_TELEMETRY_GLOBAL_RATE", "10"))
+GLOBAL_BURST = float(os.getenv("NAPARI_TELEMETRY_GLOBAL_BURST", "20"))
+
+# key in the `hint` of events that should bypass deduplication
+BYPASS_HINT = "napari_error_reporter.bypass_dedup"
+REPEATED_KEY = "napari_error_reporter.repeated"
+
+
+class TokenBucket:
+    """Allow `burst` events at once, refilled at `rate` events per minute."""
+
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate / 60
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def ready(self, now: Optional[float] = None) -> bool:
+        """Return True if a token is available (without taking it)."""
+        now = time.monotonic() if now is None else now
+        if now > self.last:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+        return self.tokens >= 1
+
+    def take(self, now: Optional[float] = None) -> bool:
+        """Take a token, return False if none are available."""
+        if self.ready(now):
+            self.tokens -= 1
+            return True
+        return False
+
+
+def fingerprint(event: Dict[str, Any]) -> str:
+    """Return a fingerprint for `event`.
+
+    Exceptions are identified by their type and the chain of in-app frames
+    (module, function and line) that raised them; messages by their text.
+    """
+    parts: List[str] = []
+    for exc in (event.get("exception") or {}).get("values") or ():
+        parts.append(str(exc.get("type")))
+        for frame in (exc.get("stacktrace") or {}).get("frames") or ():
+            if frame.get("in_app") is not False:
+                parts.append(
+                    f"{frame.get('module') or frame.get('filename')}:"
+                    f"{frame.get('function')}:{frame.get('lineno')}"
+                )
+    if not parts:
+        logentry = event.get("logentry") or {}
+        parts.append(str(event.get("message") or logentry.get("message")))
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+
+
+def _title(event: Dict[str, Any]) -> str:
+    """Return a short, human readable title for `event`."""
+    for exc in (event.get("exception") or {}).get("values") or ():
+        return f"{exc.get('type')}: {exc.get('value')}"
+    logentry = event.get("logentry") or {}
+    return str(event.get("message") or logentry.get("message"))
+
+
+class _Entry:
+    __slots__ = ("title", "first", "suppressed", "bucket")
+
+    def __init__(self, title: str, now: float) -> None:
+        self.title = title
+        self.first = now
+        self.suppressed = 0
+        self.bucket = TokenBucket(FINGERPRINT_RATE, FINGERPRINT_BURST)
+
+
+def _summary(fp: str, entry: _Entry) -> Dict[str, Any]:
+    n = entry.suppressed
+    return {
+        "message": f"{entry.title} (repeated {n} times)",
+        "level": "warning",
+        "fingerprint": [fp, "repeated"],
+        "extra": {REPEATED_KEY: n},
+    }
+
+
+class Deduplicator:
+    """`before_send` hook that drops repeated events and rate limits the rest.
+
+    Parameters
+    ----------
+    window : float
+        Seconds after which a repeated fingerprint starts a new window.  The first
+        event passed in a new window carries the number of events suppressed in
+        the previous one (in ``extra["napari_error_reporter.repeated"]``).
+    maxsize : int
+        Number of fingerprints remembered (least recently seen are forgotten, and
+        their suppressed counts kept for `pop_summaries`, up to `maxsize` of them).
+    rate, burst : float
+        Events per minute, and burst size, allowed for all events combined.
+        (Per-fingerprint limits are given by `FINGERPRINT_RATE/BURST`).
+    """
+
+    def __init__(
+        self,
+        window: float = DEDUP_WINDOW,
+        maxsize: int = DEDUP_CACHE_SIZE,
+        rate: float = GLOBAL_RATE,
+        burst: float = GLOBAL_BURST,
+    ) -> None:
+        self.window = window
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._bucket = TokenBucket(rate, burst)
+        self._seen: "OrderedDict[str, _Entry]" = OrderedDict()
+        # summaries of forgotten fingerprints with suppressed repeats
+        self._evicted: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __call__(
+        self, event: Dict[str, Any], hint: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        if hint.get(BYPASS_HINT):
+            return event
+
+        fp = fingerprint(event)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(fp)
+            repeated = 0
+            if entry is None or now - entry.first > self.window:
+                repeated = entry.suppressed if entry else 0
+                entry = self._seen[fp] = _Entry(_title(event), now)
+            self._seen.move_to_end(fp)
+            while len(self._seen) > self.maxsize:
+                old_fp, old = self._seen.popitem(last=False)
+                if old.suppressed:
+                    if len(self._evicted) < self.maxsize:
+                        self._evicted.append(_summary(old_fp, old))
+                    else:
+                        METRICS.incr("dedup.summaries_lost")
+
+            # (only take tokens if both buckets have one)
+            if not (entry.bucket.ready(now) and self._bucket.ready(now)):
+                entry.suppressed += 1 + repeated
+                self.dropped += 1
+                METRICS.incr("dedup.dropped")
+                return None
+            entry.bucket.take(now)
+            self._bucket.take(now)
+
+        if repeated:
+            event.setdefault("extra", {})[REPEATED_KEY] = repeated
+        return event
+
+    def pop_summaries(self) -> List[Dict[str, Any]]:
+        """Return "repeated N times" events for all currently suppressed repeats.
+
+        Suppressed counts are reset.  These events should be captured with
+        ``hint={BYPASS_HINT: True}``.
+        """
+        with self._lock:
+            out, self._evicted = self._evicted, []
+            for fp, entry in self._seen.items():
+                if entry.suppressed:
+                    out.append(_summary(fp, entry))
+                    entry.suppressed = 0
+        return out
+
+    def send_summaries(self) -> None:
+        """Capture the events from `pop_summaries` with the main hub."""
+        import sentry_sdk
+
+        for event in self.pop_summaries():
+            sentry_sdk.Hub.main.capture_event(
+                event, hint={BYPASS_HINT: True}  # type: ignore[arg-type]
+            )
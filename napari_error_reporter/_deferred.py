@@ -0,0 +1,203 @@
+"""Capture exceptions with minimal work on the calling (usually the Qt GUI) thread.
+
+Sentry builds the whole event where an exception is captured: it walks the stack,
+`repr`s locals, reads source lines, runs `before_send` and serializes the envelope.
+For exceptions raised in Qt slots that all happens on the GUI thread, before
+control returns to the event loop.  `DeferredCapture` only takes a snapshot of
+the traceback inline (code objects, line numbers and shallow copies of the frame
+locals, so later changes don't leak into the report) and builds and sends the
+event on a background thread.
+"""
+import copy
+import os
+import queue
+import sys
+import threading
+from contextlib import suppress
+from types import TracebackType
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from ._metrics import METRICS
+
+# whether install_error_reporter builds events for uncaught exceptions off-thread
+DEFERRED_CAPTURE = os.getenv("NAPARI_TELEMETRY_DEFERRED_CAPTURE", "1") not in ("", "0")
+# maximum number of exceptions waiting to be processed (more are dropped)
+DEFERRED_QUEUE_SIZE = 100
+
+ExcInfo = Tuple[Type[BaseException], BaseException, Optional[TracebackType]]
+
+
+class _FrameSnapshot:
+    """The parts of a frame object that sentry reads."""
+
+    __slots__ = ("f_code", "f_globals", "f_locals", "f_lineno")
+
+    def __init__(self, frame: Any, with_locals: bool) -> None:
+        self.f_code = frame.f_code
+        self.f_globals = frame.f_globals
+        self.f_lineno = frame.f_lineno
+        # (reading f_locals is needed for __traceback_hide__ even without locals)
+        f_locals = frame.f_locals
+        if with_locals:
+            self.f_locals = dict(f_locals)
+        else:
+            hide = f_locals.get("__traceback_hide__")
+            self.f_locals = {} if hide is None else {"__traceback_hide__": hide}
+
+
+class _TracebackSnapshot:
+    """The parts of a traceback object that sentry reads."""
+
+    __slots__ = ("tb_frame", "tb_lineno", "tb_next")
+
+    def __init__(self, tb: TracebackType, with_locals: bool) -> None:
+        self.tb_frame = _FrameSnapshot(tb.tb_frame, with_locals)
+        self.tb_lineno = tb.tb_lineno
+        self.tb_next: Optional[_TracebackSnapshot] = None
+
+
+def snapshot_traceback(
+    tb: Optional[TracebackType], with_locals: bool = True
+) -> Optional[_TracebackSnapshot]:
+    """Return a copy of `tb` that can be turned into a sentry event later."""
+    head: Optional[_TracebackSnapshot] = None
+    tail: Optional[_TracebackSnapshot] = None
+    while tb is not None:
+        snap = _TracebackSnapshot(tb, with_locals)
+        if tail is None:
+            head = snap
+        else:
+            tail.tb_next = snap
+        tail, tb = snap, tb.tb_next
+    return head
+
+
+class DeferredCapture:
+    """Build and capture events for exceptions on a background thread.
+
+    Parameters
+    ----------
+    hub : sentry_sdk.Hub, optional
+        Hub used to capture events.  By default, `sentry_sdk.Hub.main`.
+    maxsize : int
+        Maximum number of pending exceptions.  Exceptions are dropped (and counted
+        in the ``capture.dropped`` metric) while the queue is full.
+    """
+
+    def __init__(self, hub: Any = None, maxsize: int = DEFERRED_QUEUE_SIZE) -> None:
+        self.hub = hub
+        self._queue: "queue.Queue[Tuple[ExcInfo, Any, Dict[str, Any]]]"
+        self._queue = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _hub(self) -> Any:
+        import sentry_sdk
+
+        return self.hub or sentry_sdk.Hub.main
+
+    def capture(
+        self,
+        error: Optional[BaseException] = None,
+        mechanism: Optional[Dict[str, Any]] = None,
+        tags: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Snapshot `error` (by default, the exception being handled) and queue it.
+
+        `tags` are added to (a copy of) the current scope.
+        """
+        with METRICS.timed("capture.inline"):
+            hub = self._hub()
+            client = hub.client
+            if client is None:
+                return
+            if error is None:
+                exc_type, exc_value, tb = sys.exc_info()
+                if exc_value is None:
+                    return
+            else:
+                exc_type, exc_value, tb = type(error), error, error.__traceback__
+
+            # (renamed to include_local_variables in sentry-sdk 1.18)
+            options = client.options
+            with_locals = bool(
+                options.get("include_local_variables", options.get("with_locals"))
+            )
+            snap = snapshot_traceback(tb, with_locals)
+            exc_info: Any = (exc_type, exc_value, snap)  # sentry only duck-types tb
+            # tags, breadcrumbs, etc. as they were when the exception happened
+            scope = copy.copy(hub.scope)
+            for key, value in (tags or {}).items():
+                scope.set_tag(key, value)
+            try:
+                self._queue.put_nowait((exc_info, scope, mechanism or {}))
+            except queue.Full:
+                METRICS.incr("capture.dropped")
+                return
+            self._ensure_thread()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run,
+                        name="napari-error-reporter-capture",
+                        daemon=True,
+                    )
+                    self._thread.start()
+
+    def _run(self) -> None:
+        from sentry_sdk.utils import event_from_exception
+
+        while True:
+            exc_info, scope, mechanism = self._queue.get()
+            try:
+                with METRICS.timed("capture.deferred"):
+                    client = self._hub().client
+                    if client is not None:
+                        event, hint = event_from_exception(
+                            exc_info,
+                            client_options=client.options,
+                            mechanism=mechanism or None,
+                        )
+                        # (the hub would merge its current scope into the snapshot)
+                        client.capture_event(event, hint=hint, scope=scope)
+            except Exception:  # pragma: no cover
+                METRICS.incr("capture.failed")
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to `timeout` seconds for queued exceptions to be captured."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+
+        def _join() -> None:
+            self._queue.join()
+            done.set()
+
+        threading.Thread(target=_join, daemon=True).start()
+        return done.wait(timeout)
+
+    def excepthook(self, previous: Callable[..., Any]) -> Callable[..., Any]:
+        """Return a `sys.excepthook` that captures, then calls `previous`."""
+
+        def napari_error_reporter_excepthook(
+            exc_type: Type[BaseException],
+            value: BaseException,
+            tb: Optional[TracebackType],
+        ) -> Any:
+            with suppress(Exception):
+                if value.__traceback__ is None:
+                    value.__traceback__ = tb
+                mechanism = {"type": "excepthook", "handled": False}
+                self.capture(value, mechanism=mechanism)
+            return previous(exc_type, value, tb)
+
+        napari_error_reporter_excepthook._napari_error_reporter = True  # type: ignore
+        return napari_error_reporter_excepthook
+
+
+DEFERRED = DeferredCapture()
@@ -0,0 +1,89 @@
+"""Opt-in decisions without Qt: from the environment, a config file or a prompt.
+
+Batch jobs and cluster workers have no display (and often no Qt), so
+`ask_opt_in` uses these instead of `OptInWidget` unless Qt is already loaded.
+"""
+import json
+import os
+import sys
+from contextlib import suppress
+from typing import Any, Dict, Optional, Set
+
+# scripted decision: "yes" (or 1/true/on), "locals" (yes, including locals),
+# or "no" (or 0/false/off)
+OPT_IN = os.getenv("NAPARI_TELEMETRY_OPT_IN", "")
+# path of a JSON file with {"enabled": bool, "with_locals": bool} (e.g. site-wide)
+CONFIG = os.getenv("NAPARI_TELEMETRY_CONFIG", "")
+
+_YES = {"1", "yes", "y", "true", "on"}
+_NO = {"0", "no", "n", "false", "off"}
+_QT_MODULES = ("qtpy", "PyQt5", "PyQt6", "PySide2", "PySide6")
+
+
+def qt_loaded() -> bool:
+    """Return True if a Qt binding has already been imported."""
+    return any(name in sys.modules for name in _QT_MODULES)
+
+
+def scripted_decision(
+    opt_in: Optional[str] = None, config: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Return settings decided by `OPT_IN`, or else by the `CONFIG` file.
+
+    Returns None if neither makes a decision.
+    """
+    value = (OPT_IN if opt_in is None else opt_in).strip().lower()
+    if value in _YES:
+        return {"enabled": True, "with_locals": False}
+    if value == "locals":
+        return {"enabled": True, "with_locals": True}
+    if value in _NO:
+        return {"enabled": False, "with_locals": False}
+
+    path = CONFIG if config is None else config
+    if path:
+        with suppress(OSError, ValueError, AttributeError):
+            with open(path) as fh:
+                data = json.load(fh)
+            if isinstance(data.get("enabled"), bool):
+                return {
+                    "enabled": data["enabled"],
+                    "with_locals": bool(data.get("with_locals", False)),
+                }
+    return None
+
+
+PROMPT = """\
+You have installed napari-error-reporter.
+
+Would you like to help us improve napari by automatically sending bug reports
+(via Sentry.io) when an error is detected in napari?
+These admins have access: {admins}
+(Set NAPARI_TELEMETRY_OPT_IN=yes/no/locals to answer without this prompt.)
+"""
+
+
+def prompt(admins: Set[str], admins_have_changed: bool = False) -> Optional[dict]:
+    """Ask on the terminal whether to send reports.
+
+    Returns None (no decision) if stdin is not interactive.
+    """
+    if not (sys.stdin and sys.stdin.isatty()):
+        return None
+    if admins_have_changed:
+        print("CHANGE: the list of admins with access to reports has changed.")
+    print(PROMPT.format(admins=", ".join(sorted(admins))))
+    try:
+        # local variables greatly improve interpretability of errors, but may
+        # leak personal identifiable information like file paths
+        answer = input("Send reports? [y]es / [n]o / yes, including [l]ocals: ")
+    except EOFError:
+        return None
+    answer = answer.strip().lower()
+    if answer in _YES:
+        return {"enabled": True, "with_locals": False}
+    if answer in ("l", "locals"):
+        return {"enabled": True, "with_locals": True}
+    if answer in _NO:
+        return {"enabled": False, "with_locals": False}
+    return None
@@ -0,0 +1,290 @@
+"""A local stand-in for the sentry ingest endpoint, and a load test that uses it.
+
+Run ``python -m napari_error_reporter._ingest serve [--port PORT]`` and point the
+reporter at it with ``NAPARI_TELEMETRY_DSN`` (the DSN is printed on startup).
+
+``python -m napari_error_reporter._ingest replay -n 5000`` fires synthetic
+exceptions through the capture pipeline (to a local server, unless ``--dsn`` is
+given) and prints throughput, queue saturation and dropped events.
+"""
+import argparse
+import gzip
+import json
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import sentry_sdk
+from sentry_sdk.envelope import Envelope
+
+from ._dedup import Deduplicator
+from ._deferred import DeferredCapture
+from ._metrics import METRICS
+from ._transport import SpoolTransport
+from ._util import chain_before_send, strip_sensitive_data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "IngestServer"
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        encoding = self.headers.get("Content-Encoding")
+        try:
+            if encoding == "gzip":
+                body = gzip.decompress(body)
+            elif encoding == "deflate":
+                body = zlib.decompress(body)
+            envelope = Envelope.deserialize(body)  # type: ignore[misc]
+        except Exception:
+            self.send_response(400)
+            self.end_headers()
+            return
+        self.server.record(self.path, envelope, len(body))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.send_response(self.server.status)
+        self.end_headers()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class IngestServer(ThreadingHTTPServer):
+    """HTTP server that accepts sentry envelopes and keeps them in memory.
+
+    Parameters
+    ----------
+    host : str
+        Address to listen on.
+    port : int
+        Port to listen on, by default any free port.
+
+    Attributes
+    ----------
+    status : int
+        HTTP status returned for envelopes (e.g. 503 to simulate an outage).
+    delay : float
+        Seconds to wait before responding (to simulate a slow network).
+    received : List[Tuple[str, Envelope]]
+        Request path and envelope of everything received.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__((host, port), _Handler)
+        self.status = 200
+        self.delay = 0.0
+        self.received: List[Tuple[str, Envelope]] = []
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def dsn(self) -> str:
+        """DSN that sends events to this server."""
+        host, port = self.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode()
+        return f"http://public@{host}:{port}/1"
+
+    def record(self, path: str, envelope: Envelope, size: int) -> None:
+        with self._lock:
+            self.received.append((path, envelope))
+            self.bytes_received += size
+
+    def events(self) -> List[Dict[str, Any]]:
+        """Return the events (if any) of all received envelopes."""
+        with self._lock:
+            envelopes = [env for _, env in self.received]
+        events: List[Any] = [env.get_event() for env in envelopes]
+        return [e for e in events if e is not None]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.received.clear()
+            self.bytes_received = 0
+
+    def start(self) -> "IngestServer":
+        """Serve in a background thread."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="ingest-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "IngestServer":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+
+def _raise_at_depth(depth: int, i: int) -> None:
+    if depth <= 0:
+        raise ValueError(f"synthetic error {i}")
+    _raise_at_depth(depth - 1, i)
+
+
+def replay(
+    n: int = 1000,
+    dsn: Optional[str] = None,
+    spool_dir: Optional[Path] = None,
+    depth: int = 20,
+    distinct: int = 10,
+    dedup: bool = False,
+    deferred: bool = True,
+    timeout: float = 60,
+) -> Dict[str, Any]:
+    """Capture `n` synthetic exceptions and report how the pipeline coped.
+
+    Events go through the same pipeline as `install_error_reporter` sets up
+    (`DeferredCapture`, optionally `Deduplicator`, scrubbing, `SpoolTransport`),
+    with a client of their own, so the main hub is left alone.
+
+    Parameters
+    ----------
+    n : int
+        Number of exceptions to capture.
+    dsn : str, optional
+        DSN to send to.  By default, a local `IngestServer` is started.
+    spool_dir : Path, optional
+        Spool directory, by default a temporary directory.
+    depth : int
+        Stack depth at which the exceptions are raised.
+    distinct : int
+        Number of distinct exception messages (i.e. ``i % distinct``).
+    dedup : bool
+        Whether to deduplicate and rate limit events (which drops most of them).
+    deferred : bool
+        Whether to capture with `DeferredCapture` (as the excepthook installed by
+        `install_error_reporter` does), or synchronously.
+    timeout : float
+        Seconds to wait for all events to be uploaded.
+
+    Returns
+    -------
+    Dict[str, Any]
+        ``captured`` events, ``capture_seconds`` and ``captures_per_second`` on
+        the calling thread, ``max_queue`` (pending exceptions in the deferred
+        queue), the number of events ``dropped_queue_full``, ``dropped_dedup``,
+        ``dropped_spool_full``, ``sent`` and ``received`` (by the local server),
+        and ``drain_seconds`` until everything was sent.
+    """
+    server = None
+    if dsn is None:
+        server = IngestServer().start()
+        dsn = server.dsn
+    tmp = None
+    if spool_dir is None:
+        tmp = tempfile.TemporaryDirectory()
+        spool_dir = Path(tmp.name)
+
+    before = METRICS.snapshot()["counters"]
+    transport = SpoolTransport(spool_dir, dsn)
+    hooks = [Deduplicator(), strip_sensitive_data] if dedup else [strip_sensitive_data]
+    client = sentry_sdk.Client(
+        dsn,
+        transport=transport,
+        before_send=chain_before_send(*hooks),  # type: ignore[arg-type]
+        default_integrations=False,
+        shutdown_timeout=0,
+    )
+    hub = sentry_sdk.Hub(client)
+    capture = DeferredCapture(hub) if deferred else None
+    try:
+        max_queue = 0
+        start = time.perf_counter()
+        for i in range(n):
+            try:
+                _raise_at_depth(depth, i % max(distinct, 1))
+            except ValueError as e:
+                if capture is not None:
+                    capture.capture(e)
+                    max_queue = max(max_queue, capture._queue.qsize())
+                else:
+                    hub.capture_exception(e)
+        capture_seconds = time.perf_counter() - start
+        if capture is not None:
+            capture.flush(timeout)
+        transport.flush(max(timeout - (time.perf_counter() - start), 0))
+        drain_seconds = time.perf_counter() - start
+    finally:
+        client.close(timeout=0)
+        if server is not None:
+            server.stop()
+        if tmp is not None:
+            tmp.cleanup()
+
+    after = METRICS.snapshot()["counters"]
+
+    def _delta(name: str) -> int:
+        return after.get(name, 0) - before.get(name, 0)
+
+    return {
+        "captured": n,
+        "capture_seconds": capture_seconds,
+        "captures_per_second": n / capture_seconds if capture_seconds else 0.0,
+        "max_queue": max_queue,
+        "dropped_queue_full": _delta("capture.dropped"),
+        "dropped_dedup": _delta("dedup.dropped"),
+        "dropped_spool_full": _delta("transport.spool_full"),
+        "sent": _delta("transport.sent"),
+        "received": len(server.received) if server is not None else None,
+        "drain_seconds": drain_seconds,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run a local ingest server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=0)
+    serve.add_argument("--status", type=int, default=200, help="response status")
+    load = commands.add_parser("replay", help="capture synthetic exceptions")
+    load.add_argument("-n", type=int, default=1000, help="number of exceptions")
+    load.add_argument("--dsn", help="by default, a local ingest server is used")
+    load.add_argument("--depth", type=int, default=20, help="stack depth")
+    load.add_argument("--distinct", type=int, default=10)
+    load.add_argument("--dedup", action="store_true", help="deduplicate events")
+    load.add_argument("--sync", action="store_true", help="capture synchronously")
+    load.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args(argv)
+
+    if args.command == "replay":
+        result = replay(
+            args.n,
+            dsn=args.dsn,
+            depth=args.depth,
+            distinct=args.distinct,
+            dedup=args.dedup,
+            deferred=not args.sync,
+            timeout=args.timeout,
+        )
+        print(json.dumps(result, indent=2))
+        return
+
+    server = IngestServer(args.host, args.port)
+    server.status = args.status
+    print(f"NAPARI_TELEMETRY_DSN={server.dsn}", flush=True)
+    try:
+        with server:
+            while True:
+                time.sleep(5)
+                print(f"{len(server.received)} envelopes received", flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
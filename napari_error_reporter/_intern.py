@@ -0,0 +1,166 @@
+"""Compact encoding of stacktraces, with frame strings interned in a table.
+
+Events from napari repeat the same filenames, modules, functions and source lines
+in many frames and many events.  `encode_stacktraces` replaces each frame with
+the index of its "symbol" in a `StringTable` (shared by all events encoded with
+it): the frame's location and source lines, themselves as indices of strings in
+the table.  Only what differs between occurrences of a frame (its ``vars``, also
+interned) is stored with the event.  `decode_stacktraces` turns them back into standard
+sentry frames.  Frame keys whose value is None are not restored.
+"""
+import json
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+# frame keys stored (by position) in frame symbols
+FIELDS = (
+    "filename",
+    "abs_path",
+    "module",
+    "function",
+    "lineno",
+    "context_line",
+    "pre_context",
+    "post_context",
+    "in_app",
+)
+_STRINGS = frozenset({"filename", "abs_path", "module", "function", "context_line"})
+_STRING_LISTS = frozenset({"pre_context", "post_context"})
+_FIELD_SET = frozenset(FIELDS)
+# key that replaces ``frames`` in encoded stacktraces
+ENCODED_KEY = "interned_frames"
+
+
+class StringTable:
+    """Append-only table of strings, each stored once (thread-safe)."""
+
+    def __init__(self, strings: Iterable[str] = ()) -> None:
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.extend(strings)
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def add(self, string: str) -> int:
+        """Return the index of `string`, adding it if needed."""
+        index = self._index.get(string)
+        if index is None:
+            with self._lock:
+                index = self._index.get(string)
+                if index is None:
+                    index = self._index[string] = len(self.strings)
+                    self.strings.append(string)
+        return index
+
+    def extend(self, strings: Iterable[str]) -> None:
+        for string in strings:
+            self.add(string)
+
+    def truncate(self, n: int) -> None:
+        """Forget all strings added after the first `n`."""
+        with self._lock:
+            for string in self.strings[n:]:
+                del self._index[string]
+            del self.strings[n:]
+
+
+def _stacktraces(event: Dict[str, Any], key: str) -> Iterator[Dict[str, Any]]:
+    for section in ("exception", "threads"):
+        for value in (event.get(section) or {}).get("values") or ():
+            stacktrace = value.get("stacktrace")
+            if stacktrace and stacktrace.get(key):
+                yield stacktrace
+
+
+def encode_frame(frame: Dict[str, Any], table: StringTable) -> Any:
+    """Return `frame` encoded with `table`.
+
+    That's the index of the frame's symbol, a JSON list of its `FIELDS` (with
+    strings replaced by their index).  If the frame has ``vars`` (with string
+    values), or other keys or values of unexpected types, it's a list
+    ``[index, {key: value} or None, name, value, name, value...]`` instead,
+    with the names and values of ``vars`` as indices of strings in `table`.
+    """
+    symbol: List[Any] = []
+    extra = {k: v for k, v in frame.items() if k not in _FIELD_SET}
+    variables: List[int] = []
+    f_vars = extra.get("vars")
+    if isinstance(f_vars, dict) and all(
+        isinstance(k, str) and isinstance(v, str) for k, v in f_vars.items()
+    ):
+        del extra["vars"]
+        for k, v in f_vars.items():
+            variables.extend((table.add(k), table.add(v)))
+    for field in FIELDS:
+        value = frame.get(field)
+        if value is None:
+            pass
+        elif field in _STRINGS:
+            if isinstance(value, str):
+                value = table.add(value)
+            else:
+                extra[field], value = value, None
+        elif field in _STRING_LISTS:
+            if isinstance(value, list) and all(isinstance(v, str) for v in value):
+                value = [table.add(v) for v in value]
+            else:
+                extra[field], value = value, None
+        symbol.append(value)
+    while symbol and symbol[-1] is None:
+        symbol.pop()
+    index = table.add(json.dumps(symbol, separators=(",", ":")))
+    if extra or variables:
+        return [index, extra or None, *variables]
+    return index
+
+
+def decode_frame(
+    encoded: Any, strings: Sequence[str], cache: Optional[Dict[int, Any]] = None
+) -> Dict[str, Any]:
+    """Reverse `encode_frame`, given the `strings` of its table.
+
+    Decoded symbols are kept in `cache` (if given) for the next frames.
+    """
+    if isinstance(encoded, int):
+        index, extra, variables = encoded, None, ()
+    else:
+        index, extra, *variables = encoded
+    symbol = cache.get(index) if cache is not None else None
+    if symbol is None:
+        symbol = {}
+        for field, value in zip(FIELDS, json.loads(strings[index])):
+            if value is None:
+                continue
+            if field in _STRINGS:
+                value = strings[value]
+            elif field in _STRING_LISTS:
+                value = [strings[v] for v in value]
+            symbol[field] = value
+        if cache is not None:
+            cache[index] = symbol
+    frame = {k: list(v) if isinstance(v, list) else v for k, v in symbol.items()}
+    if extra:
+        frame.update(extra)
+    if variables:
+        it = iter(variables)
+        frame["vars"] = {strings[k]: strings[v] for k, v in zip(it, it)}
+    return frame
+
+
+def encode_stacktraces(event: Dict[str, Any], table: StringTable) -> Dict[str, Any]:
+    """Encode the frames of all stacktraces in `event` (in place) with `table`."""
+    for stacktrace in list(_stacktraces(event, "frames")):
+        frames = stacktrace.pop("frames")
+        stacktrace[ENCODED_KEY] = [encode_frame(f, table) for f in frames]
+    return event
+
+
+def decode_stacktraces(event: Dict[str, Any], strings: Sequence[str]) -> Dict[str, Any]:
+    """Reverse `encode_stacktraces` (in place), given the table's `strings`."""
+    cache: Dict[int, Any] = {}
+    for stacktrace in list(_stacktraces(event, ENCODED_KEY)):
+        encoded = stacktrace.pop(ENCODED_KEY)
+        stacktrace["frames"] = [decode_frame(f, strings, cache) for f in encoded]
+    return event
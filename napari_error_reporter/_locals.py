@@ -0,0 +1,152 @@
+"""Bounded, size-aware serialization of frame local variables.
+
+With `with_locals=True`, sentry stores each frame's ``f_locals`` on the event and
+later `repr`s everything in it.  In napari those locals are often large arrays,
+lazy (dask/zarr-backed) arrays and layers, which makes capturing slow and events
+huge.  `LocalsSerializer` is an event processor that runs before sentry's own
+serializer and replaces each frame's locals with short, pre-rendered strings.
+"""
+import os
+import reprlib
+import warnings
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# maximum characters of rendered locals per frame, and per event
+MAX_FRAME_BYTES = int(os.getenv("NAPARI_TELEMETRY_LOCALS_FRAME_BYTES", "2048"))
+MAX_EVENT_BYTES = int(os.getenv("NAPARI_TELEMETRY_LOCALS_EVENT_BYTES", "16384"))
+# maximum characters for the repr of a single value
+MAX_VALUE_CHARS = 200
+# numpy arrays with at most this many elements get min/max/mean stats
+STATS_MAX_SIZE = 100_000
+# top level packages whose objects may be lazy: calling repr (or anything else)
+# on them may trigger computation or I/O, so they are only ever summarized.
+LAZY_PACKAGES = {"dask", "zarr", "xarray", "tensorstore", "h5py", "cupy", "torch"}
+
+
+def _package(obj: Any) -> str:
+    return (type(obj).__module__ or "").partition(".")[0]
+
+
+def _is_array(obj: Any) -> bool:
+    # look at the type (not the instance) to avoid triggering __getattr__ hooks
+    cls = type(obj)
+    return hasattr(cls, "shape") and hasattr(cls, "dtype")
+
+
+def summarize_array(obj: Any) -> str:
+    """Return a short description of array-like `obj` without touching its data.
+
+    Small, in-memory numpy arrays also get min/max/mean stats.
+    """
+    cls = type(obj)
+    desc = f"<{cls.__module__}.{cls.__qualname__}"
+    try:
+        desc += f" shape={tuple(obj.shape)} dtype={obj.dtype}"
+    except Exception:  # pragma: no cover
+        pass
+    if _package(obj) == "numpy" and 0 < getattr(obj, "size", 0) <= STATS_MAX_SIZE:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                desc += f" min={obj.min()} max={obj.max()} mean={obj.mean():.4g}"
+        except Exception:
+            pass  # e.g. object or string dtype
+    return desc + ">"
+
+
+class _Repr(reprlib.Repr):
+    def __init__(self) -> None:
+        super().__init__()
+        self.maxlevel = 3
+        self.maxstring = MAX_VALUE_CHARS
+        self.maxother = MAX_VALUE_CHARS
+
+    def repr1(self, x: Any, level: int) -> str:
+        if _is_array(x):
+            return summarize_array(x)
+        if _package(x) in LAZY_PACKAGES:
+            cls = type(x)
+            return f"<{cls.__module__}.{cls.__qualname__} object at {id(x):#x}>"
+        return super().repr1(x, level)
+
+
+_repr = _Repr()
+
+
+def safe_repr(obj: Any) -> str:
+    """Return a short repr of `obj` (see `_Repr`) that never raises."""
+    try:
+        return _repr.repr(obj)
+    except Exception:  # pragma: no cover
+        return f"<{type(obj).__qualname__} object (repr failed)>"
+
+
+class _Rendered(str):
+    """A pre-rendered repr (sentry's serializer would otherwise `repr` it again)."""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def _frames_innermost_first(event: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for key in ("exception", "threads"):
+        for value in reversed((event.get(key) or {}).get("values") or ()):
+            yield from reversed((value.get("stacktrace") or {}).get("frames") or ())
+
+
+class LocalsSerializer:
+    """Event processor that renders frame locals within a byte budget.
+
+    Frames are processed innermost first (those are most useful when debugging);
+    once `max_event_bytes` have been used, outer frames lose their locals.
+
+    Parameters
+    ----------
+    max_frame_bytes : int
+        Maximum characters of rendered locals for a single frame.
+    max_event_bytes : int
+        Maximum characters of rendered locals for the whole event.
+    """
+
+    def __init__(
+        self,
+        max_frame_bytes: int = MAX_FRAME_BYTES,
+        max_event_bytes: int = MAX_EVENT_BYTES,
+    ) -> None:
+        self.max_frame_bytes = max_frame_bytes
+        self.max_event_bytes = max_event_bytes
+
+    def __call__(
+        self, event: Dict[str, Any], hint: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        remaining = self.max_event_bytes
+        for frame in _frames_innermost_first(event):
+            if "vars" not in frame:
+                continue
+            if remaining <= 0:
+                del frame["vars"]
+                continue
+            budget = min(self.max_frame_bytes, remaining)
+            frame["vars"], used = self._render(frame["vars"], budget)
+            remaining -= used
+        return event
+
+    @staticmethod
+    def _render(f_locals: Dict[str, Any], budget: int) -> Tuple[Dict[str, str], int]:
+        out: Dict[str, str] = {}
+        used = 0
+        # copy: module-level frame locals are the (possibly changing) globals
+        items = [(k, v) for k, v in list(f_locals.items()) if not k.startswith("__")]
+        for i, (name, value) in enumerate(items):
+            if not isinstance(value, str):
+                value = _Rendered(safe_repr(value))
+            elif len(value) > MAX_VALUE_CHARS:
+                value = value[:MAX_VALUE_CHARS] + "..."
+            if used + len(name) + len(value) > budget:
+                out["..."] = _Rendered(f"<{len(items) - i} more variables not shown>")
+                break
+            out[name] = value
+            used += len(name) + len(value)
+        return out, used
@@ -0,0 +1,148 @@
+"""Counters and latency histograms for the reporter's own overhead.
+
+Each stage of the pipeline (deduplication, locals serialization, scrubbing, the
+transport...) records how often it ran and how long it took in `METRICS`, so that
+UI hitches can be attributed to (or ruled out as) error reporting.  Use
+`get_metrics` to inspect them, or set ``NAPARI_TELEMETRY_METRICS_FILE`` to have
+them written to a JSON file at exit.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar, Union
+
+# if set, metrics are written to this file when the interpreter exits
+METRICS_FILE = os.getenv("NAPARI_TELEMETRY_METRICS_FILE", "")
+# upper bounds (seconds) of the histogram buckets
+BUCKETS = (1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 0.01, 0.03, 0.1, 0.3, 1.0, 3.0)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Histogram:
+    """Count of observations in `BUCKETS`, with their total and maximum."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last one is "> BUCKETS[-1]"
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Return an upper bound for the `q` quantile (0-1)."""
+        target, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{f"<={b:g}": n for b, n in zip(BUCKETS, self.counts)},
+                f">{BUCKETS[-1]:g}": self.counts[-1],
+            },
+        }
+
+
+class Metrics:
+    """Thread-safe registry of named counters and `Histogram`s."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, n: int = 1) -> None:
+        """Increment counter `name` by `n`."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Add a duration (in seconds) to histogram `name`."""
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """Context manager that records the duration of its block in `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def wrap(self, name: str, func: F) -> F:
+        """Return `func`, recording the duration of each call in `name`."""
+
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(name, time.perf_counter() - start)
+
+        wrapper.__wrapped__ = func  # type: ignore
+        return wrapper  # type: ignore
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all counters, and a summary of all histograms."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "timings": {k: h.summary() for k, h in self.histograms.items()},
+            }
+
+    def reset(self) -> None:
+        """Clear all metrics."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def dump(self, path: Union[str, Path]) -> None:
+        """Write `snapshot` (with the process id and time) to `path` as JSON."""
+        data = {"pid": os.getpid(), "time": time.time(), **self.snapshot()}
+        dest = Path(path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_text(json.dumps(data, indent=2))
+
+
+METRICS = Metrics()
+
+
+def get_metrics() -> Dict[str, Any]:
+    """Return counters and latency summaries (in seconds) of the error reporter.
+
+    Timings are keyed by stage, e.g. ``before_send``, ``dedup``, ``scrub``,
+    ``locals``, ``transport.capture``, ``transport.queue_wait`` and
+    ``transport.send``.
+    """
+    return METRICS.snapshot()
+
+
+def dump_metrics(path: Optional[Union[str, Path]] = None) -> None:
+    """Write `get_metrics` to `path` (by default, ``NAPARI_TELEMETRY_METRICS_FILE``)."""
+    if path or METRICS_FILE:
+        METRICS.dump(path or METRICS_FILE)
@@ -0,0 +1,223 @@
+"""Forward events from worker processes to the reporter in the main process.
+
+With ``NAPARI_TELEMETRY_MULTIPROCESS=1``, `install_error_reporter` also starts an
+`Aggregator`: a local socket (or named pipe on Windows) that worker processes
+send their events to.  Its address and key are passed to workers in environment
+variables, and workers (forked ones automatically, spawned ones when they call
+`install_error_reporter` or `install_worker`) then use a `ForwardingTransport`
+instead of their own opt-in check, admin fetch and upload.  Events are captured
+again in the main process, so they get its tags and go through its `before_send`
+(deduplication and `strip_sensitive_data`) and transport.
+"""
+import os
+import threading
+from contextlib import suppress
+from multiprocessing import current_process
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional
+
+from sentry_sdk.consts import DEFAULT_OPTIONS
+from sentry_sdk.transport import Transport
+from sentry_sdk.utils import logger
+
+from ._locals import LocalsSerializer, _frames_innermost_first, _Rendered
+
+# whether `install_error_reporter` starts an aggregator for worker processes
+MULTIPROCESS = os.getenv("NAPARI_TELEMETRY_MULTIPROCESS", "0") not in ("", "0")
+
+# environment variables used to pass the aggregator to worker processes
+ADDRESS_ENV = "NAPARI_TELEMETRY_AGGREGATOR"
+AUTHKEY_ENV = "NAPARI_TELEMETRY_AGGREGATOR_KEY"
+PID_ENV = "NAPARI_TELEMETRY_AGGREGATOR_PID"
+LOCALS_ENV = "NAPARI_TELEMETRY_AGGREGATOR_LOCALS"
+
+
+def is_worker() -> bool:
+    """Return True if this process should forward events to an aggregator."""
+    pid = os.environ.get(PID_ENV)
+    return bool(os.environ.get(ADDRESS_ENV)) and pid != str(os.getpid())
+
+
+def worker_tags() -> Dict[str, str]:
+    """Return tags that identify this (worker) process."""
+    return {"worker.pid": str(os.getpid()), "worker.name": current_process().name}
+
+
+class ForwardingTransport(Transport):
+    """Transport that sends events to an `Aggregator` in another process.
+
+    Events are sent synchronously (it's a local connection), so nothing is lost
+    if the worker exits without running `atexit` handlers.
+    """
+
+    def __init__(self, address: str, authkey: bytes) -> None:
+        # (mypy trips over the type comment on sentry's Transport.__init__)
+        super().__init__()  # type: ignore[misc]
+        self.address = address
+        self.authkey = authkey
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()
+
+    # (sentry annotates `event` with its Event TypedDict, we take any dict)
+    def capture_event(self, event: Dict[str, Any]) -> None:  # type: ignore[override]
+        event.setdefault("tags", {}).update(worker_tags())
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = Client(self.address, authkey=self.authkey)
+                self._conn.send(event)
+            except (OSError, EOFError, ValueError) as e:
+                # the main process is gone (or not listening), nothing we can do
+                logger.debug("Could not forward event to main process: %s", e)
+                self._conn = None
+                self.record_lost_event("network_error", data_category="error")
+
+    def capture_envelope(self, envelope: Any) -> None:
+        # sessions and transactions are only reported by the main process
+        pass
+
+    def kill(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                with suppress(OSError):
+                    self._conn.close()
+                self._conn = None
+
+
+def _mark_rendered(event: Dict[str, Any]) -> None:
+    # locals were already serialized by the worker, don't let sentry repr them again
+    for frame in _frames_innermost_first(event):
+        if isinstance(frame.get("vars"), dict):
+            frame["vars"] = {
+                k: _Rendered(v) if isinstance(v, str) else v
+                for k, v in frame["vars"].items()
+            }
+
+
+class Aggregator:
+    """Receive events from worker processes and capture them with `hub`.
+
+    Parameters
+    ----------
+    hub : sentry_sdk.Hub, optional
+        Hub used to capture forwarded events.  By default, `sentry_sdk.Hub.main`.
+    """
+
+    def __init__(self, hub: Any = None) -> None:
+        self.hub = hub
+        self.authkey = os.urandom(32)
+        self.listener = Listener(authkey=self.authkey)
+        self.address = str(self.listener.address)
+        self.received = 0
+        self._closed = False
+        self._conns: List[Connection] = []
+        threading.Thread(
+            target=self._accept, name="napari-error-reporter-aggregator", daemon=True
+        ).start()
+
+    @property
+    def environ(self) -> Dict[str, str]:
+        """Environment variables that make a process forward to this aggregator."""
+        return {
+            ADDRESS_ENV: self.address,
+            AUTHKEY_ENV: self.authkey.hex(),
+            PID_ENV: str(os.getpid()),
+        }
+
+    def _accept(self) -> None:
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                continue  # e.g. a client that failed authentication
+            self._conns.append(conn)
+            threading.Thread(target=self._receive, args=(conn,), daemon=True).start()
+
+    def _receive(self, conn: Connection) -> None:
+        import sentry_sdk
+
+        with conn:
+            while True:
+                try:
+                    event = conn.recv()
+                except (EOFError, OSError):
+                    return
+                except Exception as e:  # unpicklable garbage: skip it
+                    logger.debug("Could not receive event from worker: %s", e)
+                    continue
+                if isinstance(event, dict):
+                    self.received += 1
+                    _mark_rendered(event)
+                    hub = self.hub or sentry_sdk.Hub.main
+                    hub.capture_event(event)  # type: ignore[arg-type]
+
+    def close(self) -> None:
+        """Stop accepting events."""
+        self._closed = True
+        with suppress(OSError):
+            self.listener.close()
+        for conn in self._conns:
+            with suppress(OSError):
+                conn.close()
+
+
+_AGGREGATOR: Optional[Aggregator] = None
+
+
+def start_aggregator(with_locals: bool = False) -> Aggregator:
+    """Start the aggregator for this process, and advertise it to child processes.
+
+    Parameters
+    ----------
+    with_locals : bool
+        Whether workers should include frame locals in their events.
+    """
+    global _AGGREGATOR
+    if _AGGREGATOR is None:
+        import atexit
+
+        _AGGREGATOR = Aggregator()
+        atexit.register(_AGGREGATOR.close)
+        os.register_at_fork(after_in_child=_after_fork)
+    os.environ.update(_AGGREGATOR.environ)
+    os.environ[LOCALS_ENV] = "1" if with_locals else "0"
+    return _AGGREGATOR
+
+
+def _after_fork() -> None:
+    global _AGGREGATOR
+    # the aggregator's threads don't exist in the child; forward to the parent
+    _AGGREGATOR = None
+    if is_worker():
+        install_worker()
+
+
+def install_worker() -> bool:
+    """Send this process's events to the aggregator of the main process.
+
+    Usable as the `initializer` of a `multiprocessing.Pool` or
+    `concurrent.futures.ProcessPoolExecutor`.  Returns False (and does nothing)
+    if no aggregator was advertised to this process.
+    """
+    if not is_worker():
+        return False
+
+    import sentry_sdk
+
+    with_locals = os.environ.get(LOCALS_ENV) == "1"
+    transport = ForwardingTransport(
+        os.environ[ADDRESS_ENV], bytes.fromhex(os.environ.get(AUTHKEY_ENV, ""))
+    )
+    # (renamed to include_local_variables in sentry-sdk 1.18)
+    key = "include_local_variables"
+    if key not in DEFAULT_OPTIONS:
+        key = "with_locals"
+    options: Dict[str, Any] = {"transport": transport, key: with_locals}
+    sentry_sdk.init(**options)
+    if with_locals:
+        # (sentry expects a processor of its Event TypedDict)
+        scope = sentry_sdk.Hub.main.scope
+        scope.add_event_processor(LocalsSerializer())  # type: ignore[arg-type, misc]
+    return True
@@ -1,7 +1,11 @@
+import functools
 import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
 from pprint import pformat
 
 from qtpy.QtCore import Qt
+from qtpy.QtCore import Signal  # type: ignore[attr-defined]
 from qtpy.QtWidgets import (
     QApplication,
     QCheckBox,
@@ -18,8 +22,27 @@ from qtpy.QtWidgets import (
 
 from ._util import _DEFAULT_SETTINGS, SettingsDict, get_sample_event
 
+# generating a sample event builds a sentry client and raises a real exception,
+# so it's done off the GUI thread (and only once per `with_locals` value).
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sample-event")
+
+
+@functools.lru_cache(maxsize=None)
+def _render_sample_event(with_locals: bool) -> str:
+    """Return a sample event (see `get_sample_event`) as a string."""
+    event = get_sample_event(with_locals=with_locals)
+
+    try:
+        import yaml
+
+        return yaml.safe_dump(event, indent=4, width=120)
+    except Exception:
+        return pformat(event, indent=2, width=120)
+
 
 class OptInWidget(QDialog):
+    _sample_ready = Signal(bool, str)
+
     def __init__(
         self,
         settings: SettingsDict = _DEFAULT_SETTINGS,
@@ -35,10 +58,13 @@ class OptInWidget(QDialog):
         super().__init__(parent=parent)
         self._mock_initialized = False
         self._no = False
+        self._sample_ready.connect(self._on_sample_ready)
 
         self._setup_ui(settings, admins_have_changed)
         self.send_locals.setChecked(settings.get("with_locals", False))
         self._update_example()
+        # precompute the other variant, so that toggling the checkbox is instant
+        self._request_sample(not self.send_locals.isChecked())
 
     def _setup_ui(self, settings: SettingsDict, admins_have_changed: bool):
         btn_box = QDialogButtonBox()
@@ -122,13 +148,23 @@ class OptInWidget(QDialog):
         self._no = True
 
     def _update_example(self):
-        event = get_sample_event(with_locals=self.send_locals.isChecked())
-
-        try:
-            import yaml
-
-            estring = yaml.safe_dump(event, indent=4, width=120)
-        except Exception:
-            estring = pformat(event, indent=2, width=120)
-
-        self.txt.setText(estring)
+        future = self._request_sample(self.send_locals.isChecked())
+        if not future.done():
+            self.txt.setText("Generating example...")
+
+    def _request_sample(self, with_locals: bool) -> Future:
+        """Render sample event in a worker thread, emit `_sample_ready` when done."""
+        future = _EXECUTOR.submit(_render_sample_event, with_locals)
+
+        def _emit(f: Future) -> None:
+            err = f.exception()
+            text = f.result() if err is None else f"Could not generate example: {err}"
+            with suppress(RuntimeError):  # the widget may have been deleted
+                self._sample_ready.emit(with_locals, text)
+
+        future.add_done_callback(_emit)
+        return future
+
+    def _on_sample_ready(self, with_locals: bool, text: str):
+        if with_locals == self.send_locals.isChecked():
+            self.txt.setText(text)
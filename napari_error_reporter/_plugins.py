@@ -0,0 +1,143 @@
+"""Attribute stack frames to napari and napari plugins.
+
+The installed plugins (``napari.manifest`` entry points) and the directories
+their packages live in are indexed once (and cached between sessions with the
+rest of the environment, see `_util.ENV_CACHE`).  `PluginClassifier` then marks
+frames from napari and its plugins as ``in_app`` and tags events with the plugin
+whose code raised, using a single precompiled regex (and a per-path cache) rather
+than any per-frame metadata lookups.
+"""
+import os
+import re
+from importlib import metadata
+from importlib.util import find_spec
+from typing import Any, Dict, Iterator, List, Optional, cast
+
+# entry point group used by napari plugins (npe2)
+ENTRY_POINT_GROUP = "napari.manifest"
+# name used for napari's own frames
+NAPARI = "napari"
+
+
+def _entry_points() -> List[Any]:
+    eps = metadata.entry_points()
+    if hasattr(eps, "select"):  # python 3.10+
+        return list(eps.select(group=ENTRY_POINT_GROUP))
+    return list(cast(dict, eps).get(ENTRY_POINT_GROUP, ()))
+
+
+def _package_dir(module: str) -> Optional[str]:
+    try:
+        # only the top level package, so that nothing is imported
+        spec = find_spec(module.partition(".")[0])
+    except (ImportError, ValueError):
+        return None
+    if spec is None:
+        return None
+    if spec.submodule_search_locations:
+        return list(spec.submodule_search_locations)[0]
+    return spec.origin
+
+
+def plugin_paths() -> Dict[str, str]:
+    """Return a mapping of package directories to napari or plugin name."""
+    paths: Dict[str, str] = {}
+    if path := _package_dir(NAPARI):
+        paths[path] = NAPARI
+    for ep in _entry_points():
+        dist = getattr(ep, "dist", None)  # python 3.10+
+        name = dist.name if dist is not None else ep.name
+        if path := _package_dir(ep.value.partition(":")[0]):
+            paths.setdefault(path, name)
+    return paths
+
+
+class PluginIndex:
+    """Find the napari plugin (or napari) that a file belongs to.
+
+    Parameters
+    ----------
+    paths : Dict[str, str]
+        Mapping of package directories (or module files) to names.
+    """
+
+    def __init__(self, paths: Dict[str, str]) -> None:
+        self.paths = dict(paths)
+        names = []
+        alternatives = []
+        # longest first, so that nested packages win over their parents
+        for i, (path, name) in enumerate(
+            sorted(self.paths.items(), key=lambda x: -len(x[0]))
+        ):
+            names.append(name)
+            sep = re.escape(os.sep)
+            alternatives.append(f"(?P<p{i}>{re.escape(path)}(?:{sep}|$))")
+        self._names = names
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        self._regex = (
+            re.compile("|".join(alternatives), flags) if alternatives else None
+        )
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def lookup(self, path: Optional[str]) -> Optional[str]:
+        """Return the name for the file at `path`, or None."""
+        if not path or self._regex is None:
+            return None
+        try:
+            return self._cache[path]
+        except KeyError:
+            pass
+        match = self._regex.match(path)
+        name = self._names[int(match.lastgroup[1:])] if match else None  # type: ignore
+        if len(self._cache) < 4096:
+            self._cache[path] = name
+        return name
+
+
+def _stacktrace_frames(event: Dict[str, Any]) -> Iterator[List[dict]]:
+    for key in ("exception", "threads"):
+        for value in (event.get(key) or {}).get("values") or ():
+            if frames := (value.get("stacktrace") or {}).get("frames"):
+                yield frames
+
+
+class PluginClassifier:
+    """Event processor setting ``in_app`` and a ``plugin`` tag from a `PluginIndex`.
+
+    Must run before `abs_path` is removed from frames (i.e. before `before_send`).
+
+    Parameters
+    ----------
+    index : PluginIndex, optional
+        By default, built (on first use) from `plugin_paths`, cached in
+        `_util.ENV_CACHE`.
+    """
+
+    def __init__(self, index: Optional[PluginIndex] = None) -> None:
+        self._index = index
+
+    @property
+    def index(self) -> PluginIndex:
+        if self._index is None:
+            from ._util import ENV_CACHE
+
+            self._index = PluginIndex(ENV_CACHE.get("plugin_paths", plugin_paths))
+        return self._index
+
+    def __call__(
+        self, event: Dict[str, Any], hint: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        index = self.index
+        plugin = None
+        for frames in _stacktrace_frames(event):
+            names = [index.lookup(f.get("abs_path")) for f in frames]
+            if not any(names):
+                continue
+            for frame, name in zip(frames, names):
+                frame["in_app"] = name is not None
+                if name is not None and name != NAPARI:
+                    plugin = name  # the innermost plugin frame of the last exception
+        if plugin is not None:
+            # (a tag set by a plugin's own reporter, see `get_reporter`, wins)
+            event.setdefault("tags", {}).setdefault("plugin", plugin)
+        return event
@@ -0,0 +1,132 @@
+"""Capture API for plugins, with per-plugin sampling and quotas.
+
+`get_reporter` returns a `PluginReporter` that tags events with the plugin's
+name and drops events beyond the plugin's sample rate and quota before any
+work is done on them, so that one noisy plugin can't use up the shared client,
+capture queue and transport.
+"""
+import os
+import random
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+from ._dedup import TokenBucket
+from ._metrics import METRICS
+from ._sampling import parse_rates
+
+# per-plugin fraction of events sent, e.g. "napari-foo=0.1,napari-bar=0"
+PLUGIN_SAMPLE_RATES = os.getenv("NAPARI_TELEMETRY_PLUGIN_SAMPLE_RATES", "")
+# events per minute (and burst size) allowed for each plugin
+PLUGIN_RATE = float(os.getenv("NAPARI_TELEMETRY_PLUGIN_RATE", "5"))
+PLUGIN_BURST = float(os.getenv("NAPARI_TELEMETRY_PLUGIN_BURST", "10"))
+
+
+class PluginReporter:
+    """Report errors on behalf of `plugin` (use `get_reporter` to get one).
+
+    Parameters
+    ----------
+    plugin : str
+        Name of the plugin, set as the ``plugin`` tag of its events.
+    sample_rate : float, optional
+        Fraction (0-1) of events that are sent.  By default, the rate for
+        `plugin` in ``NAPARI_TELEMETRY_PLUGIN_SAMPLE_RATES``, or 1.
+    rate, burst : float
+        Events per minute, and burst size, allowed for this plugin.
+    hub : sentry_sdk.Hub, optional
+        Hub used to capture events.  By default, `sentry_sdk.Hub.main`.
+    """
+
+    def __init__(
+        self,
+        plugin: str,
+        sample_rate: Optional[float] = None,
+        rate: float = PLUGIN_RATE,
+        burst: float = PLUGIN_BURST,
+        hub: Any = None,
+    ) -> None:
+        if sample_rate is None:
+            sample_rate = parse_rates(PLUGIN_SAMPLE_RATES).get(plugin, 1.0)
+        self.plugin = plugin
+        self.sample_rate = sample_rate
+        self.hub = hub
+        self.dropped = 0
+        self._bucket = TokenBucket(rate, burst)
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} for {self.plugin!r}>"
+
+    def _hub(self) -> Any:
+        import sentry_sdk
+
+        return self.hub or sentry_sdk.Hub.main
+
+    def _admit(self) -> bool:
+        """Return True if an event may be sent (and count it against the quota)."""
+        if self._hub().client is None:
+            return False
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            METRICS.incr("plugin.sampled_out")
+        else:
+            with self._lock:
+                if self._bucket.take():
+                    return True
+            METRICS.incr("plugin.over_quota")
+        with self._lock:
+            self.dropped += 1
+        return False
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        return {"plugin": self.plugin}
+
+    def capture_exception(self, error: Optional[BaseException] = None) -> None:
+        """Capture `error` (or the exception being handled).
+
+        Like uncaught exceptions, the event is built on a background thread (see
+        `DeferredCapture`, unless ``NAPARI_TELEMETRY_DEFERRED_CAPTURE=0``), so this
+        does not block and returns no event id.
+        """
+        if error is None and sys.exc_info()[1] is None:
+            return
+        if not self._admit():
+            return
+        from ._deferred import DEFERRED, DEFERRED_CAPTURE
+
+        if DEFERRED_CAPTURE and self.hub is None:
+            DEFERRED.capture(error or sys.exc_info()[1], tags=self.tags)
+        else:
+            self._hub().capture_exception(error, tags=self.tags)
+
+    def capture_message(self, message: str, level: Optional[str] = None) -> None:
+        """Capture `message` (at `level`, by default "info")."""
+        if self._admit():
+            self._hub().capture_message(message, level, tags=self.tags)
+
+
+_REPORTERS: Dict[str, PluginReporter] = {}
+_LOCK = threading.Lock()
+
+
+def get_reporter(plugin: str) -> PluginReporter:
+    """Return the reporter for `plugin`.
+
+    Events captured with it are tagged with the plugin name, and are subject to
+    the plugin's sample rate (``NAPARI_TELEMETRY_PLUGIN_SAMPLE_RATES``) and quota
+    (``NAPARI_TELEMETRY_PLUGIN_RATE`` events per minute).  Nothing is sent unless
+    the user opted in and `install_error_reporter` has been called.
+
+    Examples
+    --------
+    >>> reporter = get_reporter("napari-my-plugin")
+    >>> try:
+    ...     read_my_format(path)
+    ... except Exception:
+    ...     reporter.capture_exception()
+    """
+    with _LOCK:
+        if plugin not in _REPORTERS:
+            _REPORTERS[plugin] = PluginReporter(plugin)
+        return _REPORTERS[plugin]
@@ -0,0 +1,110 @@
+"""Trace sampling with per-operation rates and an adaptive volume budget."""
+import os
+import threading
+import time
+import warnings
+from typing import Any, Dict, Mapping, Optional
+
+# base fraction of transactions that are sent
+TRACES_SAMPLE_RATE = float(os.getenv("NAPARI_TELEMETRY_TRACES_SAMPLE_RATE", "1.0"))
+# per-operation overrides, e.g. "qt.paint=0.01,napari.slice=0.5"
+TRACES_OP_RATES = os.getenv("NAPARI_TELEMETRY_TRACES_OP_RATES", "")
+# maximum number of transactions per minute to send (0 disables the budget)
+TRACES_PER_MINUTE = float(os.getenv("NAPARI_TELEMETRY_TRACES_PER_MINUTE", "30"))
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    """Parse a string of comma-separated ``op=rate`` pairs into a dict.
+
+    Entries whose rate isn't a number are skipped with a warning (these strings
+    come from environment variables, read at import).
+    """
+    rates = {}
+    for item in spec.split(","):
+        op, sep, rate = item.rpartition("=")
+        if sep and op.strip():
+            try:
+                rates[op.strip()] = float(rate)
+            except ValueError:
+                warnings.warn(f"Ignoring invalid sample rate {item.strip()!r}")
+    return rates
+
+
+class TracesSampler:
+    """A `traces_sampler` for sentry, with per-operation rates.
+
+    Parameters
+    ----------
+    rate : float
+        Fraction (0-1) of transactions to sample, for ops not in `op_rates`.
+    op_rates : Mapping[str, float], optional
+        Sample rates for specific transaction ops (or names).
+    per_minute : float
+        Adaptive budget: if the expected number of sampled transactions per minute
+        exceeds this, rates are lowered proportionally. 0 disables the budget.
+    """
+
+    def __init__(
+        self,
+        rate: float = TRACES_SAMPLE_RATE,
+        op_rates: Optional[Mapping[str, float]] = None,
+        per_minute: float = TRACES_PER_MINUTE,
+    ) -> None:
+        self.rate = rate
+        self.op_rates = dict(
+            parse_rates(TRACES_OP_RATES) if op_rates is None else op_rates
+        )
+        self.per_minute = per_minute
+        self._lock = threading.Lock()
+        self._minute = 0
+        self._count = 0  # transactions seen in the current minute
+        self._previous = 0  # transactions seen in the previous minute
+
+    @classmethod
+    def from_settings(cls, settings: Mapping[str, Any]) -> "TracesSampler":
+        """Create sampler from a `SettingsDict`, overridden by environment vars."""
+        env = os.environ
+        rate = settings.get("traces_sample_rate", TRACES_SAMPLE_RATE)
+        op_rates = dict(settings.get("traces_op_rates") or {})
+        per_minute = settings.get("traces_per_minute", TRACES_PER_MINUTE)
+        if "NAPARI_TELEMETRY_TRACES_SAMPLE_RATE" in env:
+            rate = TRACES_SAMPLE_RATE
+        op_rates.update(parse_rates(TRACES_OP_RATES))
+        if "NAPARI_TELEMETRY_TRACES_PER_MINUTE" in env:
+            per_minute = TRACES_PER_MINUTE
+        return cls(rate, op_rates, per_minute)
+
+    def volume(self, now: Optional[float] = None) -> float:
+        """Return estimated number of transactions started per minute."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._roll(now)
+            # sliding window: weight the previous minute by the part still in view
+            return self._count + self._previous * (1 - (now / 60) % 1)
+
+    def _roll(self, now: float) -> None:
+        minute = int(now // 60)
+        if minute != self._minute:
+            self._previous = self._count if minute == self._minute + 1 else 0
+            self._count = 0
+            self._minute = minute
+
+    def __call__(self, sampling_context: Dict[str, Any]) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._roll(now)
+            self._count += 1
+
+        # respect the sampling decision of a parent transaction
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+
+        ctx = sampling_context.get("transaction_context") or {}
+        op, name = ctx.get("op") or "", ctx.get("name") or ""
+        rate = self.op_rates.get(op, self.op_rates.get(name, self.rate))
+        if self.per_minute > 0:
+            volume = self.volume(now)
+            if volume * rate > self.per_minute:
+                rate = self.per_minute / volume
+        return rate
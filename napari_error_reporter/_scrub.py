@@ -0,0 +1,228 @@
+"""Single-pass scrubbing of local paths, user and host names from events.
+
+All rules are compiled into one regular expression (one alternative per rule), and
+`Scrubber` walks the event exactly once, so the cost stays proportional to the size
+of the event regardless of the number of rules.  (Rules with groups, which could
+refer to them by number, are applied separately.)  Strings that were already
+scrubbed (file names, repeated locals...) are looked up in a cache.
+
+User and host names are only replaced as whole words in free text (messages,
+exception values, locals...).  In code (`CODE_KEYS`: modules, functions, source
+lines, fingerprints, tags...) they are only replaced as components of paths, so
+that a user called "napari" doesn't turn ``napari.utils`` into ``<user>.utils``.
+"""
+import getpass
+import json
+import os
+import re
+import socket
+import sys
+import warnings
+from contextlib import suppress
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Rule = Tuple[str, str]  # (pattern, replacement)
+
+
+def parse_patterns(spec: str) -> List[str]:
+    """Parse a JSON list of regexes, or a single regex.
+
+    Invalid regexes are skipped with a warning.
+    """
+    if not spec.strip():
+        return []
+    patterns = [spec]
+    with suppress(ValueError):
+        loaded = json.loads(spec)
+        if isinstance(loaded, list):
+            patterns = [str(p) for p in loaded]
+    valid = []
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            warnings.warn(f"Ignoring invalid scrub pattern {pattern!r}: {e}")
+        else:
+            valid.append(pattern)
+    return valid
+
+
+# extra regular expressions to redact: a single pattern, or a JSON list of them
+SCRUB_PATTERNS = parse_patterns(os.getenv("NAPARI_TELEMETRY_SCRUB_PATTERNS", ""))
+# maximum number of scrubbed strings that are remembered
+SCRUB_CACHE_SIZE = 4096
+# user and host names shorter than this are too likely to match ordinary words
+MIN_NAME_LENGTH = 3
+# keys that are removed wherever they appear in the event
+DROP_KEYS = frozenset({"abs_path"})
+# top level event keys that never contain user data (and may be large)
+SKIP_KEYS = frozenset({"event_id", "timestamp", "release", "sdk", "modules"})
+# keys whose values are code (identifiers, source lines...) rather than free text
+CODE_KEYS = frozenset(
+    {
+        "module",
+        "function",
+        "filename",
+        "context_line",
+        "pre_context",
+        "post_context",
+        "type",
+        "fingerprint",
+        "tags",
+    }
+)
+
+
+def default_rules() -> List[Rule]:
+    """Return rules for the home directory and the user name in paths.
+
+    User-configured patterns (`SCRUB_PATTERNS`) are included.  See `name_rules`
+    for the rules applied to free text only.
+    """
+    rules: List[Rule] = []
+    home = os.path.expanduser("~")
+    if len(home) > 1:  # i.e. not "/" or "~"
+        variants = {home, home.replace("\\", "/")}
+        # "/home/me/x" -> "~/x", but leave "/home/me2" alone
+        pattern = "|".join(re.escape(v) for v in sorted(variants, key=len)[::-1])
+        rules.append((rf"(?:{pattern})(?!\w)", "~"))
+    with suppress(Exception):
+        user = getpass.getuser()
+        if len(user) >= MIN_NAME_LENGTH:
+            # a whole path component, e.g. "/data/me/x" -> "/data/<user>/x"
+            rules.append((rf"(?<=[/\\]){re.escape(user)}(?=[/\\])", "<user>"))
+    rules.extend((p, "<redacted>") for p in SCRUB_PATTERNS)
+    return rules
+
+
+def name_rules(hide_hostname: bool = True) -> List[Rule]:
+    """Return rules for the user name and (optionally) host name as whole words."""
+    rules: List[Rule] = []
+    with suppress(Exception):
+        user = getpass.getuser()
+        if len(user) >= MIN_NAME_LENGTH:
+            rules.append((rf"\b{re.escape(user)}\b", "<user>"))
+    if hide_hostname:
+        with suppress(Exception):
+            host = socket.gethostname()
+            if len(host) >= MIN_NAME_LENGTH:
+                rules.append((rf"\b{re.escape(host)}\b", "<hostname>"))
+    return rules
+
+
+def _mergeable(pattern: str, flags: int) -> bool:
+    """Return True if `pattern` means the same as an alternative of a larger regex.
+
+    That's not the case if it has groups (its backreferences would be renumbered)
+    or flags that must start the whole regex.
+    """
+    try:
+        return re.compile(f"(?P<r>{pattern})", flags).groups == 1
+    except re.error:
+        return False
+
+
+class _Pass:
+    """One regular expression for several rules, with a cache of results."""
+
+    def __init__(self, rules: Sequence[Rule], flags: int) -> None:
+        self.replacements: Dict[str, str] = {}
+        # rules that can't be merged, applied one by one after the others
+        self.separate: List[Tuple["re.Pattern[str]", str]] = []
+        alternatives = []
+        for i, (pattern, replacement) in enumerate(rules):
+            regex = re.compile(pattern, flags)  # raise early, naming the bad pattern
+            if not _mergeable(pattern, flags):
+                self.separate.append((regex, replacement.replace("\\", r"\\")))
+                continue
+            self.replacements[f"r{i}"] = replacement
+            alternatives.append(f"(?P<r{i}>{pattern})")
+        self.regex: Optional["re.Pattern[str]"] = (
+            re.compile("|".join(alternatives), flags) if alternatives else None
+        )
+        self.cache: Dict[str, str] = {}
+
+    def _replace(self, match: "re.Match[str]") -> str:
+        return self.replacements[match.lastgroup or ""]
+
+    def __call__(self, value: str) -> str:
+        if self.regex is None and not self.separate:
+            return value
+        try:
+            return self.cache[value]
+        except KeyError:
+            pass
+        if len(self.cache) >= SCRUB_CACHE_SIZE:
+            self.cache.clear()
+        out = value
+        if self.regex is not None:
+            out = self.regex.sub(self._replace, out)
+        for regex, replacement in self.separate:
+            out = regex.sub(replacement, out)
+        self.cache[value] = out
+        return out
+
+
+class Scrubber:
+    """Replace matches of `rules` in every string of an event, in a single pass.
+
+    Parameters
+    ----------
+    rules : Sequence[Tuple[str, str]]
+        ``(pattern, replacement)`` pairs.  Where several rules match at the same
+        position, the first one wins (rules with groups are applied last).
+    ignore_case : bool
+        Match case-insensitively (e.g. for paths on Windows).
+    text_rules : Sequence[Tuple[str, str]]
+        Rules applied (after `rules`) only to free text, not to the values of
+        `CODE_KEYS`.
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[Rule],
+        ignore_case: bool = False,
+        text_rules: Sequence[Rule] = (),
+    ) -> None:
+        flags = re.IGNORECASE if ignore_case else 0
+        self._text = _Pass([*rules, *text_rules], flags)
+        self._code = _Pass(rules, flags) if text_rules else self._text
+
+    def scrub_string(self, value: str, code: bool = False) -> str:
+        """Return `value` with all rules (if `code`, only `rules`) applied."""
+        return (self._code if code else self._text)(value)
+
+    def scrub(self, obj: Any, code: bool = False) -> Any:
+        """Scrub all strings in `obj` (nested dicts and lists are modified in place).
+
+        Keys in `DROP_KEYS` are removed from all dicts, and values of `CODE_KEYS`
+        are scrubbed as code.
+        """
+        if isinstance(obj, str):
+            return self.scrub_string(obj, code)
+        if isinstance(obj, dict):
+            for key in DROP_KEYS.intersection(obj):
+                del obj[key]
+            for key, value in obj.items():
+                if isinstance(value, (str, dict, list)):
+                    obj[key] = self.scrub(value, code or key in CODE_KEYS)
+        elif isinstance(obj, list):
+            for i, value in enumerate(obj):
+                if isinstance(value, (str, dict, list)):
+                    obj[i] = self.scrub(value, code)
+        return obj
+
+    def __call__(self, event: Dict[str, Any], hint: Any = None) -> Dict[str, Any]:
+        for key, value in event.items():
+            if key not in SKIP_KEYS and isinstance(value, (str, dict, list)):
+                event[key] = self.scrub(value, key in CODE_KEYS)
+        return event
+
+
+def default_scrubber(hide_hostname: bool = True) -> Scrubber:
+    """Return a `Scrubber` with `default_rules`, and `name_rules` for free text."""
+    return Scrubber(
+        default_rules(),
+        ignore_case=sys.platform == "win32",
+        text_rules=name_rules(hide_hostname),
+    )
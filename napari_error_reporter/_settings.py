@@ -0,0 +1,209 @@
+"""Settings file shared safely between concurrent napari processes.
+
+Many napari processes (e.g. batch workers) may start at once and all read, and
+possibly write, the same settings file.  `SettingsStore` reads it at most once per
+change (cached by mtime), writes it atomically (write to a temporary file, then
+rename) while holding a lock file, and coalesces bursts of writes into one.
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import weakref
+from contextlib import contextmanager, suppress
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, Mapping, Optional, Tuple
+
+# seconds to wait for more changes before settings are written to disk
+SAVE_DELAY = float(os.getenv("NAPARI_TELEMETRY_SETTINGS_SAVE_DELAY", "0.5"))
+
+# stores whose pending changes are written at exit (held weakly, see _flush_all)
+_LIVE_STORES: "weakref.WeakSet[SettingsStore]" = weakref.WeakSet()
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive (inter-process) lock on `path` (created if needed)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as fh:
+        if sys.platform == "win32":
+            import msvcrt
+
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10 seconds
+                    continue
+            try:
+                yield
+            finally:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def try_lock(path: Path) -> Optional[IO[bytes]]:
+    """Lock `path` (created if needed) without waiting.
+
+    Return an open handle that holds an exclusive (inter-process) lock on `path`
+    until it is closed (or the process exits), or None if the lock is taken.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fh = open(path, "a+b")
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
+
+
+def _copy(settings: Mapping[str, Any]) -> Dict[str, Any]:
+    # callers may mutate what they get, so never hand out cached containers
+    out = dict(settings)
+    for key, value in out.items():
+        if isinstance(value, (set, dict, list)):
+            out[key] = type(value)(value)
+    return out
+
+
+def _decode(data: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        data["date"] = datetime.fromisoformat(data["date"])
+    except Exception:  # pragma: no cover
+        data["date"] = datetime.now()
+    if "admins" in data:
+        data["admins"] = set(data["admins"])
+    return data
+
+
+def _encode(settings: Mapping[str, Any]) -> Dict[str, Any]:
+    data = dict(settings)
+    data["admins"] = sorted(settings.get("admins") or ())
+    if isinstance(settings.get("date"), datetime):
+        data["date"] = settings["date"].isoformat()
+    return data
+
+
+class SettingsStore:
+    """Cached, atomically written JSON settings file.
+
+    Parameters
+    ----------
+    path : Path
+        The settings file.
+    defaults : Mapping[str, Any]
+        Values used for keys missing from the file (or if it can't be read).
+    delay : float
+        Seconds that `save` waits for further changes before writing.  Pending
+        changes are also written at exit (unless the store was closed), or with
+        `flush`.
+    """
+
+    def __init__(
+        self, path: Path, defaults: Mapping[str, Any], delay: float = SAVE_DELAY
+    ) -> None:
+        self.path = Path(path)
+        self.defaults = _copy(defaults)
+        self.delay = delay
+        self._lock = threading.RLock()
+        self._cache: Optional[Dict[str, Any]] = None
+        self._stamp: Optional[Tuple[int, int]] = None  # (mtime_ns, size) of _cache
+        self._pending: Optional[Dict[str, Any]] = None
+        self._timer: Optional[threading.Timer] = None
+        _LIVE_STORES.add(self)
+
+    @property
+    def lock_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".lock")
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self) -> Dict[str, Any]:
+        """Return settings on disk, re-reading the file only if it changed."""
+        stamp = self._stat()
+        if self._cache is None or stamp != self._stamp:
+            data: Dict[str, Any] = {}
+            if stamp is not None:
+                try:
+                    with open(self.path) as fh:
+                        data = _decode(json.load(fh))
+                except (OSError, ValueError, TypeError):
+                    # unreadable or corrupt: use defaults, and leave the file for
+                    # the next save to replace (another process may be mid-write)
+                    data = {}
+            self._cache = {**_copy(self.defaults), **data}
+            self._stamp = stamp
+        return self._cache
+
+    def load(self) -> Dict[str, Any]:
+        """Return the current settings (including any changes not yet written)."""
+        with self._lock:
+            return _copy(self._pending or self._read())
+
+    def save(self, settings: Mapping[str, Any], delay: Optional[float] = None) -> None:
+        """Save `settings`, writing them to disk after `delay` seconds."""
+        delay = self.delay if delay is None else delay
+        with self._lock:
+            self._pending = _copy(settings)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if delay <= 0:
+                self.flush()
+                return
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Write pending changes to disk now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, None
+            if pending is None:
+                return
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with suppress(OSError), file_lock(self.lock_path):
+                with open(tmp, "w") as fh:
+                    json.dump(_encode(pending), fh)
+                os.replace(tmp, self.path)
+                self._cache, self._stamp = pending, self._stat()
+
+    def close(self) -> None:
+        """Write pending changes now, and no longer at exit."""
+        self.flush()
+        _LIVE_STORES.discard(self)
+
+
+@atexit.register
+def _flush_all() -> None:
+    # one exit handler for all stores, instead of one per store keeping it alive
+    for store in list(_LIVE_STORES):
+        store.flush()
@@ -0,0 +1,78 @@
+"""Flush pending reports at exit, within a fixed time budget.
+
+Every event is on disk (see `_transport.Spool`) once it reaches the transport, so
+nothing needs to wait for the network at exit: `ExitHandler` gives the steps that
+get events to the transport (and the upload itself) a shared budget of
+``NAPARI_TELEMETRY_SHUTDOWN_BUDGET_MS``, and whatever hasn't been uploaded by
+then is sent by the next session.
+"""
+import atexit
+import os
+import threading
+import time
+from typing import Any, Callable, List, Tuple
+
+from ._metrics import METRICS
+
+# milliseconds that exiting napari may be delayed by error reporting
+SHUTDOWN_BUDGET_MS = float(os.getenv("NAPARI_TELEMETRY_SHUTDOWN_BUDGET_MS", "500"))
+
+Step = Callable[[float], Any]
+
+
+class ExitHandler:
+    """Run exit-time steps, in order, at most once, within `budget_ms`.
+
+    Each step is called with the number of seconds left in the budget (possibly
+    0), and should return by then.  Steps are run at interpreter exit, or when
+    the ``QApplication`` is about to quit (see `install`), whichever comes first.
+    """
+
+    def __init__(self, budget_ms: float = SHUTDOWN_BUDGET_MS) -> None:
+        self.budget_ms = budget_ms
+        self._steps: List[Tuple[str, Step]] = []
+        self._done = False
+        self._lock = threading.Lock()
+
+    def add(self, name: str, step: Step) -> None:
+        """Add `step` (timed as ``shutdown.<name>`` in `METRICS`)."""
+        self._steps.append((name, step))
+
+    def __call__(self) -> None:
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+
+        deadline = time.monotonic() + self.budget_ms / 1000
+        with METRICS.timed("shutdown"):
+            for name, step in self._steps:
+                try:
+                    with METRICS.timed(f"shutdown.{name}"):
+                        step(max(deadline - time.monotonic(), 0))
+                except Exception:  # pragma: no cover
+                    METRICS.incr("shutdown.failed")
+
+    def install(self) -> None:
+        """Run at interpreter exit, and on ``aboutToQuit`` if Qt is in use."""
+        atexit.register(self)
+
+        from ._headless import qt_loaded
+
+        if qt_loaded():
+            from qtpy.QtWidgets import QApplication
+
+            if (app := QApplication.instance()) is not None:
+                app.aboutToQuit.connect(self)
+
+
+def flush_transport(transport: Any, timeout: float) -> int:
+    """Upload what `transport` can within `timeout` seconds.
+
+    Return (and count in ``shutdown.spooled``) the number of envelopes left on
+    disk for the next session.
+    """
+    transport.flush(timeout)
+    if pending := transport.pending():
+        METRICS.incr("shutdown.spooled", pending)
+    return pending
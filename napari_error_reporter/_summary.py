@@ -0,0 +1,232 @@
+"""Aggregate events per session, and send them as periodic summaries.
+
+With ``NAPARI_TELEMETRY_SUMMARY_INTERVAL`` set (in seconds), `install_error_reporter`
+uses a `SessionSummary` instead of the `Deduplicator`: captured events are only
+counted (by fingerprint) in memory, and every interval (and at exit) the first
+occurrence of each new error is sent, annotated with its count, followed by a
+single summary event with the counts of errors that were already sent.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from ._dedup import BYPASS_HINT, _title, fingerprint
+from ._intern import StringTable, decode_stacktraces, encode_stacktraces
+from ._metrics import METRICS
+
+# seconds between summaries (0: send each event as it is captured)
+SUMMARY_INTERVAL = float(os.getenv("NAPARI_TELEMETRY_SUMMARY_INTERVAL", "0"))
+# number of new errors waiting to be sent after which a summary is sent early
+SUMMARY_MAX_PENDING = 100
+# number of fingerprints counted (the least recently seen are forgotten)
+SUMMARY_MAX_ENTRIES = 1000
+
+COUNT_KEY = "napari_error_reporter.count"
+SUMMARY_KEY = "napari_error_reporter.summary"
+DROPPED_KEY = "napari_error_reporter.dropped"
+
+
+class _Entry:
+    __slots__ = ("title", "first", "last", "count", "sent_count", "exemplar")
+
+    def __init__(self, title: str, now: float, exemplar: Dict[str, Any]) -> None:
+        self.title = title
+        self.first = now
+        self.last = now
+        self.count = 0
+        self.sent_count = 0
+        self.exemplar: Optional[Dict[str, Any]] = exemplar  # until it is sent
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.%fZ"
+    )
+
+
+class SessionSummary:
+    """`before_send` hook that counts events, and sends them in periodic summaries.
+
+    Events passed with ``hint={BYPASS_HINT: True}`` are passed through.  All
+    others are counted by `_dedup.fingerprint` and dropped; `flush` sends them.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between calls to `flush` (on a background thread, started with
+        the first event).
+    process : Callable[[dict, dict], Optional[dict]], optional
+        Hook applied to counted events before `flush` sends them, in place of the
+        `before_send` hooks after this one (e.g. `strip_sensitive_data`).
+    send : Callable[[dict], Any], optional
+        Called with the events sent by `flush`.  By default, counted events go
+        directly to the transport of the main hub's client, and summaries are
+        captured by the main hub.
+    max_pending : int
+        Number of new fingerprints after which `flush` is called early.
+    max_entries : int
+        Number of fingerprints counted.  Beyond that, the least recently seen is
+        forgotten, and the events counted for it but not yet sent are dropped
+        (their number is in the next summary, and in `dropped`).
+    """
+
+    def __init__(
+        self,
+        interval: float = SUMMARY_INTERVAL,
+        process: Optional[Callable[[dict, dict], Optional[dict]]] = None,
+        send: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        max_pending: int = SUMMARY_MAX_PENDING,
+        max_entries: int = SUMMARY_MAX_ENTRIES,
+    ) -> None:
+        self.interval = interval
+        self.process = process
+        self.send = send
+        self.max_pending = max_pending
+        self.max_entries = max_entries
+        self.dropped = 0
+        self._new_dropped = 0  # dropped since the last summary
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # strings of the exemplars waiting to be sent (reset by `pop_events`)
+        self._strings = StringTable()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __call__(
+        self, event: Dict[str, Any], hint: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        if hint.get(BYPASS_HINT):
+            return event
+
+        fp = fingerprint(event)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(fp)
+            if entry is None:
+                # (kept with interned frames until it is sent)
+                exemplar = encode_stacktraces(event, self._strings)
+                entry = self._entries[fp] = _Entry(_title(event), now, exemplar)
+                self._pending += 1
+                if self._pending >= self.max_pending:
+                    self._wake.set()
+                while len(self._entries) > self.max_entries:
+                    _, old = self._entries.popitem(last=False)
+                    if dropped := old.count - old.sent_count:
+                        self.dropped += dropped
+                        self._new_dropped += dropped
+                        METRICS.incr("summary.dropped", dropped)
+            else:
+                self._entries.move_to_end(fp)
+            entry.count += 1
+            entry.last = now
+        METRICS.incr("summary.aggregated")
+        self._ensure_thread()
+        return None
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None and self.interval > 0:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run,
+                        name="napari-error-reporter-summary",
+                        daemon=True,
+                    )
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self) -> None:
+        """Stop the background thread (without flushing)."""
+        self._stop.set()
+        self._wake.set()
+
+    def pop_events(self) -> List[Dict[str, Any]]:
+        """Return the events to send for everything counted since the last call.
+
+        These are the first occurrence of each new fingerprint (with its count,
+        first and last time seen in ``extra``), and a summary event with the new
+        counts of fingerprints sent before, if there are any.
+        """
+        out: List[Dict[str, Any]] = []
+        table: List[Dict[str, Any]] = []
+        with self._lock:
+            for fp, entry in self._entries.items():
+                new = entry.count - entry.sent_count
+                if not new:
+                    continue
+                entry.sent_count = entry.count
+                info = {
+                    "count": new,
+                    "first_seen": _isoformat(entry.first),
+                    "last_seen": _isoformat(entry.last),
+                }
+                if entry.exemplar is not None:
+                    event = decode_stacktraces(entry.exemplar, self._strings.strings)
+                    entry.exemplar = None
+                    event.setdefault("extra", {})[COUNT_KEY] = info
+                    out.append(event)
+                else:
+                    table.append({"fingerprint": fp, "title": entry.title, **info})
+            self._pending = 0
+            # all exemplars were decoded, so their strings aren't needed anymore
+            self._strings = StringTable()
+            dropped, self._new_dropped = self._new_dropped, 0
+
+        if table or dropped:
+            total = sum(row["count"] for row in table)
+            extra: Dict[str, Any] = {SUMMARY_KEY: table}
+            if dropped:
+                extra[DROPPED_KEY] = dropped
+            out.append(
+                {
+                    "message": f"Session summary: {total} repeated events",
+                    "level": "info",
+                    "fingerprint": ["session-summary"],
+                    "extra": extra,
+                }
+            )
+        return out
+
+    def flush(self) -> int:
+        """Send the events from `pop_events`.  Return the number sent."""
+        with self._flush_lock:
+            events = self.pop_events()
+            send = self.send or _send
+            n = 0
+            for event in events:
+                if self.process is not None and "event_id" in event:
+                    if (event := self.process(event, {})) is None:  # type: ignore
+                        continue
+                try:
+                    send(event)
+                    n += 1
+                except Exception:  # pragma: no cover
+                    METRICS.incr("summary.failed")
+            METRICS.incr("summary.sent", n)
+            return n
+
+
+def _send(event: Dict[str, Any]) -> None:
+    """Send `event` with the main hub's client.
+
+    Events that were already prepared by the client (in `__call__`) go directly
+    to its transport, new ones (summaries) are captured as usual.
+    """
+    import sentry_sdk
+
+    hub = sentry_sdk.Hub.main
+    if "event_id" not in event:
+        hub.capture_event(event, hint={BYPASS_HINT: True})  # type: ignore[arg-type]
+    elif hub.client is not None and hub.client.transport is not None:
+        hub.client.transport.capture_event(event)  # type: ignore[arg-type, misc]
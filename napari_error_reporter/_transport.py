@@ -0,0 +1,596 @@
+"""Sentry transport that spools events to disk and uploads them in the background.
+
+Events are appended to a bounded on-disk spool as soon as they are captured, and a
+daemon thread drains the spool in batches (backing off while the network or the
+ingest endpoint is unavailable).  Anything that could not be sent stays on disk and
+is uploaded by the next session.
+"""
+import gzip
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+from contextlib import suppress
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from sentry_sdk.consts import VERSION
+from sentry_sdk.envelope import Envelope
+from sentry_sdk.transport import Transport
+from sentry_sdk.utils import json_dumps, logger
+
+from ._intern import StringTable, decode_stacktraces, encode_stacktraces
+from ._locals import _frames_innermost_first
+from ._metrics import METRICS
+from ._settings import try_lock
+
+# maximum total size of the spool directory, new events are dropped beyond this.
+SPOOL_MAX_BYTES = int(os.getenv("NAPARI_TELEMETRY_SPOOL_MAX_BYTES", 10 * 1024**2))
+# size at which a new spool segment file is started
+SPOOL_SEGMENT_BYTES = 512 * 1024
+# number of envelopes read from the spool per upload batch
+UPLOAD_BATCH_SIZE = 20
+# seconds to wait for the ingest endpoint to respond
+UPLOAD_TIMEOUT = 10.0
+# bounds (seconds) for the exponential backoff after a failed upload
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 300.0
+# events larger than this (serialized) are trimmed by `trim_event`
+MAX_EVENT_BYTES = int(os.getenv("NAPARI_TELEMETRY_MAX_EVENT_BYTES", 200 * 1024))
+# number of frames kept at each end of a stacktrace, tried in order by `trim_event`
+KEEP_FRAMES = (50, 20, 5)
+# gzip level for spooled (and uploaded) envelopes
+COMPRESS_LEVEL = 6
+# whether to spool events with their frame strings interned (see `_intern`)
+INTERN_FRAMES = os.getenv("NAPARI_TELEMETRY_INTERN_FRAMES", "1") not in ("", "0")
+
+# record header: kind of record (1 byte) and payload length
+_HEADER = struct.Struct(">cI")
+ENVELOPE = b"E"
+GZIP_ENVELOPE = b"Z"
+# an event with interned frames (JSON, or gzipped JSON), see `Spool.append_event`
+INTERNED = b"I"
+GZIP_INTERNED = b"J"
+# strings added to the segment's string table (a JSON list)
+STRINGS = b"T"
+
+Record = Tuple[Path, int, bytes, bytes]  # (segment, end offset, kind, payload)
+
+
+class Spool:
+    """Bounded, append-only on-disk queue of records.
+
+    Records are appended to segment files in `directory`; each `Spool` instance
+    only appends to segments it created.  Consumed records are tracked with an
+    offset file per segment, and segments are deleted once fully consumed.
+
+    Several processes may share `directory`: each segment has a lock file, held
+    by the instance that created it (and, once that instance is closed or its
+    process exits, by the first instance that reads it), and only the holder
+    reads, consumes or deletes the segment.
+
+    Each segment has its own string table for events with interned frames (see
+    `append_event`), stored in `STRINGS` records just before the first record
+    that uses them, so that any later session can decode them.
+
+    Parameters
+    ----------
+    directory : Path
+        Directory that holds the segment files.
+    max_bytes : int
+        Maximum total size of all segments.  `append` returns False when a record
+        would exceed it.
+    segment_bytes : int
+        Size after which a new segment file is started.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = SPOOL_MAX_BYTES,
+        segment_bytes: int = SPOOL_SEGMENT_BYTES,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.RLock()
+        self._segment: Optional[Path] = None
+        self._own: Set[Path] = set()
+        # lock file handles of the segments this instance holds
+        self._claims: Dict[Path, IO[bytes]] = {}
+        self._closed = False
+        self._size: Optional[int] = None
+        # string tables of the segments being written, and being read (with the
+        # offset up to which STRINGS records have been read into it)
+        self._write_tables: Dict[Path, StringTable] = {}
+        self._read_tables: Dict[Path, Tuple[List[str], int]] = {}
+
+    def segments(self) -> List[Path]:
+        """Return all segment files in the spool, oldest first."""
+        return sorted(self.directory.glob("*.spool"))
+
+    def size(self) -> int:
+        """Return the (approximate) number of bytes currently spooled."""
+        with self._lock:
+            if self._size is None:
+                self._size = 0
+                for seg in self.segments():
+                    with suppress(OSError):
+                        self._size += seg.stat().st_size
+            return self._size
+
+    def append(self, payload: bytes, kind: bytes = ENVELOPE) -> bool:
+        """Append a record to the spool.  Return False if the spool is full."""
+        with self._lock:
+            if self.size() + _HEADER.size + len(payload) > self.max_bytes:
+                return False  # (without starting a segment)
+            with open(self._current_segment(), "ab") as fh:
+                return self._write(fh, [(kind, payload)])
+
+    def append_event(self, event: Dict[str, Any], compress: bool = True) -> int:
+        """Append `event` with its frames interned in the segment's string table.
+
+        `event` is modified (see `_intern.encode_stacktraces`).  Return the size
+        of the record, or 0 if the spool is full.  `read` returns the record with
+        kind `INTERNED` (or `GZIP_INTERNED`), use `decode_event` to decode it.
+        """
+        with self._lock:
+            seg = self._current_segment()
+            with open(seg, "ab") as fh:
+                if fh.tell() == 0:
+                    # a new segment (or one deleted and recreated since our last
+                    # write): none of its strings are in the file
+                    self._write_tables[seg] = StringTable()
+                table = self._write_tables[seg]
+                mark = len(table)
+                payload = json_dumps(encode_stacktraces(event, table))
+                kind = INTERNED
+                if compress:
+                    payload = gzip.compress(payload, COMPRESS_LEVEL)
+                    kind = GZIP_INTERNED
+                records = [(kind, payload)]
+                if len(table) > mark:
+                    records.insert(0, (STRINGS, json_dumps(table.strings[mark:])))
+                if not self._write(fh, records):
+                    table.truncate(mark)
+                    return 0
+        return len(payload)
+
+    def decode_event(self, segment: Path, kind: bytes, payload: bytes) -> dict:
+        """Return the event in an `INTERNED` record read from `segment`."""
+        if kind == GZIP_INTERNED:
+            payload = gzip.decompress(payload)
+        with self._lock:
+            strings = self._read_tables[segment][0]
+        return decode_stacktraces(json.loads(payload), strings)
+
+    def _current_segment(self) -> Path:
+        seg = self._segment
+        if seg is None or not seg.exists() or _size(seg) >= self.segment_bytes:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            name = f"{time.time_ns():020d}-{os.getpid()}-{len(self._own)}.spool"
+            seg = self._segment = self.directory / name
+            self._own.add(seg)
+            # (locked before the segment exists, so no other process reads it)
+            if (fh := try_lock(_lock_file(seg))) is not None:
+                self._claims[seg] = fh
+        return seg
+
+    def _claim(self, segment: Path) -> bool:
+        """Return True if this instance holds `segment` (trying to take it)."""
+        if segment in self._claims:
+            return True
+        if self._closed:
+            return False
+        try:
+            fh = try_lock(_lock_file(segment))
+        except OSError:
+            fh = None
+        if fh is None:
+            return False  # (another instance is writing or reading it)
+        if not segment.exists():  # consumed while we were taking the lock
+            fh.close()
+            with suppress(OSError):
+                _lock_file(segment).unlink()
+            return False
+        self._claims[segment] = fh
+        return True
+
+    def _release(self, segment: Path) -> None:
+        if (fh := self._claims.pop(segment, None)) is not None:
+            fh.close()
+
+    def close(self) -> None:
+        """Release all segments, for other instances (and processes) to send.
+
+        Records can still be appended (to a new segment), but `read` returns
+        nothing.
+        """
+        with self._lock:
+            self._closed = True
+            self._segment = None
+            for seg in list(self._claims):
+                self._release(seg)
+
+    def _write(self, fh: IO[bytes], records: List[Tuple[bytes, bytes]]) -> bool:
+        data = b"".join(_HEADER.pack(k, len(p)) + p for k, p in records)
+        if self.size() + len(data) > self.max_bytes:
+            return False
+        fh.write(data)
+        self._size = self.size() + len(data)
+        return True
+
+    def owns(self, segment: Path) -> bool:
+        """Return True if `segment` was created by this instance."""
+        return segment in self._own
+
+    def read(self, limit: int = UPLOAD_BATCH_SIZE) -> List[Record]:
+        """Return up to `limit` unconsumed records, oldest first.
+
+        Only segments held by this instance are read (see `Spool`).  `STRINGS`
+        records aren't returned, they are read into the segment's string table
+        (for `decode_event`).
+        """
+        out: List[Record] = []
+        with self._lock:
+            if self._closed:
+                return out
+            for seg in self.segments():
+                if not self._claim(seg):
+                    continue
+                offset = _read_offset(seg)
+                with suppress(OSError), open(seg, "rb") as fh:
+                    strings, read_to = self._read_tables.get(seg) or ([], 0)
+                    # strings of records consumed before this instance's first read
+                    fh.seek(read_to)
+                    while read_to < offset and (record := _read_record(fh)):
+                        kind, payload = record
+                        if kind == STRINGS:
+                            strings.extend(json.loads(payload))
+                        read_to = fh.tell()
+                    self._read_tables[seg] = (strings, read_to)
+
+                    fh.seek(offset)
+                    while len(out) < limit and (record := _read_record(fh)):
+                        kind, payload = record
+                        offset = fh.tell()
+                        if kind != STRINGS:
+                            out.append((seg, offset, kind, payload))
+                        elif offset > read_to:
+                            strings.extend(json.loads(payload))
+                        if offset > read_to:
+                            self._read_tables[seg] = (strings, offset)
+                            read_to = offset
+                if len(out) >= limit:
+                    break
+        return out
+
+    def consume(self, segment: Path, offset: int) -> None:
+        """Mark records in `segment` up to `offset` as consumed.
+
+        Does nothing if this instance doesn't hold `segment` (anymore).
+        """
+        with self._lock:
+            if segment not in self._claims:
+                return
+            size = _size(segment)
+            if offset >= size and segment != self._segment:
+                with suppress(OSError):
+                    segment.unlink()
+                    self._size = max(self.size() - size, 0)
+                with suppress(OSError):
+                    _offset_file(segment).unlink()
+                self._release(segment)
+                with suppress(OSError):
+                    _lock_file(segment).unlink()
+                self._own.discard(segment)
+                self._write_tables.pop(segment, None)
+                self._read_tables.pop(segment, None)
+            else:
+                _offset_file(segment).write_text(str(offset))
+
+
+def _read_record(fh: Any) -> Optional[Tuple[bytes, bytes]]:
+    """Read the record at the current position of `fh`, None if there is none."""
+    header = fh.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    kind, length = _HEADER.unpack(header)
+    payload = fh.read(length)
+    if len(payload) < length:
+        return None  # partially written record
+    return kind, payload
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _offset_file(segment: Path) -> Path:
+    return segment.with_suffix(".offset")
+
+
+def _lock_file(segment: Path) -> Path:
+    return segment.with_suffix(".lock")
+
+
+def _read_offset(segment: Path) -> int:
+    try:
+        return int(_offset_file(segment).read_text())
+    except (OSError, ValueError):
+        return 0
+
+
+def _json_size(obj: Any) -> int:
+    return len(json_dumps(obj))
+
+
+def _stacktraces(event: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out = []
+    for key in ("exception", "threads"):
+        for value in (event.get(key) or {}).get("values") or ():
+            if (value.get("stacktrace") or {}).get("frames"):
+                out.append(value["stacktrace"])
+    return out
+
+
+def trim_event(event: Dict[str, Any], max_bytes: int = MAX_EVENT_BYTES) -> int:
+    """Trim `event` (in place) until its serialized size is below `max_bytes`.
+
+    Removes, in order and only as far as needed: frame locals (outermost frames
+    first), frames in the middle of long stacktraces (recorded in
+    ``frames_omitted``), and the oldest breadcrumbs.  Returns the final size.
+    """
+    size = _json_size(event)
+    if size <= max_bytes:
+        return size
+
+    frames = [f for f in _frames_innermost_first(event) if "vars" in f]
+    for frame in reversed(frames):
+        size -= _json_size(frame.pop("vars"))  # (an estimate, re-measured below)
+        if size <= max_bytes:
+            return _json_size(event)
+
+    for keep in KEEP_FRAMES:
+        for stacktrace in _stacktraces(event):
+            frames = stacktrace["frames"]
+            if len(frames) > 2 * keep:
+                # frames_omitted: [start, end) indices into the original frames
+                start, end = stacktrace.get("frames_omitted") or (0, 0)
+                n_original = len(frames) + end - start
+                stacktrace["frames"] = frames[:keep] + frames[-keep:]
+                stacktrace["frames_omitted"] = [keep, n_original - keep]
+        if (size := _json_size(event)) <= max_bytes:
+            return size
+
+    crumbs = (event.get("breadcrumbs") or {}).get("values")
+    while crumbs and size > max_bytes:
+        del crumbs[: max(len(crumbs) // 2, 1)]
+        size = _json_size(event)
+    return size
+
+
+class SpoolTransport(Transport):
+    """Transport that writes envelopes to a `Spool` and uploads them in a thread.
+
+    Parameters
+    ----------
+    spool_dir : Path
+        Directory used for the on-disk spool.
+    dsn : str
+        Sentry DSN to upload to.
+    max_bytes : int
+        Maximum size of the spool (see `Spool`).
+    max_event_bytes : int
+        Events are trimmed to this size before spooling (see `trim_event`).
+    compress : bool
+        Whether to gzip envelopes, on disk and when uploading.
+    intern : bool
+        Whether to spool events with their frame strings interned (see
+        `Spool.append_event`).  They are decoded into standard envelopes when
+        uploaded.
+
+    Attributes
+    ----------
+    stats : Dict[str, int]
+        Number of ``events``, ``trimmed`` events, and the total serialized size of
+        events before (``event_bytes``) and after trimming (``trimmed_bytes``),
+        and of envelopes as spooled (``spooled_bytes``).
+    """
+
+    def __init__(
+        self,
+        spool_dir: Path,
+        dsn: str,
+        max_bytes: int = SPOOL_MAX_BYTES,
+        max_event_bytes: int = MAX_EVENT_BYTES,
+        compress: bool = True,
+        intern: bool = INTERN_FRAMES,
+    ) -> None:
+        # (mypy trips over the type comment on sentry's Transport.__init__)
+        super().__init__({"dsn": dsn})  # type: ignore[misc]
+        assert self.parsed_dsn is not None, "SpoolTransport requires a DSN"
+        self._auth = self.parsed_dsn.to_auth(f"sentry.python/{VERSION}")
+        self.spool = Spool(spool_dir, max_bytes=max_bytes)
+        self.max_event_bytes = max_event_bytes
+        self.compress = compress
+        self.intern = intern
+        self.stats = dict.fromkeys(
+            ("events", "trimmed", "event_bytes", "trimmed_bytes", "spooled_bytes"), 0
+        )
+        self._stop = threading.Event()
+        self._cond = threading.Condition()
+        self._dirty = True  # spool may hold records that haven't been sent
+        self._busy = False  # the uploader is currently draining the spool
+        self._retry_after: Optional[float] = None
+        self._queued: Deque[float] = deque()  # when our spooled envelopes were queued
+        self._thread = threading.Thread(
+            target=self._run, name="napari-error-reporter-upload", daemon=True
+        )
+        self._thread.start()
+
+    # Transport API -------------------------------------------------
+
+    # (sentry annotates `event` with its Event TypedDict, we take any dict)
+    def capture_event(self, event: Dict[str, Any]) -> None:  # type: ignore[override]
+        with METRICS.timed("transport.capture"):
+            self._capture_event(event)
+
+    def _capture_event(self, event: Dict[str, Any]) -> None:
+        size = _json_size(event)
+        trimmed = trim_event(event, self.max_event_bytes)
+        with self._cond:
+            self.stats["events"] += 1
+            self.stats["trimmed"] += trimmed < size
+            self.stats["event_bytes"] += size
+            self.stats["trimmed_bytes"] += trimmed
+
+        if self.intern:
+            if spooled := self.spool.append_event(event, self.compress):
+                self._spooled(spooled)
+            else:
+                self._spool_full()
+                self.record_lost_event("queue_overflow", data_category="error")
+            return
+        self.capture_envelope(_event_envelope(event))
+
+    def capture_envelope(self, envelope: Envelope) -> None:
+        payload, kind = envelope.serialize(), ENVELOPE
+        if self.compress:
+            payload = gzip.compress(payload, COMPRESS_LEVEL)
+            kind = GZIP_ENVELOPE
+        if not self.spool.append(payload, kind):
+            self._spool_full()
+            for item in envelope.items:
+                self.record_lost_event("queue_overflow", item=item)
+            return
+        self._spooled(len(payload))
+
+    def _spooled(self, nbytes: int) -> None:
+        with self._cond:
+            self._queued.append(time.monotonic())
+            self.stats["spooled_bytes"] += nbytes
+            self._dirty = True
+            self._cond.notify_all()
+
+    def _spool_full(self) -> None:
+        METRICS.incr("transport.spool_full")
+        logger.warning("napari-error-reporter spool is full, dropping event.")
+
+    def flush(self, timeout: float, callback: Any = None) -> None:
+        """Wait up to `timeout` seconds for the spool to be uploaded."""
+        with self._cond:
+            self._cond.wait_for(lambda: not (self._dirty or self._busy), timeout)
+
+    def pending(self) -> int:
+        """Return the number of envelopes spooled by this transport not yet sent."""
+        with self._cond:
+            return len(self._queued)
+
+    def kill(self) -> None:
+        self._stop.set()
+        self.spool.close()  # let other processes send what we couldn't
+        with self._cond:
+            self._cond.notify_all()
+
+    # Uploader ------------------------------------------------------
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while not self._stop.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty or self._stop.is_set())
+                self._dirty = False
+                self._busy = True
+            ok = self._drain()
+            with self._cond:
+                self._busy = False
+                self._dirty = self._dirty or not ok
+                self._cond.notify_all()
+            if ok:
+                backoff = 0
+            else:
+                # upload failed: back off (new events don't cut this short)
+                backoff = min(max(backoff * 2, MIN_BACKOFF), MAX_BACKOFF)
+                self._stop.wait(self._retry_after or backoff)
+                self._retry_after = None
+
+    def _drain(self) -> bool:
+        """Upload spooled envelopes until the spool is empty.
+
+        Return False if an upload failed and should be retried later.
+        """
+        while not self._stop.is_set():
+            records = self.spool.read(UPLOAD_BATCH_SIZE)
+            if not records:
+                return True
+            for segment, offset, kind, payload in records:
+                gzipped = kind == GZIP_ENVELOPE
+                if kind in (INTERNED, GZIP_INTERNED):
+                    try:
+                        event = self.spool.decode_event(segment, kind, payload)
+                    except Exception:
+                        METRICS.incr("transport.rejected")
+                        logger.error("Could not decode spooled event, dropping it.")
+                        self.spool.consume(segment, offset)
+                        continue
+                    payload = _event_envelope(event).serialize()
+                    if self.compress:
+                        payload = gzip.compress(payload, COMPRESS_LEVEL)
+                    gzipped = self.compress
+                with METRICS.timed("transport.send"):
+                    sent = self._send(payload, gzipped=gzipped)
+                if not sent:
+                    METRICS.incr("transport.retried")
+                    return False
+                METRICS.incr("transport.sent")
+                if self.spool.owns(segment) and self._queued:
+                    queued = self._queued.popleft()
+                    METRICS.observe("transport.queue_wait", time.monotonic() - queued)
+                self.spool.consume(segment, offset)
+        return True
+
+    def _send(self, payload: bytes, gzipped: bool = False) -> bool:
+        """Post one envelope.  Return False if it should be retried later."""
+        headers = {
+            "Content-Type": "application/x-sentry-envelope",
+            "User-Agent": str(self._auth.client),
+            "X-Sentry-Auth": str(self._auth.to_header()),
+        }
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+        url = self._auth.get_api_url("envelope")  # type: ignore
+        try:
+            with urlopen(
+                Request(url, data=payload, headers=headers), timeout=UPLOAD_TIMEOUT
+            ):
+                return True
+        except HTTPError as e:
+            if e.code == 429 or e.code >= 500:
+                with suppress(TypeError, ValueError):
+                    self._retry_after = float(e.headers.get("Retry-After", ""))
+                return False
+            # any other error won't get better by retrying, so drop the envelope
+            METRICS.incr("transport.rejected")
+            logger.error("Unexpected status code: %s", e.code)
+            return True
+        except OSError:  # includes URLError
+            return False
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _event_envelope(event: Dict[str, Any]) -> Envelope:
+    envelope = Envelope(headers={"event_id": event["event_id"], "sent_at": _now()})
+    envelope.add_event(event)  # type: ignore[arg-type, misc]  # (Event TypedDict)
+    return envelope
@@ -1,17 +1,28 @@
 import functools
+import hashlib
+import json
 import os
 import platform
+import sys
+import threading
+import time
 from contextlib import suppress
 from datetime import datetime
 from importlib import metadata
+from pathlib import Path
 from site import getsitepackages, getusersitepackages
 from subprocess import run
-from typing import Dict, Optional, Set, TypedDict
-from urllib.error import URLError
-from urllib.request import urlopen
+from typing import Any, Callable, Dict, Optional, Set, TypedDict, TypeVar
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
 
 import sentry_sdk
 
+from ._locals import LocalsSerializer
+from ._metrics import METRICS
+from ._sampling import TracesSampler
+from ._scrub import Scrubber, default_scrubber
+
 try:
     from rich import print as pprint
 except ImportError:  # pragma: no cover
@@ -21,13 +32,32 @@ except ImportError:  # pragma: no cover
 SENTRY_DSN = (
     "https://f9d6b27849a34934bd7fe799295af690@o1142361.ingest.sentry.io/6201321"
 )
+# send events elsewhere (e.g. to a local `_ingest.IngestServer` for testing)
+SENTRY_DSN = os.getenv("NAPARI_TELEMETRY_DSN") or SENTRY_DSN
 
 SHOW_HOSTNAME = os.getenv("NAPARI_TELEMETRY_SHOW_HOSTNAME", "0") in ("1", "True")
 SHOW_LOCALS = os.getenv("NAPARI_TELEMETRY_SHOW_LOCALS", "1") in ("1", "True")
 DEBUG = bool(os.getenv("NAPARI_TELEMETRY_DEBUG"))
+# network timeout (seconds) for the background fetch of the ADMINS file
+ADMINS_TIMEOUT = float(os.getenv("NAPARI_TELEMETRY_ADMINS_TIMEOUT", "3"))
+# seconds before a cached ADMINS file is considered stale and re-fetched
+ADMINS_TTL = float(os.getenv("NAPARI_TELEMETRY_ADMINS_TTL", str(60 * 60 * 24)))
+ADMINS_THREAD = "napari-error-reporter-admins"
+ADMINS_URL = (
+    "https://raw.githubusercontent.com/tlambert03/napari-error-reporter/main/ADMINS"
+)
+
 
+class _TracesSettings(TypedDict, total=False):
+    # trace sampling (see _sampling.TracesSampler), only saved if set by the user
+    # (TracesSampler.from_settings falls back to the TRACES_* defaults), and may
+    # be overridden by NAPARI_TELEMETRY_TRACES_* environment variables
+    traces_sample_rate: float
+    traces_op_rates: Dict[str, float]
+    traces_per_minute: float
 
-class SettingsDict(TypedDict):
+
+class SettingsDict(_TracesSettings):
     enabled: Optional[bool]
     with_locals: bool
     admins: Set[str]
@@ -42,19 +72,27 @@ _DEFAULT_SETTINGS: SettingsDict = {
 }
 
 
+@functools.lru_cache(maxsize=None)
+def _scrubber() -> Scrubber:
+    return default_scrubber(hide_hostname=not SHOW_HOSTNAME)
+
+
 def strip_sensitive_data(event: dict, hint: dict):
     """Pre-send hook to strip sensitive data from `event` dict.
 
     https://docs.sentry.io/platforms/python/configuration/filtering/#filtering-error-events
     """
-    # modify event here
-
-    # strip `abs_paths` from stack_trace to hide local paths
-    with suppress(KeyError, IndexError):
-        for exc in event["exception"]["values"]:
-            for frame in exc["stacktrace"]["frames"]:
-                frame.pop("abs_path", None)
-        # only include the name of the executable in sys.argv (remove pathsƒ)
+    # strip `abs_paths` from stack frames, and the home directory, user name,
+    # hostname (and NAPARI_TELEMETRY_SCRUB_PATTERNS) from everything else
+    try:
+        _scrubber()(event)
+    except Exception:  # pragma: no cover
+        # (never send an event that couldn't be scrubbed, and don't raise in
+        # before_send, where sentry only logs it)
+        METRICS.incr("scrub.failed")
+        return None
+    # only include the name of the executable in sys.argv (remove paths)
+    with suppress(KeyError, IndexError, AttributeError):
         if args := event["extra"]["sys.argv"]:
             args[0] = args[0].split(os.sep)[-1]
     if DEBUG:  # pragma: no cover
@@ -62,6 +100,24 @@ def strip_sensitive_data(event: dict, hint: dict):
     return event
 
 
+BeforeSend = Callable[[dict, dict], Optional[dict]]
+
+
+def chain_before_send(*hooks: BeforeSend) -> BeforeSend:
+    """Return a `before_send` hook that calls each of `hooks` in order.
+
+    Stops (and drops the event) as soon as one of them returns None.
+    """
+
+    def before_send(event: dict, hint: dict) -> Optional[dict]:
+        for hook in hooks:
+            if (event := hook(event, hint)) is None:  # type: ignore
+                return None
+        return event
+
+    return before_send
+
+
 def is_editable_install(dist_name: str) -> bool:
     """Return True if `dist_name` is installed as editable.
 
@@ -74,39 +130,201 @@ def is_editable_install(dist_name: str) -> bool:
     return all(loc not in root for loc in installed_paths)
 
 
-def try_get_git_sha(dist_name: str = "napari") -> str:
-    """Try to return a git sha, for `dist_name` and detect if dirty.
+def _find_git_dir(path: Path) -> Optional[Path]:
+    """Return the git directory for the repository containing `path`, or None.
+
+    Follows ``.git`` files (``gitdir: ...``) used by worktrees and submodules.
+    """
+    for parent in (path, *path.parents):
+        dot_git = parent / ".git"
+        if dot_git.is_dir():
+            return dot_git
+        if dot_git.is_file():
+            content = dot_git.read_text().strip()
+            if content.startswith("gitdir:"):
+                return (parent / content[7:].strip()).resolve()
+    return None
+
+
+def _read_git_head(git_dir: Path) -> str:
+    """Resolve HEAD in `git_dir` to a sha by reading files (no `git` process).
+
+    Return empty string if HEAD cannot be resolved.
+    """
+    head = (git_dir / "HEAD").read_text().strip()
+    if not head.startswith("ref:"):
+        return head  # detached HEAD
+    ref = head[4:].strip()
+
+    # linked worktrees keep branch refs and packed-refs in the common dir
+    common = git_dir
+    if (git_dir / "commondir").is_file():
+        common = (git_dir / (git_dir / "commondir").read_text().strip()).resolve()
+
+    for base in (git_dir, common):
+        if (base / ref).is_file():
+            return (base / ref).read_text().strip()
+    if (common / "packed-refs").is_file():
+        for line in (common / "packed-refs").read_text().splitlines():
+            sha, _, name = line.partition(" ")
+            if name == ref:
+                return sha
+    return ""  # pragma: no cover
+
+
+def _git_is_dirty(path) -> Optional[bool]:
+    """Return True if the git repository at `path` has uncommitted changes.
+
+    This runs `git diff`, which can be slow on large checkouts.
+    Return None on failure.
+    """
+    # exit with 1 if there are differences and 0 means no differences
+    # disallow external diff drivers
+    cmd = ["git", "-C", str(path), "diff", "--no-ext-diff", "--quiet", "--exit-code"]
+    try:
+        return bool(run(cmd, capture_output=True).returncode)
+    except Exception:  # pragma: no cover
+        return None
+
+
+def try_get_git_sha(dist_name: str = "napari", check_dirty: bool = False) -> str:
+    """Try to return a git sha, for `dist_name`.
+
+    The sha is read directly from the files in the `.git` directory. If
+    `check_dirty` is True, also run `git diff` and append "-dirty" to the sha if
+    there are uncommitted changes (see also `tag_git_dirty_async`).
 
     Return empty string on failure.
     """
     try:
-        ff = metadata.distribution(dist_name).locate_file("")
-        out = run(["git", "-C", ff, "rev-parse", "HEAD"], capture_output=True)
-        if out.returncode:  # pragma: no cover
-            return ""
-        sha = out.stdout.decode().strip()
-        # exit with 1 if there are differences and 0 means no differences
-        # disallow external diff drivers
-        out = run(["git", "-C", ff, "diff", "--no-ext-diff", "--quiet", "--exit-code"])
-        if out.returncode:  # pragma: no cover
-            sha += "-dirty"
-        return sha
+        root = Path(str(metadata.distribution(dist_name).locate_file("")))
+        return _git_sha_at(root, check_dirty)
     except Exception:  # pragma: no cover
         return ""
 
 
+def _git_sha_at(root: Path, check_dirty: bool = False) -> str:
+    git_dir = _find_git_dir(root)
+    if git_dir is None:  # pragma: no cover
+        return ""
+    sha = _read_git_head(git_dir)
+    if sha and check_dirty and _git_is_dirty(root):  # pragma: no cover
+        sha += "-dirty"
+    return sha
+
+
+def tag_git_dirty_async(dist_name: str = "napari") -> Optional[threading.Thread]:
+    """Set a "git.dirty" tag on the main hub, computed in a background thread.
+
+    Does nothing (and returns None) unless `dist_name` is an editable install.
+    """
+    try:
+        if not is_editable_install(dist_name):
+            return None
+        root = metadata.distribution(dist_name).locate_file("")
+    except Exception:  # pragma: no cover
+        return None
+
+    def _check():
+        dirty = _git_is_dirty(root)
+        if dirty is not None:
+            sentry_sdk.Hub.main.scope.set_tag("git.dirty", str(dirty))
+
+    thread = threading.Thread(target=_check, daemon=True)
+    thread.start()
+    return thread
+
+
+def _environment_fingerprint() -> str:
+    """Return a key that changes whenever the python environment (likely) changes.
+
+    This is deliberately cheap: the interpreter, the OS release, and the
+    modification times of the site-packages directories (which change whenever a
+    distribution is installed, upgraded or removed).
+    """
+    parts = [sys.executable, sys.version, os.getenv("QT_API", "")]
+    if hasattr(os, "uname"):
+        parts.extend(os.uname())
+    else:  # pragma: no cover
+        parts.append(str(sys.getwindowsversion()))  # type: ignore
+    for site_dir in sorted({*getsitepackages(), getusersitepackages()}):
+        with suppress(OSError):
+            parts.append(f"{site_dir}:{os.stat(site_dir).st_mtime_ns}")
+    return hashlib.sha1("\0".join(parts).encode()).hexdigest()
+
+
+T = TypeVar("T")
+
+
+class EnvironmentCache:
+    """JSON-serializable values that only change when the environment does.
+
+    Values are persisted to `path` (if set) and reused across sessions until
+    `_environment_fingerprint()` changes.
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self._path = path
+        self._key = ""
+        self._data: Optional[Dict[str, Any]] = None
+
+    @property
+    def path(self) -> Optional[Path]:
+        return self._path
+
+    @path.setter
+    def path(self, path: Optional[Path]) -> None:
+        if path != self._path:
+            self._path = path
+            self._data = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._key = _environment_fingerprint()
+            self._data = {}
+            if self._path is not None:
+                with suppress(Exception):
+                    with open(self._path) as fh:
+                        data = json.load(fh)
+                    if data["key"] == self._key:
+                        self._data = data["values"]
+        return self._data
+
+    def get(self, name: str, factory: Callable[[], T]) -> T:
+        """Return cached value for `name`, calling `factory` to create it if needed."""
+        data = self._load()
+        if name not in data:
+            data[name] = factory()
+            if self._path is not None:
+                _write_json(self._path, {"key": self._key, "values": data})
+        return data[name]
+
+
+ENV_CACHE = EnvironmentCache()
+
+
+def _release_info(package: str) -> dict:
+    dist = metadata.distribution(package)
+    source = None
+    if is_editable_install(package):
+        source = str(dist.locate_file(""))
+    return {"version": dist.version, "source": source}
+
+
 @functools.lru_cache
 def get_release(package="napari") -> str:
     """Get the current release string for `package`.
 
-    If the package is an editable install, it will return the current git sha.
+    If the package is an editable install, it will return the current git sha
+    (whether the checkout is dirty is reported in a tag, see `tag_git_dirty_async`).
     Otherwise return version string from package metadata.
     """
     with suppress(ModuleNotFoundError):
-        if is_editable_install(package):
-            if sha := try_get_git_sha(package):
+        info = ENV_CACHE.get(f"release:{package}", lambda: _release_info(package))
+        if info["source"]:
+            if sha := _git_sha_at(Path(info["source"])):
                 return sha
-        return metadata.version(package)
+        return info["version"]
     return "UNDETECTED"
 
 
@@ -117,12 +335,12 @@ SENTRY_SETTINGS = dict(
     # This can have a performance and PII impact.
     # Enabled by default on platforms where this is available.
     with_locals=SHOW_LOCALS,
-    # A number between 0 and 1, controlling the percentage chance
-    # a given transaction will be sent to Sentry.
+    # A function that returns a number between 0 and 1, controlling the
+    # percentage chance a given transaction will be sent to Sentry.
     # (0 represents 0% while 1 represents 100%.)
-    # Applies equally to all transactions created in the app.
-    # Either this or traces_sampler must be defined to enable tracing.
-    traces_sample_rate=1.0,
+    # Either this or traces_sample_rate must be defined to enable tracing.
+    # (install_error_reporter replaces this with one built from the user settings)
+    traces_sampler=TracesSampler(),
     # When provided, the name of the server is sent along and persisted
     # in the event. For many integrations the server name actually
     # corresponds to the device hostname, even in situations where the
@@ -139,8 +357,11 @@ SENTRY_SETTINGS = dict(
     debug=DEBUG,
     # -------------------------
     environment=platform.system(),
+    # Seconds to wait for pending events to be sent at exit.
+    # (install_error_reporter flushes them within its own budget before this,
+    # see _shutdown.ExitHandler, and unsent events stay spooled on disk)
+    shutdown_timeout=0,
     # max_breadcrumbs=DEFAULT_MAX_BREADCRUMBS,
-    # shutdown_timeout=2,
     # integrations=[],
     # in_app_include=[],
     # in_app_exclude=[],
@@ -157,33 +378,39 @@ SENTRY_SETTINGS = dict(
     # attach_stacktrace=False,
     # ca_certs=None,
     # propagate_traces=True,
-    # traces_sampler=None,
+    # traces_sample_rate=None,
     # auto_enabling_integrations=True,
     # auto_session_tracking=True,
     # _experiments={},
 )
 
 
-@functools.lru_cache
-def get_tags() -> Dict[str, str]:
-    """Get platform and other tags to associate with this session."""
+def _static_tags() -> Dict[str, str]:
+    """Tags that only change when the environment does (see `ENV_CACHE`)."""
     tags = {"platform.platform": platform.platform()}
 
     with suppress(ImportError):
         from napari.utils.info import _sys_name
 
-        if sys := _sys_name():
-            tags["system_name"] = sys
+        if sys_name := _sys_name():
+            tags["system_name"] = sys_name
+
+    with suppress(ModuleNotFoundError):
+        tags["editable_install"] = str(is_editable_install("napari"))
+
+    return tags
 
-    with suppress(ImportError):
-        import qtpy
 
+@functools.lru_cache
+def get_tags() -> Dict[str, str]:
+    """Get platform and other tags to associate with this session."""
+    tags = dict(ENV_CACHE.get("tags", _static_tags))
+
+    # only if Qt is in use already: importing it just for the tags is too slow
+    if (qtpy := sys.modules.get("qtpy")) is not None:
         tags["qtpy.API_NAME"] = qtpy.API_NAME
         tags["qtpy.QT_VERSION"] = qtpy.QT_VERSION
 
-    with suppress(ModuleNotFoundError):
-        tags["editable_install"] = str(is_editable_install("napari"))
-
     return tags
 
 
@@ -211,6 +438,9 @@ def get_sample_event(**kwargs) -> dict:
                 1 / 0
             except Exception:
                 with sentry_sdk.push_scope() as scope:
+                    # (sentry expects a processor of its Event TypedDict)
+                    processor = LocalsSerializer()
+                    scope.add_event_processor(processor)  # type: ignore[arg-type, misc]
                     for k, v in get_tags().items():
                         scope.set_tag(k, v)
                     del v, k, scope
@@ -224,15 +454,82 @@ def get_sample_event(**kwargs) -> dict:
     return EVENT
 
 
-def _try_get_admins() -> Optional[Set[str]]:
+def _read_admins_cache(cache: Path) -> dict:
+    """Return the contents of the admins `cache` file, or an empty dict."""
+    with suppress(Exception):
+        with open(cache) as fh:
+            data = json.load(fh)
+        if isinstance(data, dict) and isinstance(data.get("admins"), list):
+            return data
+    return {}
+
+
+def _write_json(dest: Path, data: Any) -> None:
+    """Write `data` to `dest` as JSON (atomically), ignoring OS errors."""
+    with suppress(OSError):
+        dest.parent.mkdir(exist_ok=True, parents=True)
+        tmp = dest.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, dest)
+
+
+def _try_get_admins(
+    cache: Optional[Path] = None, timeout: float = ADMINS_TIMEOUT
+) -> Optional[Set[str]]:
     """Retrieve list of current admins stored in the github repo.
 
-    Return None on error.
+    If `cache` is provided, the ETag/Last-Modified headers stored there are used
+    to make a conditional request, and the cache is updated with the response.
+    Return the cached admins (or None if there are none) on error.
     """
-    U = "https://raw.githubusercontent.com/tlambert03/napari-error-reporter/main/ADMINS"
+    cached = _read_admins_cache(cache) if cache is not None else {}
+    headers = {}
+    if etag := cached.get("etag"):
+        headers["If-None-Match"] = etag
+    if last_modified := cached.get("last_modified"):
+        headers["If-Modified-Since"] = last_modified
+
     try:
-        with urlopen(U) as response:
-            content: str = response.read().decode()
-            return {line for line in content.splitlines() if not line.startswith("#")}
-    except URLError:  # pragma: no cover
-        return None
+        with urlopen(Request(ADMINS_URL, headers=headers), timeout=timeout) as resp:
+            content: str = resp.read().decode()
+            admins = {ln for ln in content.splitlines() if not ln.startswith("#")}
+            cached = {
+                "admins": sorted(admins),
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+            }
+    except HTTPError as e:
+        if e.code != 304 or not cached:
+            return set(cached["admins"]) if cached else None
+        # 304: Not Modified ... the cached copy is still current
+    except (URLError, OSError):  # pragma: no cover
+        return set(cached["admins"]) if cached else None
+
+    if cache is not None:
+        _write_json(cache, {**cached, "fetched": time.time()})
+    return set(cached["admins"])
+
+
+def _get_admins(
+    cache: Path,
+    timeout: float = ADMINS_TIMEOUT,
+    ttl: float = ADMINS_TTL,
+    on_fetched: Optional[Callable[[Set[str]], Any]] = None,
+) -> Optional[Set[str]]:
+    """Return the cached admins (or None if there are none), never blocking.
+
+    If there is no cached copy of the ADMINS file, or it is older than `ttl`
+    seconds, it is fetched in a daemon thread (`urlopen`'s timeout does not cover
+    DNS resolution), which then calls `on_fetched` with the current admins.
+    """
+    cached = _read_admins_cache(cache)
+    if not cached or time.time() - cached.get("fetched", 0) > ttl:
+
+        def _fetch() -> None:
+            admins = _try_get_admins(cache, timeout)
+            if admins is not None and on_fetched is not None:
+                on_fetched(admins)
+
+        threading.Thread(target=_fetch, name=ADMINS_THREAD, daemon=True).start()
+    return set(cached["admins"]) if cached else None
@@ -0,0 +1,233 @@
+"""Report UI hangs: stalls of the Qt event loop, with the stack that caused them.
+
+A `QTimer` on the GUI thread calls `HangWatchdog.heartbeat` every few
+milliseconds.  A background thread checks how long ago the last heartbeat was,
+and while the event loop is stalled it samples the GUI thread's stack (with
+`sys._current_frames`, so the GUI thread does no extra work).  When the stall is
+over, the most frequently sampled stack is sent as a "UI hang" event.  Each
+distinct hang location is reported once per session.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from ._metrics import METRICS
+
+# seconds the event loop must be blocked to count as a hang (0: no watchdog)
+HANG_THRESHOLD = float(os.getenv("NAPARI_TELEMETRY_HANG_THRESHOLD", "0"))
+# seconds between heartbeats (and between stack samples during a hang)
+HEARTBEAT_INTERVAL = 0.05
+# a hang still going on after this many seconds is reported without waiting
+MAX_HANG = 30.0
+# number of innermost frames that identify a hang location
+KEY_FRAMES = 5
+
+StackKey = Tuple[Tuple[str, str, int], ...]
+
+
+def _stack_key(frame: Any) -> StackKey:
+    key: List[Tuple[str, str, int]] = []
+    while frame is not None and len(key) < KEY_FRAMES:
+        code = frame.f_code
+        key.append((code.co_filename, code.co_name, frame.f_lineno))
+        frame = frame.f_back
+    return tuple(key)
+
+
+def _serialize_stack(frame: Any) -> List[Dict[str, Any]]:
+    """Return sentry frames (outermost first) for the stack ending in `frame`."""
+    from sentry_sdk.utils import serialize_frame
+
+    frames = []
+    while frame is not None:
+        frames.append(serialize_frame(frame, frame.f_lineno, False))
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class HangWatchdog:
+    """Detect stalls of the thread calling `heartbeat`, and report them.
+
+    Parameters
+    ----------
+    threshold : float
+        Seconds without a heartbeat after which the thread is considered hung.
+    interval : float
+        Seconds between samples of the hung thread's stack.
+    thread_id : int, optional
+        Identifier of the watched thread, by default the thread creating the
+        watchdog.
+    report : Callable[[dict], Any], optional
+        Called with each hang event, by default `Hub.main.capture_event`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = HANG_THRESHOLD,
+        interval: float = HEARTBEAT_INTERVAL,
+        thread_id: Optional[int] = None,
+        report: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self._report = report
+        self._last_beat: Optional[float] = None  # no hangs before the first beat
+        self._reported: Set[StackKey] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # the hang in progress
+        self._hang_start: Optional[float] = None
+        self._samples: "Counter[StackKey]" = Counter()
+        self._stacks: Dict[StackKey, List[Dict[str, Any]]] = {}
+        self._sent_early = False
+
+    def heartbeat(self) -> None:
+        """Record that the watched thread is responsive (call it from its loop)."""
+        self._last_beat = time.monotonic()
+
+    def start(self) -> "HangWatchdog":
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="napari-error-reporter-watchdog", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self, now: Optional[float] = None) -> None:
+        """Sample the watched thread if it is hung, report the hang once it ends."""
+        now = time.monotonic() if now is None else now
+        last = self._last_beat
+        if last is not None and now - last > self.threshold:
+            if self._hang_start is None:
+                self._hang_start = last
+            self._sample()
+            if not self._sent_early and now - self._hang_start > MAX_HANG:
+                self._sent_early = True  # napari may be killed before it recovers
+                self._finish(now, ongoing=True)
+        elif self._hang_start is not None:
+            if not self._sent_early:
+                self._finish(last or now)
+            self._hang_start = None
+            self._sent_early = False
+            self._samples.clear()
+            self._stacks.clear()
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        with METRICS.timed("watchdog.sample"):
+            key = _stack_key(frame)
+            self._samples[key] += 1
+            if key not in self._stacks:
+                self._stacks[key] = _serialize_stack(frame)
+        del frame
+
+    def _finish(self, end: float, ongoing: bool = False) -> None:
+        METRICS.incr("watchdog.hangs")
+        if not self._samples or self._hang_start is None:
+            return
+        key, count = self._samples.most_common(1)[0]
+        if key in self._reported:
+            METRICS.incr("watchdog.duplicates")
+            return
+        self._reported.add(key)
+        event = hang_event(
+            self._stacks[key],
+            duration=end - self._hang_start,
+            samples=sum(self._samples.values()),
+            key_samples=count,
+            ongoing=ongoing,
+        )
+        try:
+            if self._report is not None:
+                self._report(event)
+            else:
+                import sentry_sdk
+
+                sentry_sdk.Hub.main.capture_event(event)  # type: ignore[arg-type]
+        except Exception:  # pragma: no cover
+            METRICS.incr("watchdog.failed")
+
+
+def hang_event(
+    frames: List[Dict[str, Any]],
+    duration: float,
+    samples: int = 1,
+    key_samples: int = 1,
+    ongoing: bool = False,
+) -> Dict[str, Any]:
+    """Return a sentry event for a hang of `duration` seconds in `frames`."""
+    from ._util import get_tags
+
+    where = frames[-1] if frames else {}
+    location = f"{where.get('function')} ({where.get('module') or '?'})"
+    state = "for more than" if ongoing else "for"
+    return {
+        "message": f"UI hang in {location}",
+        "level": "warning",
+        "logger": "napari_error_reporter.watchdog",
+        "fingerprint": ["ui-hang", where.get("module"), where.get("function")],
+        "threads": {
+            "values": [
+                {
+                    "id": threading.main_thread().ident,
+                    "name": "MainThread",
+                    "current": True,
+                    "crashed": False,
+                    "stacktrace": {"frames": frames},
+                }
+            ]
+        },
+        "tags": {**get_tags(), "hang": "true"},
+        "extra": {
+            "hang.description": f"event loop blocked {state} {duration:.2f}s",
+            "hang.duration": round(duration, 3),
+            "hang.ongoing": ongoing,
+            # stack samples taken during the hang, and how many were in this stack
+            "hang.samples": samples,
+            "hang.stack_samples": key_samples,
+        },
+    }
+
+
+def start_watchdog(threshold: float = HANG_THRESHOLD) -> Optional[HangWatchdog]:
+    """Watch the Qt event loop for stalls longer than `threshold` seconds.
+
+    Must be called from the GUI thread.  Returns None (and does nothing) if
+    `threshold` is 0 or there is no ``QApplication``.
+    """
+    if threshold <= 0:
+        return None
+    from ._headless import qt_loaded
+
+    if not qt_loaded():
+        return None  # importing Qt just for this isn't worth it
+    from qtpy.QtCore import QTimer
+    from qtpy.QtWidgets import QApplication
+
+    app = QApplication.instance()
+    if app is None:
+        return None
+    watchdog = HangWatchdog(threshold)
+    timer = QTimer(app)
+    timer.timeout.connect(watchdog.heartbeat)
+    timer.start(int(watchdog.interval * 1000))
+    app.aboutToQuit.connect(watchdog.stop)
+    watchdog._timer = timer  # type: ignore  # (keep a reference)
+    return watchdog.start()
@@ -0,0 +1,32 @@
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import napari_error_reporter
+from napari_error_reporter import _util
+
+
+@pytest.fixture(autouse=True)
+def mocked_settings_and_urlopen(tmp_path, monkeypatch):
+    assert str(napari_error_reporter.settings_path()).endswith(".json")
+    monkeypatch.setattr(
+        napari_error_reporter, "settings_path", lambda: tmp_path / "test.json"
+    )
+    # install_error_reporter replaces it
+    monkeypatch.setattr(sys, "excepthook", sys.excepthook)
+    monkeypatch.setattr(napari_error_reporter, "_ADMINS_CHANGED", False)
+
+    with patch.object(_util, "urlopen") as mock_urlopen:
+        cm = MagicMock()
+        cm.getcode.return_value = 200
+        cm.read.return_value = b"Me (@me)\nYou (@you)"
+        cm.headers = {"ETag": '"abc"'}
+        cm.__enter__.return_value = cm
+        mock_urlopen.return_value = cm
+        yield
+        # (background fetches write settings, which must stay in tmp_path)
+        for thread in threading.enumerate():
+            if thread.name == _util.ADMINS_THREAD:
+                thread.join(5)
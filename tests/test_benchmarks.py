@@ -0,0 +1,262 @@
+"""Benchmarks for the cost of the error reporter to napari.
+
+Run with ``pytest tests/test_benchmarks.py --benchmark-only``.  The generous
+upper bounds asserted here are meant to catch order-of-magnitude regressions
+(they are only checked when benchmarks run, not with ``--benchmark-disable``);
+use ``--benchmark-compare`` to compare against a saved run.
+"""
+import atexit
+import copy
+import gzip
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pytest
+import sentry_sdk
+
+import napari_error_reporter
+from napari_error_reporter import _opt_in_widget, _save_settings, _scrub, _util
+from napari_error_reporter._deferred import DeferredCapture
+from napari_error_reporter._ingest import IngestServer
+from napari_error_reporter._intern import StringTable, encode_stacktraces
+from napari_error_reporter._transport import Spool, _event_envelope
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture
+def hub():
+    """Restore the main hub (client and scope) after `install_error_reporter`."""
+    hub = sentry_sdk.Hub.main
+    original = hub.client
+    with hub.push_scope():
+        yield hub
+        if hub.client is not original:
+            hub.client.close(timeout=0)
+    hub.bind_client(original)
+
+
+def _assert_mean_below(benchmark, seconds: float) -> None:
+    # (there are no stats with --benchmark-disable)
+    if benchmark.stats:
+        assert benchmark.stats["mean"] < seconds
+
+
+def _event_with_frames(n: int) -> dict:
+    frames = [
+        {
+            "abs_path": f"/home/user/napari/napari/module{i}.py",
+            "filename": f"napari/module{i}.py",
+            "function": f"func{i}",
+            "lineno": i,
+            "vars": {"a": "1", "path": "'/home/user/data/image.tif'"},
+        }
+        for i in range(n)
+    ]
+    exception = {"type": "ValueError", "value": "x", "stacktrace": {"frames": frames}}
+    return {
+        "exception": {"values": [exception]},
+        "extra": {"sys.argv": ["/home/user/miniconda/bin/napari"]},
+    }
+
+
+def _recurse(n: int, payload):
+    if n == 0:
+        raise ValueError(payload)
+    _recurse(n - 1, payload)
+
+
+def _import_time_us() -> int:
+    """Cumulative time (us) to import napari_error_reporter in a fresh process."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import napari_error_reporter"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    *_, last = (ln for ln in out.stderr.splitlines() if ln.startswith("import time"))
+    _, _, cumulative, name = (x.strip() for x in last.replace(":", "|").split("|"))
+    assert name == "napari_error_reporter"
+    return int(cumulative)
+
+
+def test_bench_import(benchmark):
+    # (the benchmark times the whole subprocess, the budget is for the import)
+    times = []
+    benchmark.pedantic(lambda: times.append(_import_time_us()), rounds=5)
+    if benchmark.stats:
+        assert statistics.median(times) < 50_000
+
+
+def test_bench_install(benchmark, hub, monkeypatch):
+    _save_settings({**_util._DEFAULT_SETTINGS, "enabled": True})  # type: ignore
+    # don't leave exit handlers or excepthooks behind for every round
+    monkeypatch.setattr(atexit, "register", lambda *args, **kwargs: None)
+    monkeypatch.setattr(sys, "excepthook", sys.excepthook)
+
+    def install():
+        if hub.client is not None:
+            hub.client.close(timeout=0)  # stop the previous round's uploader
+        monkeypatch.setattr(napari_error_reporter, "INSTALLED", False)
+        napari_error_reporter.install_error_reporter()
+
+    with IngestServer() as server:  # (rather than sending to sentry)
+        monkeypatch.setitem(_util.SENTRY_SETTINGS, "dsn", server.dsn)
+        benchmark(install)
+        assert hub.client is not None
+        assert hub.client.dsn == server.dsn
+    _assert_mean_below(benchmark, 0.5)
+
+
+@pytest.mark.parametrize("cache", ["cold", "warm"])
+@pytest.mark.parametrize("func", ["get_release", "get_tags"])
+def test_bench_environment_discovery(benchmark, monkeypatch, tmp_path, func, cache):
+    """Cost of release/tag discovery on a first (cold) or repeat (warm) launch."""
+    path = tmp_path / "env.json"
+    if cache == "warm":
+        monkeypatch.setattr(_util, "ENV_CACHE", _util.EnvironmentCache(path))
+        getattr(_util, func).cache_clear()
+        getattr(_util, func)()
+
+    def discover():
+        # a new cache instance per round, as in a new session
+        monkeypatch.setattr(_util, "ENV_CACHE", _util.EnvironmentCache(path))
+        if cache == "cold":
+            path.unlink(missing_ok=True)
+        getattr(_util, func).cache_clear()
+        return getattr(_util, func)()
+
+    benchmark(discover)
+
+
+def test_bench_strip_sensitive_data(benchmark):
+    event = _event_with_frames(2000)
+
+    def setup():
+        return (copy.deepcopy(event), {}), {}
+
+    benchmark.pedantic(_util.strip_sensitive_data, setup=setup, rounds=50)
+    _assert_mean_below(benchmark, 0.1)
+
+
+@pytest.mark.parametrize("n", [100, 1000, 10_000])
+def test_bench_scrub(benchmark, n):
+    """Scrubbing cost per frame should stay flat as events grow."""
+    scrubber = _scrub.default_scrubber()
+    event = _event_with_frames(n)
+
+    def setup():
+        return (copy.deepcopy(event), {}), {}
+
+    benchmark.pedantic(scrubber, setup=setup, rounds=20)
+    _assert_mean_below(benchmark, n * 50e-6)
+
+
+@pytest.mark.parametrize("with_locals", [False, True], ids=["no_locals", "locals"])
+def test_bench_capture(benchmark, with_locals):
+    payload = list(range(10_000))
+    options = dict(
+        transport=lambda event: None,
+        with_locals=with_locals,
+        before_send=_util.strip_sensitive_data,
+        default_integrations=False,
+    )
+    with sentry_sdk.Client(**options) as client:  # type: ignore
+        cap_hub = sentry_sdk.Hub(client)
+
+        def capture():
+            try:
+                _recurse(50, payload)
+            except ValueError as e:
+                cap_hub.capture_exception(e)
+
+        benchmark(capture)
+    _assert_mean_below(benchmark, 0.1)
+
+
+def test_bench_deferred_capture(benchmark):
+    """Inline cost of a deferred capture, compared to building the event in place."""
+    payload = {i: list(range(100)) for i in range(1000)}
+    options = dict(transport=lambda event: None, default_integrations=False)
+    with sentry_sdk.Client(with_locals=True, **options) as client:  # type: ignore
+        cap_hub = sentry_sdk.Hub(client)
+        deferred = DeferredCapture(cap_hub)
+        try:
+            _recurse(100, payload)
+        except ValueError as e:
+            error = e
+
+        def setup():
+            assert deferred.flush(30)  # (don't compete with the capture thread)
+
+        benchmark.pedantic(deferred.capture, (error,), setup=setup, rounds=20)
+        assert deferred.flush(30)
+        synchronous = []
+        for _ in range(5):
+            start = time.perf_counter()
+            cap_hub.capture_exception(error)
+            synchronous.append(time.perf_counter() - start)
+    _assert_mean_below(benchmark, 0.005)
+    if benchmark.stats:
+        assert benchmark.stats["median"] * 5 < statistics.median(synchronous)
+
+
+def _captured_events(n: int) -> list:
+    events: list = []
+    options = dict(transport=events.append, default_integrations=False)
+    with sentry_sdk.Client(**options) as client:  # type: ignore
+        cap_hub = sentry_sdk.Hub(client)
+        for i in range(n):
+            try:
+                _recurse(50, i)
+            except ValueError as e:
+                cap_hub.capture_exception(e)
+    return events
+
+
+@pytest.mark.parametrize("intern", [False, True], ids=["plain", "interned"])
+def test_bench_queued_event_memory(benchmark, tmp_path, intern):
+    """Memory and spool bytes per queued event, with or without interned frames."""
+    n = 100
+    events = _captured_events(n)
+
+    # in memory: events as kept until they are sent (e.g. by SessionSummary)
+    table = StringTable()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    copies = [copy.deepcopy(e) for e in events]
+    if intern:
+        copies = [encode_stacktraces(e, table) for e in copies]
+    memory = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del copies
+
+    # on disk
+    spool = Spool(tmp_path)
+
+    def append(event):
+        if intern:
+            spool.append_event(event)
+        else:
+            spool.append(gzip.compress(_event_envelope(event).serialize()))
+
+    events = iter(events)
+    benchmark.pedantic(append, setup=lambda: ((next(events),), {}), rounds=n)
+    benchmark.extra_info["memory_bytes_per_event"] = memory / n
+    benchmark.extra_info["spooled_bytes_per_event"] = spool.size() / n
+    spool.close()
+    _assert_mean_below(benchmark, 0.01)
+
+
+def test_bench_opt_in_widget(benchmark, qtbot):
+    _opt_in_widget._render_sample_event(False)  # warm the example cache
+
+    def create():
+        wdg = _opt_in_widget.OptInWidget()
+        wdg.deleteLater()
+
+    benchmark(create)
+    _assert_mean_below(benchmark, 0.5)
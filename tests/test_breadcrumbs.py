@@ -0,0 +1,68 @@
+from unittest.mock import MagicMock
+
+import sentry_sdk
+
+from napari_error_reporter._breadcrumbs import BreadcrumbRecorder, connect_viewer
+
+
+def test_recorder_ring_buffer():
+    rec = BreadcrumbRecorder(size=3)
+    assert rec.breadcrumbs() == []
+    for i in range(5):
+        rec.record("test", f"msg{i}", {"i": i})
+    assert len(rec) == 3
+    crumbs = rec.breadcrumbs()
+    assert [c["message"] for c in crumbs] == ["msg2", "msg3", "msg4"]
+    assert crumbs[0]["data"] == {"i": 2}
+    assert crumbs[0]["timestamp"] <= crumbs[-1]["timestamp"]
+    rec.clear()
+    assert rec.breadcrumbs() == []
+
+
+def test_recorder_coalesces_repeats():
+    rec = BreadcrumbRecorder(size=3)
+    rec.record("napari.dims", "current_step", (0, 1))
+    for i in range(100):
+        rec.record("napari.dims", "current_step", (0, i))
+    rec.record("napari.layers", "inserted")
+    first, second = rec.breadcrumbs()
+    assert first["data"]["value"] == (0, 99)
+    assert first["data"]["count"] == 101
+    assert "count" not in second.get("data", {})
+
+
+def test_recorder_as_event_processor():
+    rec = BreadcrumbRecorder(size=10)
+    events = []
+    client = sentry_sdk.Client(transport=events.append, default_integrations=False)
+    hub = sentry_sdk.Hub(client)
+    hub.scope.add_event_processor(rec)
+
+    rec.record("first")
+    hub.add_breadcrumb(category="sentry", message="second")
+    rec.record("third")
+    hub.capture_message("hi")
+    crumbs = events[0]["breadcrumbs"]["values"]
+    assert [c["category"] for c in crumbs] == ["first", "sentry", "third"]
+
+
+def test_connect_viewer():
+    rec = BreadcrumbRecorder()
+    viewer = MagicMock()
+    layer = MagicMock()
+    layer.name = "image"
+    viewer.layers.__iter__.return_value = [layer]
+    connect_viewer(viewer, rec)
+    layer.events.data.connect.assert_called_once()
+
+    on_step = viewer.dims.events.current_step.connect.call_args[0][0]
+    on_step(MagicMock(value=(1, 2)))
+    on_data = layer.events.data.connect.call_args[0][0]
+    on_data(MagicMock(source=layer))
+    on_inserted = viewer.layers.events.inserted.connect.call_args[0][0]
+    on_inserted(MagicMock(value=layer))
+    assert [c["message"] for c in rec.breadcrumbs()] == [
+        "current_step",
+        "data changed: image",
+        "inserted MagicMock: image",
+    ]
@@ -0,0 +1,80 @@
+import sentry_sdk
+
+from napari_error_reporter._dedup import (
+    BYPASS_HINT,
+    REPEATED_KEY,
+    Deduplicator,
+    TokenBucket,
+    fingerprint,
+)
+from napari_error_reporter._util import chain_before_send
+
+
+def _capture_repeatedly(before_send, n: int) -> list:
+    sent: list = []
+    with sentry_sdk.Client(transport=sent.append, before_send=before_send) as client:
+        hub = sentry_sdk.Hub(client)
+        for _ in range(n):
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                hub.capture_exception()
+    return sent
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=60, burst=2)  # one token per second
+    now = bucket.last
+    assert bucket.take(now) and bucket.take(now)
+    assert not bucket.take(now)
+    assert bucket.take(now + 1)
+
+
+def test_dedup_drops_repeats():
+    dedup = Deduplicator()
+    sent = _capture_repeatedly(chain_before_send(dedup), 100)
+    assert len(sent) == 1
+    assert dedup.dropped == 99
+
+    summaries = dedup.pop_summaries()
+    assert len(summaries) == 1
+    assert summaries[0]["extra"][REPEATED_KEY] == 99
+    assert "ZeroDivisionError" in summaries[0]["message"]
+    assert not dedup.pop_summaries()  # counts were reset
+
+
+def test_dedup_window_reports_repeats():
+    dedup = Deduplicator(window=0)
+    event = {"exception": {"values": [{"type": "ValueError", "value": "x"}]}}
+    assert dedup(dict(event), {})
+    dedup._seen[fingerprint(event)].suppressed = 5
+    # the first event in a new window carries the number of suppressed repeats
+    assert dedup(dict(event), {})["extra"][REPEATED_KEY] == 5
+
+
+def test_dedup_global_rate_limit():
+    dedup = Deduplicator(rate=0, burst=3)
+    events = [{"message": str(i)} for i in range(10)]
+    assert sum(bool(dedup(e, {})) for e in events) == 3
+    # bypassed events are never dropped
+    assert dedup({"message": "summary"}, {BYPASS_HINT: True})
+
+
+def test_dedup_rejected_events_keep_tokens():
+    dedup = Deduplicator(rate=0, burst=1)
+    assert dedup({"message": "a"}, {})
+    # rejected by the global bucket: b's own token isn't spent
+    assert not dedup({"message": "b"}, {})
+    dedup._bucket.tokens = 1
+    assert dedup({"message": "b"}, {})
+
+
+def test_dedup_evicted_counts_are_reported():
+    dedup = Deduplicator(maxsize=1)
+    assert dedup({"message": "a"}, {})
+    assert not dedup({"message": "a"}, {})
+    assert dedup({"message": "b"}, {})  # a is forgotten
+    summaries = dedup.pop_summaries()
+    assert [s["extra"][REPEATED_KEY] for s in summaries] == [1]
+    assert summaries[0]["message"] == "a (repeated 1 times)"
+    assert not dedup.pop_summaries()
@@ -0,0 +1,92 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+import sentry_sdk
+
+from napari_error_reporter._deferred import DeferredCapture
+
+
+@pytest.fixture
+def deferred():
+    events = []
+    options = dict(transport=events.append, default_integrations=False)
+    with sentry_sdk.Client(with_locals=True, **options) as client:  # type: ignore
+        hub = sentry_sdk.Hub(client)
+        yield DeferredCapture(hub), hub, events
+
+
+def _fail(value):
+    return 1 / value
+
+
+def _recurse(n, payload):
+    if n == 0:
+        raise ValueError("deep")
+    _recurse(n - 1, payload)
+
+
+def test_deferred_capture(deferred):
+    capture, hub, events = deferred
+    hub.scope.set_tag("when", "before")
+    value = 0
+    try:
+        _fail(value)
+    except ZeroDivisionError:
+        capture.capture()
+    value = 1  # noqa: F841  (changes after capture are not reported)
+    hub.scope.set_tag("when", "after")
+    assert capture.flush(5)
+
+    (event,) = events
+    assert event["tags"] == {"when": "before"}
+    exc = event["exception"]["values"][0]
+    assert exc["type"] == "ZeroDivisionError"
+    frames = exc["stacktrace"]["frames"]
+    assert [f["function"] for f in frames[-2:]] == ["test_deferred_capture", "_fail"]
+    assert frames[-2]["vars"]["value"] == "0"
+    assert frames[-1]["context_line"].strip() == "return 1 / value"
+
+
+def test_deferred_excepthook(deferred):
+    capture, hub, events = deferred
+    previous = MagicMock()
+    hook = capture.excepthook(previous)
+    try:
+        _fail(0)
+    except ZeroDivisionError as e:
+        hook(type(e), e, e.__traceback__)
+    previous.assert_called_once()
+    assert capture.flush(5)
+    assert events[0]["exception"]["values"][0]["mechanism"]["handled"] is False
+
+
+def test_deferred_capture_is_queued(deferred, monkeypatch):
+    """`capture` returns once queued; events are built in the background."""
+    capture, hub, events = deferred
+    release = threading.Event()
+    transport = hub.client.transport
+    send = transport.capture_event
+
+    def blocked(event):
+        release.wait(30)
+        send(event)
+
+    monkeypatch.setattr(transport, "capture_event", blocked)
+    payload = {i: list(range(100)) for i in range(1000)}
+    for _ in range(3):
+        try:
+            _recurse(100, payload)
+        except ValueError as e:
+            capture.capture(e)
+    assert not capture.flush(0)  # (still queued when `capture` returned)
+    assert not events
+    release.set()
+    assert capture.flush(30)
+    assert len(events) == 3
+
+
+def test_no_client():
+    capture = DeferredCapture(sentry_sdk.Hub(None))
+    capture.capture(ValueError())
+    assert capture.flush(0)
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock
+
+import napari_error_reporter
+from napari_error_reporter import _headless, _load_settings, ask_opt_in
+from napari_error_reporter._headless import prompt, scripted_decision
+
+
+def test_scripted_decision(tmp_path):
+    assert scripted_decision("", "") is None
+    assert scripted_decision("yes", "") == {"enabled": True, "with_locals": False}
+    assert scripted_decision("LOCALS", "") == {"enabled": True, "with_locals": True}
+    assert scripted_decision("0", "")["enabled"] is False
+
+    config = tmp_path / "config.json"
+    assert scripted_decision("", str(config)) is None  # missing file
+    config.write_text(json.dumps({"enabled": True, "with_locals": True}))
+    assert scripted_decision("", str(config)) == {"enabled": True, "with_locals": True}
+    assert scripted_decision("no", str(config))["enabled"] is False  # env wins
+    config.write_text("[]")
+    assert scripted_decision("", str(config)) is None
+
+
+def test_ask_opt_in_scripted(monkeypatch):
+    monkeypatch.setattr(_headless, "OPT_IN", "no")
+    widget = MagicMock()
+    monkeypatch.setattr(napari_error_reporter, "_ask_with_widget", widget)
+    assert ask_opt_in()["enabled"] is False
+    widget.assert_not_called()
+    assert not napari_error_reporter.settings_path().exists()  # not saved
+
+
+def test_prompt(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "stdin", MagicMock(isatty=lambda: False))
+    assert prompt({"Me (@me)"}) is None
+
+    monkeypatch.setattr(sys, "stdin", MagicMock(isatty=lambda: True))
+    monkeypatch.setattr("builtins.input", lambda _: " L ")
+    assert prompt({"Me (@me)"}, admins_have_changed=True) == {
+        "enabled": True,
+        "with_locals": True,
+    }
+    out = capsys.readouterr().out
+    assert "Me (@me)" in out and "CHANGE" in out
+
+
+def test_ask_opt_in_headless(monkeypatch):
+    monkeypatch.setattr(sys, "stdin", MagicMock(isatty=lambda: True))
+    monkeypatch.setattr("builtins.input", lambda _: "y")
+    settings = ask_opt_in(headless=True)
+    assert settings["enabled"] is True
+    assert _load_settings()["enabled"] is True
+
+    # no terminal: no decision, and nothing saved
+    napari_error_reporter.settings_path().unlink()
+    napari_error_reporter._STORES.clear()
+    monkeypatch.setattr(sys, "stdin", MagicMock(isatty=lambda: False))
+    assert ask_opt_in(headless=True)["enabled"] is None
+    assert not napari_error_reporter.settings_path().exists()
+
+
+def test_install_headless_does_not_import_qt(tmp_path):
+    code = (
+        "import sys, napari_error_reporter as ner; ner.install_error_reporter();"
+        "print(ner.INSTALLED, sorted(set(sys.modules) & {'qtpy', 'PyQt5'}))"
+    )
+    env = {
+        **os.environ,
+        "HOME": str(tmp_path),
+        "XDG_DATA_HOME": str(tmp_path),
+        "NAPARI_TELEMETRY_OPT_IN": "yes",
+    }
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env
+    )
+    assert out.stdout.strip() == "True []", out.stderr
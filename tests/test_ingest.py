@@ -0,0 +1,35 @@
+import sentry_sdk
+
+from napari_error_reporter._ingest import IngestServer, main, replay
+from napari_error_reporter._transport import SpoolTransport
+
+
+def test_ingest_server(tmp_path):
+    with IngestServer() as server:
+        transport = SpoolTransport(tmp_path, server.dsn)
+        with sentry_sdk.Client(server.dsn, transport=transport) as client:
+            client.capture_event({"message": "hello"})
+            client.flush(timeout=5)
+        transport.kill()
+        assert [e["message"] for e in server.events()] == ["hello"]
+        assert server.received[0][0] == "/api/1/envelope/"
+        assert server.bytes_received > 0
+        server.clear()
+        assert not server.received
+
+
+def test_replay(tmp_path):
+    result = replay(50, spool_dir=tmp_path, depth=5, timeout=30)
+    assert result["captured"] == 50
+    assert result["sent"] == result["received"] == 50
+    assert result["dropped_queue_full"] == result["dropped_spool_full"] == 0
+
+    # with deduplication, repeats of the same few errors are dropped
+    result = replay(50, depth=5, distinct=1, dedup=True, deferred=False, timeout=30)
+    assert result["dropped_dedup"] > 0
+    assert result["sent"] == result["received"] == 50 - result["dropped_dedup"]
+
+
+def test_replay_cli(capsys):
+    main(["replay", "-n", "5", "--depth", "2"])
+    assert '"captured": 5' in capsys.readouterr().out
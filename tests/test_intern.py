@@ -0,0 +1,106 @@
+import copy
+import gzip
+
+from sentry_sdk.envelope import Envelope
+
+from napari_error_reporter._intern import (
+    ENCODED_KEY,
+    StringTable,
+    decode_stacktraces,
+    encode_stacktraces,
+)
+from napari_error_reporter._transport import INTERNED, Spool
+
+
+def _event(n_frames=50, message="x") -> dict:
+    frames = [
+        {
+            "filename": f"napari/module{i}.py",
+            "abs_path": f"/site-packages/napari/module{i}.py",
+            "module": f"napari.module{i}",
+            "function": f"func{i}",
+            "lineno": i,
+            "context_line": f"    func{i + 1}()",
+            "pre_context": ["", "def f():"],
+            "post_context": [],
+            "in_app": i % 2 == 0,
+            "vars": {"a": "1"},
+        }
+        for i in range(n_frames)
+    ]
+    frames[0]["module"] = None
+    frames[1]["colno"] = 4
+    stacktrace = {"frames": frames}
+    exception = {"type": "ValueError", "value": message, "stacktrace": stacktrace}
+    return {"event_id": "0" * 32, "exception": {"values": [exception]}}
+
+
+def test_encode_decode():
+    table = StringTable()
+    event = _event()
+    original = copy.deepcopy(event)
+    encode_stacktraces(event, table)
+    stacktrace = event["exception"]["values"][0]["stacktrace"]
+    assert "frames" not in stacktrace and ENCODED_KEY in stacktrace
+
+    decode_stacktraces(event, table.strings)
+    del original["exception"]["values"][0]["stacktrace"]["frames"][0]["module"]
+    assert event == original
+
+    # a second event adds no new strings
+    n = len(table)
+    encode_stacktraces(_event(message="y"), table)
+    assert len(table) == n
+
+
+def test_spool_interned_events(tmp_path):
+    spool = Spool(tmp_path)
+    for i in range(3):
+        assert spool.append_event(_event(message=str(i)))
+    records = spool.read()
+    assert len(records) == 3  # (STRINGS records aren't returned)
+
+    segment, offset, kind, payload = records[0]
+    event = spool.decode_event(segment, kind, payload)
+    assert event["exception"]["values"][0]["value"] == "0"
+    spool.consume(segment, offset)
+    spool.close()
+
+    # a new session rebuilds the string table from consumed records
+    spool = Spool(tmp_path)
+    events = [spool.decode_event(s, k, p) for s, _, k, p in spool.read()]
+    assert [e["exception"]["values"][0]["value"] for e in events] == ["1", "2"]
+    expected = _event()["exception"]["values"][0]["stacktrace"]
+    del expected["frames"][0]["module"]  # (None values aren't restored)
+    assert events[1]["exception"]["values"][0]["stacktrace"] == expected
+    assert spool.append_event(_event(), compress=False)
+    spool.close()
+
+
+def test_spool_recreated_segment(tmp_path):
+    """A segment deleted under the writer starts over with a new string table."""
+    spool = Spool(tmp_path)
+    assert spool.append_event(_event(message="0"))
+    segment = spool._segment
+    segment.unlink()  # (e.g. between `_current_segment` and writing)
+    spool._current_segment = lambda: segment  # type: ignore
+    assert spool.append_event(_event(message="1"))
+    [(seg, _, kind, payload)] = spool.read()
+    event = spool.decode_event(seg, kind, payload)
+    assert event["exception"]["values"][0]["value"] == "1"
+    assert event["exception"]["values"][0]["stacktrace"]["frames"]
+    spool.close()
+
+
+def test_spool_interned_size(tmp_path):
+    """Repeated stacks cost a fraction of the (gzipped) envelope per event."""
+    spool = Spool(tmp_path)
+    plain = 0
+    for i in range(100):
+        envelope = Envelope(headers={"event_id": "0" * 32})
+        envelope.add_event(_event(message=str(i)))
+        plain += len(gzip.compress(envelope.serialize()))
+        assert spool.append_event(_event(message=str(i)))
+    assert spool.size() < plain / 2
+    assert INTERNED not in {kind for _, _, kind, _ in spool.read(100)}  # gzipped
+    spool.close()
@@ -0,0 +1,76 @@
+import sentry_sdk
+
+from napari_error_reporter._locals import LocalsSerializer, safe_repr
+
+
+class _Lazy:
+    """Stands in for a dask array: touching the data must never happen."""
+
+    __module__ = "dask.array.core"
+    shape = (10_000, 10_000)
+    dtype = "float64"
+
+    def __repr__(self):
+        raise AssertionError("repr should not be called")
+
+    def __array__(self):
+        raise AssertionError("data should not be computed")
+
+
+def _capture(**kwargs) -> dict:
+    sent: list = []
+    with sentry_sdk.Client(transport=sent.append, with_locals=True) as client:
+        hub = sentry_sdk.Hub(client)
+        with hub.push_scope() as scope:
+            scope.add_event_processor(LocalsSerializer(**kwargs))
+            try:
+                lazy = _Lazy()  # noqa
+                text = "x" * 10_000  # noqa
+                1 / 0
+            except ZeroDivisionError:
+                hub.capture_exception()
+    return sent[0]
+
+
+def test_lazy_arrays_are_summarized():
+    frame = _capture()["exception"]["values"][0]["stacktrace"]["frames"][-1]
+    assert frame["vars"]["lazy"] == (
+        "<dask.array.core._Lazy shape=(10000, 10000) dtype=float64>"
+    )
+    assert len(frame["vars"]["text"]) < 300
+
+
+def test_numpy_summary():
+    import pytest
+
+    np = pytest.importorskip("numpy")
+    assert safe_repr(np.arange(4)) == (
+        "<numpy.ndarray shape=(4,) dtype=int64 min=0 max=3 mean=1.5>"
+    )
+    big = np.zeros((5000, 5000), dtype="uint8")
+    assert safe_repr(big) == "<numpy.ndarray shape=(5000, 5000) dtype=uint8>"
+    assert safe_repr([big]) == "[<numpy.ndarray shape=(5000, 5000) dtype=uint8>]"
+
+
+def test_locals_budget():
+    event = {
+        "exception": {
+            "values": [
+                {
+                    "stacktrace": {
+                        "frames": [
+                            {"vars": {f"outer{i}": i for i in range(100)}},
+                            {"vars": {f"inner{i}": i for i in range(100)}},
+                        ]
+                    }
+                }
+            ]
+        }
+    }
+    LocalsSerializer(max_frame_bytes=50, max_event_bytes=50)(event)
+    outer, inner = event["exception"]["values"][0]["stacktrace"]["frames"]
+    # the innermost frame gets the budget, the outer frame loses its locals
+    assert not any(k.startswith("outer") for k in outer.get("vars", {}))
+    assert "inner0" in inner["vars"]
+    assert sum(len(k) + len(v) for k, v in inner["vars"].items() if k != "...") <= 50
+    assert "more variables not shown" in inner["vars"]["..."]
@@ -0,0 +1,52 @@
+import json
+import time
+
+import pytest
+
+import napari_error_reporter
+from napari_error_reporter._metrics import BUCKETS, Histogram, Metrics
+
+
+def test_histogram():
+    hist = Histogram()
+    for seconds in (2e-5, 2e-5, 5e-4, 10):
+        hist.observe(seconds)
+    summary = hist.summary()
+    assert summary["count"] == 4
+    assert summary["max"] == 10
+    assert summary["mean"] == pytest.approx((4e-5 + 5e-4 + 10) / 4)
+    assert summary["p50"] == 3e-5
+    assert summary["p99"] == 10
+    assert summary["buckets"]["<=3e-05"] == 2
+    assert summary["buckets"][f">{BUCKETS[-1]:g}"] == 1
+
+
+def test_metrics(tmp_path):
+    metrics = Metrics()
+    metrics.incr("dropped")
+    metrics.incr("dropped", 2)
+    with metrics.timed("block"):
+        time.sleep(0.001)
+
+    def func(x):
+        return x * 2
+
+    wrapped = metrics.wrap("func", func)
+    assert wrapped(2) == 4
+    assert wrapped.__wrapped__ is func
+
+    snap = metrics.snapshot()
+    assert snap["counters"] == {"dropped": 3}
+    assert snap["timings"]["block"]["total"] >= 0.001
+    assert snap["timings"]["func"]["count"] == 1
+
+    dest = tmp_path / "metrics.json"
+    metrics.dump(dest)
+    assert json.loads(dest.read_text())["counters"] == {"dropped": 3}
+    metrics.reset()
+    assert metrics.snapshot() == {"counters": {}, "timings": {}}
+
+
+def test_get_metrics_is_public():
+    metrics = napari_error_reporter.get_metrics()
+    assert set(metrics) == {"counters", "timings"}
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+import sentry_sdk
+from sentry_sdk.transport import Transport
+
+from napari_error_reporter import _multiprocess, _util
+from napari_error_reporter._multiprocess import Aggregator
+
+
+class _Transport(Transport):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def capture_event(self, event):
+        self.events.append(event)
+
+
+@pytest.fixture
+def aggregator(monkeypatch):
+    transport = _Transport()
+    client = sentry_sdk.Client(
+        transport=transport,
+        before_send=_util.strip_sensitive_data,
+        default_integrations=False,
+    )
+    hub = sentry_sdk.Hub(client)
+    hub.scope.set_tag("main", "yes")
+    agg = Aggregator(hub)
+    for key, value in agg.environ.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setenv(_multiprocess.LOCALS_ENV, "1")
+    yield agg, transport
+    agg.close()
+    client.close(timeout=0)
+
+
+@pytest.fixture
+def after_fork():
+    """Run `_multiprocess._after_fork` in processes forked during the test."""
+    # (fork handlers can't be unregistered, so this one is disabled afterwards)
+    active = [True]
+    os.register_at_fork(after_in_child=lambda: active and _multiprocess._after_fork())
+    yield
+    active.clear()
+
+
+def _wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _worker():
+    assert _multiprocess.install_worker()
+
+    def fail(x):
+        return 1 / x
+
+    try:
+        fail(0)
+    except ZeroDivisionError:
+        sentry_sdk.capture_exception()
+    sentry_sdk.capture_message("hello")
+
+
+def test_worker_events_are_aggregated(aggregator):
+    agg, transport = aggregator
+    assert not _multiprocess.is_worker()
+
+    proc = multiprocessing.get_context("spawn").Process(target=_worker, name="w1")
+    proc.start()
+    proc.join(30)
+    assert proc.exitcode == 0
+    _wait_for(lambda: len(transport.events) == 2)
+
+    exc, msg = transport.events
+    for event in (exc, msg):
+        assert event["tags"]["worker.name"] == "w1"
+        assert event["tags"]["worker.pid"] == str(proc.pid)
+        assert event["tags"]["main"] == "yes"
+    frames = exc["exception"]["values"][0]["stacktrace"]["frames"]
+    assert frames[-1]["function"] == "fail"
+    assert frames[-1]["vars"] == {"x": "0"}
+    assert all("abs_path" not in f for f in frames)  # stripped in the main process
+    assert msg["message"] == "hello"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_forked_worker(aggregator, after_fork, monkeypatch):
+    agg, transport = aggregator
+    monkeypatch.setattr(_multiprocess, "_AGGREGATOR", agg)
+
+    if sys.version_info >= (3, 12):  # pragma: no cover
+        pytest.skip("forking a multi-threaded process is deprecated")
+    proc = multiprocessing.get_context("fork").Process(
+        target=sentry_sdk.capture_message, args=("forked",)
+    )
+    proc.start()
+    proc.join(30)
+    assert proc.exitcode == 0
+    _wait_for(lambda: len(transport.events) == 1)
+    assert transport.events[0]["message"] == "forked"
+    assert transport.events[0]["tags"]["worker.pid"] == str(proc.pid)
+
+
+def test_not_a_worker_without_aggregator(monkeypatch):
+    monkeypatch.delenv(_multiprocess.ADDRESS_ENV, raising=False)
+    assert not _multiprocess.is_worker()
+    assert not _multiprocess.install_worker()
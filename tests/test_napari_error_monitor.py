@@ -1,4 +1,7 @@
+import shutil
+import subprocess
 import sys
+import threading
 from platform import system
 from unittest.mock import MagicMock, patch
 
@@ -6,6 +9,7 @@ import pytest
 
 import napari_error_reporter
 from napari_error_reporter import (
+    _opt_in_widget,
     _save_settings,
     _util,
     ask_opt_in,
@@ -16,22 +20,6 @@ from napari_error_reporter import (
 from napari_error_reporter._opt_in_widget import OptInWidget
 
 
-@pytest.fixture(autouse=True)
-def mocked_settings_and_urlopen(tmp_path, monkeypatch):
-    assert str(napari_error_reporter.settings_path()).endswith(".json")
-    monkeypatch.setattr(
-        napari_error_reporter, "settings_path", lambda: tmp_path / "test.json"
-    )
-
-    with patch.object(_util, "urlopen") as mock_urlopen:
-        cm = MagicMock()
-        cm.getcode.return_value = 200
-        cm.read.return_value = b"Me (@me)\nYou (@you)"
-        cm.__enter__.return_value = cm
-        mock_urlopen.return_value = cm
-        yield
-
-
 def create_settings(**kwargs) -> _util.SettingsDict:
     return {**_util._DEFAULT_SETTINGS, **kwargs}  # type: ignore
 
@@ -42,10 +30,30 @@ def test_widget(qtbot, monkeypatch):
     wdg._set_no()
     assert wdg._no
 
+    # the sample event is rendered asynchronously
+    qtbot.waitUntil(lambda: "ZeroDivisionError" in wdg.txt.toPlainText())
+    assert "vars:" not in wdg.txt.toPlainText()
+    wdg.send_locals.setChecked(True)
+    qtbot.waitUntil(lambda: "vars:" in wdg.txt.toPlainText())
+
     # make sure we can print a message in the absence of yaml
+    _opt_in_widget._render_sample_event.cache_clear()
     monkeypatch.setitem(sys.modules, "yaml", None)
     wdg = OptInWidget(create_settings())
     qtbot.addWidget(wdg)
+    qtbot.waitUntil(lambda: "'ZeroDivisionError'" in wdg.txt.toPlainText())
+
+
+def test_widget_sample_error(qtbot, monkeypatch):
+    def _fail(with_locals):
+        raise RuntimeError("no client")
+
+    monkeypatch.setattr(_opt_in_widget, "_render_sample_event", _fail)
+    wdg = OptInWidget(create_settings())
+    qtbot.addWidget(wdg)
+    # the dialog doesn't stay on "Generating example..."
+    qtbot.waitUntil(lambda: "Could not generate example" in wdg.txt.toPlainText())
+    assert "no client" in wdg.txt.toPlainText()
 
 
 def test_get_admins():
@@ -53,6 +61,30 @@ def test_get_admins():
     assert _util._try_get_admins() == {"Me (@me)", "You (@you)"}
 
 
+def test_get_admins_cached(tmp_path):
+    cache = tmp_path / "admins.json"
+    fetched = []
+    # without a cached copy, nothing is known until the background fetch is done
+    assert _util._get_admins(cache, on_fetched=fetched.append) is None
+    _join_admins_fetch()
+    assert fetched == [{"Me (@me)", "You (@you)"}]
+    assert _util._read_admins_cache(cache)["etag"] == '"abc"'
+
+    # a fresh cache is returned without touching the network
+    with patch.object(_util, "urlopen", side_effect=AssertionError):
+        assert _util._get_admins(cache) == {"Me (@me)", "You (@you)"}
+
+    # a failed fetch falls back to the cached copy
+    with patch.object(_util, "urlopen", side_effect=_util.URLError("offline")):
+        assert _util._try_get_admins(cache) == {"Me (@me)", "You (@you)"}
+
+    # the fetch sends the cached ETag, and a 304 keeps the cached copy
+    err = _util.HTTPError(_util.ADMINS_URL, 304, "", {}, None)  # type: ignore
+    with patch.object(_util, "urlopen", side_effect=err) as mock:
+        assert _util._try_get_admins(cache) == {"Me (@me)", "You (@you)"}
+        assert mock.call_args[0][0].get_header("If-none-match") == '"abc"'
+
+
 def test_widget_admins_changed(qtbot):
     wdg = OptInWidget(admins_have_changed=True)
     qtbot.addWidget(wdg)
@@ -75,7 +107,7 @@ def test_example_event():
         (dict(enabled=None), 1),
         # if enabled is True, we don't ask unless admins have changed
         (dict(enabled=True), 0),
-        (dict(enabled=True, admins={"Someone (@someone)"}), 1),
+        (dict(enabled=True, admins={"Someone (@someone)"}), 0),  # (asked next time)
         # if enabled is False, we never ask
         (dict(enabled=False), 0),
         (dict(enabled=False, admins={"Someone (@someone)"}), 0),
@@ -94,6 +126,28 @@ def test_opt_in(force, settings, count):
     assert mock.call_count == (1 if force else count)
 
 
+def _join_admins_fetch():
+    for thread in threading.enumerate():
+        if thread.name == _util.ADMINS_THREAD:
+            thread.join(5)
+
+
+def test_opt_in_admins_changed():
+    """Admins are checked in the background, and a change asks again."""
+    _save_settings(create_settings(enabled=True, admins={"Someone (@someone)"}))
+    assert ask_opt_in()["enabled"] is True  # (not waiting for the admins)
+    _join_admins_fetch()
+    assert napari_error_reporter._ADMINS_CHANGED
+    assert napari_error_reporter._drop_if_admins_changed({}, {}) is None
+
+    # the next launch asks again, saying that the admins changed
+    with patch.object(napari_error_reporter, "_ask_with_widget") as ask:
+        ask.return_value = (True, False)
+        settings = ask_opt_in(headless=False)
+    assert ask.call_args[0][1] is True
+    assert settings["admins"] == {"Me (@me)", "You (@you)"}
+
+
 def test_install():
     assert not napari_error_reporter.INSTALLED
     with patch("sentry_sdk.init") as mock:
@@ -113,5 +167,80 @@ def test_install():
         mock.assert_called_once()
 
 
+@pytest.mark.skipif(not shutil.which("git"), reason="git not installed")
+def test_read_git_head(tmp_path):
+    def git(*args, cwd=tmp_path):
+        cmd = ["git", "-c", "user.name=x", "-c", "user.email=x@x", *args]
+        return subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
+
+    git("init", "-q")
+    git("commit", "-q", "--allow-empty", "-m", "init")
+    sha = git("rev-parse", "HEAD").stdout.strip()
+    sub = tmp_path / "sub"
+    sub.mkdir()
+
+    git_dir = _util._find_git_dir(sub)
+    assert git_dir == tmp_path / ".git"
+    assert _util._read_git_head(git_dir) == sha
+    assert _util._git_is_dirty(tmp_path) is False
+
+    git("pack-refs", "--all")
+    assert _util._read_git_head(git_dir) == sha
+
+    git("worktree", "add", "-q", str(tmp_path / "wt"))
+    wt_git_dir = _util._find_git_dir(tmp_path / "wt")
+    assert wt_git_dir and wt_git_dir.is_dir()
+    assert _util._read_git_head(wt_git_dir) == sha
+
+    git("checkout", "-q", "--detach")
+    assert _util._read_git_head(git_dir) == sha
+
+
+def test_environment_cache(tmp_path, monkeypatch):
+    path = tmp_path / "env.json"
+    factory = MagicMock(return_value={"a": "b"})
+    assert _util.EnvironmentCache(path).get("x", factory) == {"a": "b"}
+    assert _util.EnvironmentCache(path).get("x", factory) == {"a": "b"}
+    factory.assert_called_once()
+
+    # a changed environment invalidates the cache
+    monkeypatch.setattr(_util, "_environment_fingerprint", lambda: "new")
+    assert _util.EnvironmentCache(path).get("x", factory) == {"a": "b"}
+    assert factory.call_count == 2
+
+
+def test_get_tags_uses_environment_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(_util.ENV_CACHE, "path", tmp_path / "env.json")
+    _util.get_tags.cache_clear()
+    tags = _util.get_tags()
+    assert "platform.platform" in tags
+
+    _util.get_tags.cache_clear()
+    monkeypatch.setattr(_util.ENV_CACHE, "_data", None)
+    with patch.object(_util, "_static_tags", side_effect=AssertionError):
+        assert _util.get_tags() == tags
+
+
 def test_get_release_fail():
     assert get_release("aasldkhjfas") == "UNDETECTED"
+
+
+# generous upper bound (in microseconds) on the cumulative `-X importtime` cost of
+# `import napari_error_reporter`. Eagerly importing sentry_sdk alone blows this.
+def test_import_is_lazy():
+    code = (
+        "import sys, napari_error_reporter;"
+        "print(sorted({'sentry_sdk', 'appdirs', 'qtpy', 'rich'} & set(sys.modules)))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == "[]"
+
+    # lazy names still resolve
+    assert napari_error_reporter.capture_exception is _util.sentry_sdk.capture_exception
+    assert napari_error_reporter.capture_message is _util.sentry_sdk.capture_message
+    assert napari_error_reporter.OptInWidget is OptInWidget
+    assert "OptInWidget" in dir(napari_error_reporter)
+    with pytest.raises(AttributeError):
+        napari_error_reporter.not_a_thing
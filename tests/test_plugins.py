@@ -0,0 +1,49 @@
+import json
+import os
+from types import SimpleNamespace
+
+from napari_error_reporter import _plugins
+from napari_error_reporter._plugins import PluginClassifier, PluginIndex, plugin_paths
+
+SITE = os.path.join(os.sep, "site-packages")
+NAPARI = os.path.join(SITE, "napari")
+PLUGIN = os.path.join(SITE, "napari_plugin")
+NESTED = os.path.join(NAPARI, "_vendored")
+
+
+def test_plugin_index():
+    index = PluginIndex({NAPARI: "napari", PLUGIN: "napari-plugin", NESTED: "vend"})
+    assert index.lookup(os.path.join(NAPARI, "viewer.py")) == "napari"
+    assert index.lookup(os.path.join(NESTED, "x.py")) == "vend"
+    assert index.lookup(os.path.join(PLUGIN, "_widget.py")) == "napari-plugin"
+    # a prefix of the name is not enough
+    assert index.lookup(os.path.join(SITE, "napari_plugin2", "x.py")) is None
+    assert index.lookup(os.path.join(SITE, "numpy", "x.py")) is None
+    assert index.lookup(None) is None
+    assert PluginIndex({}).lookup(os.path.join(NAPARI, "viewer.py")) is None
+
+
+def test_plugin_classifier():
+    classify = PluginClassifier(PluginIndex({NAPARI: "napari", PLUGIN: "my-plugin"}))
+    frames = [
+        {"abs_path": os.path.join(NAPARI, "viewer.py")},
+        {"abs_path": os.path.join(PLUGIN, "widget.py")},
+        {"abs_path": os.path.join(SITE, "numpy", "core.py")},
+    ]
+    event = {"exception": {"values": [{"stacktrace": {"frames": frames}}]}}
+    classify(event)
+    assert [f["in_app"] for f in frames] == [True, True, False]
+    assert event["tags"] == {"plugin": "my-plugin"}
+
+    # events without any napari/plugin frames are left alone
+    other = {"abs_path": os.path.join(SITE, "numpy", "core.py")}
+    event = {"exception": {"values": [{"stacktrace": {"frames": [other]}}]}}
+    classify(event)
+    assert "in_app" not in other and "tags" not in event
+
+
+def test_plugin_paths(monkeypatch):
+    ep = SimpleNamespace(name="json-plugin", value="json.decoder:napari.yaml")
+    monkeypatch.setattr(_plugins, "_entry_points", lambda: [ep])
+    paths = plugin_paths()
+    assert paths[os.path.dirname(json.__file__)] == "json-plugin"
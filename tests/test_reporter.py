@@ -0,0 +1,41 @@
+import sentry_sdk
+
+from napari_error_reporter import get_reporter
+from napari_error_reporter._reporter import PluginReporter
+
+
+def _client(sent: list):
+    return sentry_sdk.Client(transport=sent.append, default_integrations=False)
+
+
+def test_plugin_reporter():
+    sent: list = []
+    with _client(sent) as client:
+        reporter = PluginReporter("my-plugin", hub=sentry_sdk.Hub(client), burst=2)
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            reporter.capture_exception()
+        reporter.capture_message("hello")
+        reporter.capture_message("over quota")
+    assert [e["tags"]["plugin"] for e in sent] == ["my-plugin", "my-plugin"]
+    assert sent[0]["exception"]["values"][0]["type"] == "ZeroDivisionError"
+    assert reporter.dropped == 1
+
+
+def test_plugin_reporter_sample_rate():
+    sent: list = []
+    with _client(sent) as client:
+        hub = sentry_sdk.Hub(client)
+        reporter = PluginReporter("my-plugin", sample_rate=0, hub=hub)
+        reporter.capture_message("hello")
+    assert not sent
+    assert reporter.dropped == 1
+
+
+def test_get_reporter():
+    reporter = get_reporter("my-plugin")
+    assert reporter is get_reporter("my-plugin")
+    assert reporter is not get_reporter("other-plugin")
+    reporter.capture_message("not installed: nothing to do")
+    assert reporter.dropped == 0
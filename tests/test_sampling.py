@@ -0,0 +1,83 @@
+import json
+
+import pytest
+import sentry_sdk
+from sentry_sdk.transport import Transport
+
+import napari_error_reporter
+from napari_error_reporter import _load_settings, _sampling, _save_settings
+from napari_error_reporter._sampling import TracesSampler, parse_rates
+
+
+def _ctx(op=None, name="txn", parent_sampled=None) -> dict:
+    ctx = {"op": op, "name": name}
+    return {"transaction_context": ctx, "parent_sampled": parent_sampled}
+
+
+def test_parse_rates():
+    assert parse_rates("a=0.5, b.c = 0.1,bad,") == {"a": 0.5, "b.c": 0.1}
+    with pytest.warns(UserWarning, match="'b=x'"):
+        assert parse_rates("a=0.5,b=x") == {"a": 0.5}
+
+
+def test_op_rates():
+    sampler = TracesSampler(rate=0.5, op_rates={"paint": 0.01}, per_minute=0)
+    assert sampler(_ctx()) == 0.5
+    assert sampler(_ctx(op="paint")) == 0.01
+    assert sampler(_ctx(op="paint", parent_sampled=True)) == 1.0
+
+
+def test_adaptive_budget():
+    sampler = TracesSampler(rate=1.0, per_minute=10)
+    rates = [sampler(_ctx()) for _ in range(100)]
+    assert rates[0] == 1.0
+    assert rates[-1] == 10 / 100
+    assert round(sampler.volume()) == 100
+
+
+def test_from_settings(monkeypatch):
+    settings = {"traces_sample_rate": 0.2, "traces_op_rates": {"a": 0.3}}
+    sampler = TracesSampler.from_settings(settings)
+    assert (sampler.rate, sampler.op_rates) == (0.2, {"a": 0.3})
+
+    monkeypatch.setenv("NAPARI_TELEMETRY_TRACES_SAMPLE_RATE", "0.7")
+    monkeypatch.setattr(_sampling, "TRACES_SAMPLE_RATE", 0.7)
+    monkeypatch.setattr(_sampling, "TRACES_OP_RATES", "a=0.9")
+    sampler = TracesSampler.from_settings(settings)
+    assert (sampler.rate, sampler.op_rates) == (0.7, {"a": 0.9})
+
+
+def test_defaults_not_saved(monkeypatch):
+    """Only rates set by the user are saved, so changed defaults apply."""
+    settings = _load_settings()
+    _save_settings(settings, delay=0)
+    saved = json.loads(napari_error_reporter.settings_path().read_text())
+    assert not [key for key in saved if key.startswith("traces_")]
+
+    monkeypatch.setattr(_sampling, "TRACES_SAMPLE_RATE", 0.3)
+    assert TracesSampler.from_settings(_load_settings()).rate == 0.3
+    settings["traces_sample_rate"] = 0.5
+    _save_settings(settings, delay=0)
+    assert TracesSampler.from_settings(_load_settings()).rate == 0.5
+
+
+class _Transport(Transport):
+    def __init__(self):
+        super().__init__()
+        self.envelopes = []
+
+    def capture_envelope(self, envelope):
+        self.envelopes.append(envelope)
+
+
+def test_sampler_with_client():
+    transport = _Transport()
+    sampler = TracesSampler(rate=0, op_rates={"keep": 1}, per_minute=0)
+    with sentry_sdk.Client(transport=transport, traces_sampler=sampler) as client:
+        hub = sentry_sdk.Hub(client)
+        with hub.start_transaction(op="drop", name="a"):
+            pass
+        with hub.start_transaction(op="keep", name="b"):
+            pass
+    names = [e.get_transaction_event()["transaction"] for e in transport.envelopes]
+    assert names == ["b"]
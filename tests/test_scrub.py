@@ -0,0 +1,133 @@
+import os
+import re
+
+import pytest
+
+from napari_error_reporter import _scrub, _util
+from napari_error_reporter._scrub import (
+    Scrubber,
+    default_rules,
+    default_scrubber,
+    parse_patterns,
+)
+
+HOME = os.path.expanduser("~")
+
+
+def test_parse_patterns():
+    assert parse_patterns("") == []
+    assert parse_patterns(r"secret-\d+") == [r"secret-\d+"]
+    assert parse_patterns('["a", "b+"]') == ["a", "b+"]
+    with pytest.warns(UserWarning, match="secret-"):
+        assert parse_patterns('["a", "secret-("]') == ["a"]
+
+
+def test_scrubber_single_pass():
+    scrub = Scrubber([("/home/me", "~"), (r"\bme\b", "<user>"), ("box", "<host>")])
+    event = {
+        "event_id": "me",
+        "message": "me@box failed to open /home/me/data.tif",
+        "exception": {
+            "values": [
+                {
+                    "value": "No such file: '/home/me/data.tif'",
+                    "stacktrace": {
+                        "frames": [
+                            {"abs_path": "/home/me/x.py", "filename": "/home/me/x.py"},
+                            {"vars": {"path": "'/home/me/data.tif'", "n": 1}},
+                        ]
+                    },
+                }
+            ]
+        },
+        "breadcrumbs": {"values": [{"message": "opened /home/me/a.tif"}]},
+    }
+    scrub(event, {})
+    assert event["event_id"] == "me"  # skipped
+    assert event["message"] == "<user>@<host> failed to open ~/data.tif"
+    exc = event["exception"]["values"][0]
+    assert exc["value"] == "No such file: '~/data.tif'"
+    frames = exc["stacktrace"]["frames"]
+    assert frames[0] == {"filename": "~/x.py"}
+    assert frames[1]["vars"] == {"path": "'~/data.tif'", "n": 1}
+    assert event["breadcrumbs"]["values"][0]["message"] == "opened ~/a.tif"
+
+
+def test_scrubber_caches():
+    scrub = Scrubber([("a", "b")])
+    assert scrub.scrub_string("aaa") == "bbb"
+    assert scrub._text.cache == {"aaa": "bbb"}
+    assert Scrubber([]).scrub_string("aaa") == "aaa"
+
+
+def test_default_rules(monkeypatch):
+    monkeypatch.setattr(_scrub, "SCRUB_PATTERNS", [r"token-\w+"])
+    scrub = Scrubber(default_rules())
+    text = f"{HOME}/napari/x.py {HOME}2/y.py token-abc123"
+    assert scrub.scrub_string(text) == f"~/napari/x.py {HOME}2/y.py <redacted>"
+
+
+def test_user_name_in_code(monkeypatch):
+    monkeypatch.setattr(_scrub.getpass, "getuser", lambda: "napari")
+    scrub = default_scrubber(hide_hostname=False)
+    frame = {
+        "module": "napari.utils",
+        "function": "napari_func",
+        "filename": "/data/napari/project/utils.py",
+        "context_line": "import napari",
+    }
+    event = {
+        "message": "napari failed",
+        "exception": {"values": [{"type": "napari.Error", "value": "napari: /x"}]},
+        "threads": {"values": [{"stacktrace": {"frames": [frame]}}]},
+        "fingerprint": ["napari"],
+        "tags": {"plugin": "napari"},
+    }
+    scrub(event, {})
+    # free text and path components are scrubbed...
+    assert event["message"] == "<user> failed"
+    assert event["exception"]["values"][0]["value"] == "<user>: /x"
+    assert frame["filename"] == "/data/<user>/project/utils.py"
+    # ... but not identifiers and source code
+    assert event["exception"]["values"][0]["type"] == "napari.Error"
+    assert frame["module"] == "napari.utils"
+    assert frame["function"] == "napari_func"
+    assert frame["context_line"] == "import napari"
+    assert event["fingerprint"] == ["napari"]
+    assert event["tags"] == {"plugin": "napari"}
+
+
+def test_strip_sensitive_data():
+    event = {
+        "exception": {
+            "values": [
+                {"stacktrace": {"frames": [{"abs_path": f"{HOME}/a.py", "lineno": 1}]}}
+            ]
+        },
+        "extra": {"sys.argv": [f"{HOME}/bin/napari", f"{HOME}/im.tif"]},
+    }
+    _util.strip_sensitive_data(event, {})
+    assert event["exception"]["values"][0]["stacktrace"]["frames"] == [{"lineno": 1}]
+    assert event["extra"]["sys.argv"] == ["napari", "~/im.tif"]
+
+
+def test_patterns_with_groups():
+    # backreferences still refer to the pattern's own groups
+    scrub = Scrubber([("a", "A"), (r"(xy)\1", "<r>"), ("(?i)z", "Z")])
+    assert scrub.scrub_string("a xyxy xy z Z") == "A <r> xy Z Z"
+
+
+def test_invalid_env_pattern_keeps_sending(monkeypatch):
+    with pytest.warns(UserWarning):
+        monkeypatch.setattr(_scrub, "SCRUB_PATTERNS", parse_patterns("secret-("))
+    _util._scrubber.cache_clear()
+    try:
+        event = {"message": f"open {HOME}/secret-1"}
+        assert _util.strip_sensitive_data(event, {}) == {"message": "open ~/secret-1"}
+    finally:
+        _util._scrubber.cache_clear()
+
+
+def test_invalid_pattern():
+    with pytest.raises(re.error):
+        Scrubber([("(", "")])
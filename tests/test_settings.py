@@ -0,0 +1,99 @@
+import gc
+import json
+import multiprocessing
+import weakref
+from datetime import datetime
+from unittest.mock import patch
+
+from napari_error_reporter import _settings
+from napari_error_reporter._settings import SettingsStore
+
+DEFAULTS = {"enabled": None, "admins": set(), "date": datetime(2022, 1, 1)}
+
+
+def test_store_roundtrip(tmp_path):
+    path = tmp_path / "settings.json"
+    store = SettingsStore(path, DEFAULTS, delay=0)
+    assert store.load() == DEFAULTS
+    assert not path.exists()
+
+    store.save({**DEFAULTS, "enabled": True, "admins": {"Me (@me)"}})
+    assert json.loads(path.read_text())["admins"] == ["Me (@me)"]
+    loaded = SettingsStore(path, DEFAULTS).load()
+    assert loaded["enabled"] is True
+    assert loaded["admins"] == {"Me (@me)"}
+    assert loaded["date"] == DEFAULTS["date"]
+
+    # returned settings can be mutated without affecting the store
+    loaded["admins"].add("You (@you)")
+    assert store.load()["admins"] == {"Me (@me)"}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_store_caches_until_file_changes(tmp_path):
+    path = tmp_path / "settings.json"
+    SettingsStore(path, DEFAULTS, delay=0).save({**DEFAULTS, "enabled": False})
+    store = SettingsStore(path, DEFAULTS)
+    with patch.object(_settings.json, "load", wraps=json.load) as load:
+        for _ in range(5):
+            assert store.load()["enabled"] is False
+        assert load.call_count == 1
+
+        # another process changes the file
+        SettingsStore(path, DEFAULTS, delay=0).save({**DEFAULTS, "enabled": True})
+        assert store.load()["enabled"] is True
+        assert load.call_count == 2
+
+
+def test_store_debounces_writes(tmp_path):
+    path = tmp_path / "settings.json"
+    store = SettingsStore(path, DEFAULTS, delay=60)
+    with patch.object(_settings.os, "replace", wraps=_settings.os.replace) as rep:
+        for i in range(10):
+            store.save({**DEFAULTS, "enabled": bool(i % 2)})
+        assert not path.exists()
+        assert store.load()["enabled"] is True  # pending changes are visible
+        store.flush()
+        assert rep.call_count == 1
+    assert SettingsStore(path, DEFAULTS).load()["enabled"] is True
+
+
+def test_store_keeps_corrupt_file(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text('{"enabled": tr')
+    assert SettingsStore(path, DEFAULTS).load() == DEFAULTS
+    assert path.exists()
+
+
+def _write_many(path, n):
+    store = SettingsStore(path, DEFAULTS, delay=0)
+    for i in range(n):
+        store.save({**DEFAULTS, "enabled": True, "admins": {f"admin{i}"}})
+        assert store.load()["enabled"] in (True, None)
+
+
+def test_store_concurrent_processes(tmp_path):
+    path = tmp_path / "settings.json"
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_write_many, args=(path, 50)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+    assert json.loads(path.read_text())["enabled"] is True
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_store_flushed_at_exit_without_leaking(tmp_path):
+    path = tmp_path / "settings.json"
+    store = SettingsStore(path, DEFAULTS, delay=60)
+    store.save({**DEFAULTS, "enabled": True})
+    _settings._flush_all()  # (what runs at exit)
+    assert SettingsStore(path, DEFAULTS).load()["enabled"] is True
+
+    store.close()
+    assert store not in _settings._LIVE_STORES
+    ref = weakref.ref(SettingsStore(path, DEFAULTS))
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,44 @@
+import time
+
+import sentry_sdk
+
+from napari_error_reporter._ingest import IngestServer
+from napari_error_reporter._shutdown import ExitHandler, flush_transport
+from napari_error_reporter._transport import SpoolTransport
+
+
+def test_exit_handler_budget():
+    calls: list = []
+    handler = ExitHandler(budget_ms=50)
+    handler.add("slow", lambda timeout: (calls.append(timeout), time.sleep(timeout)))
+    handler.add("next", calls.append)
+
+    start = time.perf_counter()
+    handler()
+    handler()  # runs only once (atexit and aboutToQuit)
+    assert time.perf_counter() - start < 1
+    assert len(calls) == 2
+    assert 0 < calls[0] <= 0.05
+    assert calls[1] == 0  # the budget was used up
+
+
+def test_flush_transport_leaves_unsent_events_on_disk(tmp_path):
+    with IngestServer() as server:
+        server.status = 503  # ingest endpoint is down
+        transport = SpoolTransport(tmp_path, server.dsn)
+        with sentry_sdk.Client(
+            server.dsn, transport=transport, shutdown_timeout=0
+        ) as client:
+            client.capture_event({"message": "hello"})
+            start = time.perf_counter()
+            assert flush_transport(transport, 0.1) == 1
+            assert time.perf_counter() - start < 1
+        transport.kill()
+
+        # ... and the next session sends them
+        server.status = 200
+        server.clear()
+        transport = SpoolTransport(tmp_path, server.dsn)
+        transport.flush(timeout=5)
+        transport.kill()
+        assert [e["message"] for e in server.events()] == ["hello"]
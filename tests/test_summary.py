@@ -0,0 +1,92 @@
+import sentry_sdk
+
+from napari_error_reporter._dedup import BYPASS_HINT
+from napari_error_reporter._summary import (
+    COUNT_KEY,
+    DROPPED_KEY,
+    SUMMARY_KEY,
+    SessionSummary,
+)
+from napari_error_reporter._util import chain_before_send
+
+
+def test_session_summary():
+    sent: list = []
+    summary = SessionSummary(interval=0, send=sent.append)
+    with sentry_sdk.Client(transport=sent.append, before_send=summary) as client:
+        hub = sentry_sdk.Hub(client)
+        for _ in range(5):
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                hub.capture_exception()
+        hub.capture_message("hello")
+        hub.capture_message("hello")
+        hub.capture_event({"message": "bypass"}, hint={BYPASS_HINT: True})
+        assert [e["message"] for e in sent] == ["bypass"]
+        sent.clear()
+
+        # the first occurrence of each error, with its count
+        assert summary.flush() == 2
+        counts = {e.get("message"): e["extra"][COUNT_KEY]["count"] for e in sent}
+        assert counts == {None: 5, "hello": 2}
+        assert summary.flush() == 0
+        sent.clear()
+
+        # errors that were sent before are only counted in a summary event
+        hub.capture_message("hello")
+        assert summary.flush() == 1
+        (table,) = (e["extra"][SUMMARY_KEY] for e in sent)
+        assert [(row["title"], row["count"]) for row in table] == [("hello", 1)]
+
+
+def test_session_summary_process():
+    sent: list = []
+
+    def process(event, hint):
+        event["processed"] = True
+        return event
+
+    summary = SessionSummary(interval=0, process=process, send=sent.append)
+    before_send = chain_before_send(summary, process)
+    with sentry_sdk.Client(transport=sent.append, before_send=before_send) as client:
+        sentry_sdk.Hub(client).capture_message("hello")
+        assert not sent
+        summary.flush()
+    assert sent[0]["processed"]
+
+
+def test_session_summary_timer():
+    sent: list = []
+    summary = SessionSummary(interval=0.01, send=sent.append)
+    summary({"message": "hello", "event_id": "1"}, {})
+    try:
+        assert summary._thread is not None
+        summary._thread.join(0.01)
+        for _ in range(100):
+            if sent:
+                break
+            summary._thread.join(0.01)
+        assert sent[0]["message"] == "hello"
+    finally:
+        summary.stop()
+
+
+def _error(name: str) -> dict:
+    frame = {"module": "mod", "function": "f", "lineno": 1}
+    exc = {"type": name, "value": "", "stacktrace": {"frames": [frame]}}
+    return {"event_id": name, "exception": {"values": [exc]}}
+
+
+def test_session_summary_max_entries():
+    summary = SessionSummary(interval=0, max_entries=2)
+    for name in ["A", "B", "A", "C"]:  # B is the least recently seen
+        summary(_error(name), {})
+    assert len(summary._entries) == 2
+    assert summary.dropped == 1
+    assert summary._strings.strings
+
+    events = summary.pop_events()
+    assert [e["event_id"] for e in events[:-1]] == ["A", "C"]
+    assert events[-1]["extra"][DROPPED_KEY] == 1
+    assert not summary._strings.strings  # (reset once exemplars are sent)
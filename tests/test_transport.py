@@ -0,0 +1,138 @@
+import re
+
+import pytest
+import sentry_sdk
+
+from napari_error_reporter import _transport, get_metrics
+from napari_error_reporter._ingest import IngestServer
+from napari_error_reporter._transport import Spool, SpoolTransport, trim_event
+
+
+@pytest.fixture
+def ingest():
+    """A local stand-in for the sentry ingest endpoint."""
+    with IngestServer() as server:
+        yield server
+
+
+def test_spool(tmp_path):
+    spool = Spool(tmp_path, max_bytes=100, segment_bytes=20)
+    assert spool.append(b"x" * 20)
+    assert spool.append(b"y" * 20)
+    assert not spool.append(b"z" * 80)  # would exceed max_bytes
+    assert len(spool.segments()) == 2
+
+    records = spool.read()
+    assert [r[3] for r in records] == [b"x" * 20, b"y" * 20]
+    segment, offset, *_ = records[0]
+    spool.consume(segment, offset)
+    assert [r[3] for r in spool.read()] == [b"y" * 20]
+    assert not segment.exists()  # fully consumed segments are removed
+
+    # other instances only see the records once the old one is closed
+    other = Spool(tmp_path)
+    assert not other.read()
+    spool.close()
+    assert [r[3] for r in other.read()] == [b"y" * 20]
+    assert not spool.read()
+    other.close()
+
+
+def test_spool_ownership(tmp_path):
+    """Processes sharing a spool don't read or delete each other's segments."""
+    a, b = Spool(tmp_path, segment_bytes=20), Spool(tmp_path, segment_bytes=20)
+    assert a.append(b"a" * 20) and a.append(b"A" * 20)  # (two segments)
+    assert b.append(b"b" * 20)
+    records = a.read()
+    assert [r[3] for r in records] == [b"a" * 20, b"A" * 20]
+    assert [r[3] for r in b.read()] == [b"b" * 20]
+
+    b.consume(*records[0][:2])  # not b's to consume
+    assert records[0][0].exists()
+    a.close()  # e.g. a's process exited before uploading
+    assert [r[3] for r in b.read()] == [b"a" * 20, b"A" * 20, b"b" * 20]
+    for segment, offset, *_ in b.read():
+        b.consume(segment, offset)
+    assert not records[0][0].exists()
+    assert [p.stem for p in tmp_path.glob("*.lock")] == [b._segment.stem]
+    b.close()
+
+
+def test_spool_transport_offline_then_online(tmp_path, ingest, monkeypatch):
+    monkeypatch.setattr(_transport, "MIN_BACKOFF", 60)
+    ingest.status = 503  # ingest endpoint is down
+    transport = SpoolTransport(tmp_path, ingest.dsn)
+    with sentry_sdk.Client(
+        ingest.dsn, transport=transport, shutdown_timeout=0
+    ) as client:
+        for i in range(3):
+            client.capture_event({"message": f"event {i}"})
+        client.flush(timeout=0.5)
+    spool = Spool(tmp_path)
+    assert len(spool.read()) == 3
+    spool.close()
+
+    # the next session drains what was left behind
+    ingest.status = 200
+    ingest.received.clear()
+    transport = SpoolTransport(tmp_path, ingest.dsn)
+    transport.flush(timeout=5)
+    transport.kill()
+    assert not transport.spool.read()
+    assert ingest.received[0][0] == "/api/1/envelope/"
+    messages = sorted(env.get_event()["message"] for _, env in ingest.received)
+    assert messages == ["event 0", "event 1", "event 2"]
+
+
+def _big_event(n_frames=200):
+    frames = [{"function": f"f{i}", "vars": {"x": "y" * 500}} for i in range(n_frames)]
+    return {
+        "event_id": "0" * 32,
+        "exception": {"values": [{"type": "E", "stacktrace": {"frames": frames}}]},
+        "breadcrumbs": {"values": [{"message": "z" * 1000}] * 100},
+    }
+
+
+def test_trim_event():
+    event = _big_event()
+    assert trim_event(event, max_bytes=10**7) > 100_000
+    frames = event["exception"]["values"][0]["stacktrace"]["frames"]
+    assert len(frames) == 200
+
+    # outer frames lose their locals first
+    assert trim_event(event, max_bytes=180_000) <= 180_000
+    assert "vars" in frames[-1] and "vars" not in frames[0]
+
+    # then frames in the middle are removed
+    assert trim_event(event, max_bytes=105_000) <= 105_000
+    stacktrace = event["exception"]["values"][0]["stacktrace"]
+    assert stacktrace["frames_omitted"] == [50, 150]
+    assert [f["function"] for f in stacktrace["frames"][49:51]] == ["f49", "f150"]
+    assert len(event["breadcrumbs"]["values"]) == 100
+
+    # and finally breadcrumbs
+    assert trim_event(event, max_bytes=50_000) <= 50_000
+    assert stacktrace["frames_omitted"] == [5, 195]
+    assert len(event["breadcrumbs"]["values"]) < 50
+
+
+def test_spool_transport_compresses(tmp_path, ingest):
+    transport = SpoolTransport(tmp_path, ingest.dsn, max_event_bytes=50_000)
+    with sentry_sdk.Client(
+        ingest.dsn, transport=transport, shutdown_timeout=0
+    ) as client:
+        client.capture_event(_big_event())
+        client.flush(timeout=5)
+    stats = transport.stats
+    assert stats["events"] == stats["trimmed"] == 1
+    assert stats["trimmed_bytes"] <= 50_000 < stats["event_bytes"]
+    assert stats["spooled_bytes"] < stats["trimmed_bytes"] / 10
+    event = ingest.received[0][1].get_event()
+    assert len(event["exception"]["values"][0]["stacktrace"]["frames"]) <= 100
+    timings = get_metrics()["timings"]
+    assert timings["transport.send"]["count"] >= 1
+    assert timings["transport.queue_wait"]["count"] >= 1
+
+
+def test_sent_at_format():
+    assert re.fullmatch(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}Z", _transport._now())
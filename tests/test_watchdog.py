@@ -0,0 +1,48 @@
+import threading
+
+from napari_error_reporter._watchdog import HangWatchdog, start_watchdog
+
+
+def _block(release: threading.Event):
+    release.wait()
+
+
+def test_hang_watchdog():
+    release = threading.Event()
+    blocked = threading.Thread(target=_block, args=(release,), daemon=True)
+    blocked.start()
+    events: list = []
+    watchdog = HangWatchdog(threshold=1, thread_id=blocked.ident, report=events.append)
+    try:
+        watchdog.check()  # no heartbeat yet: not a hang
+        watchdog.heartbeat()
+        beat = watchdog._last_beat
+        assert beat is not None
+        watchdog.check(beat + 0.5)
+        assert not watchdog._samples
+        for dt in (1.5, 2, 2.5):  # hung
+            watchdog.check(beat + dt)
+        assert not events
+        watchdog.heartbeat()  # recovered
+        watchdog.check()
+
+        assert len(events) == 1
+        event = events[0]
+        assert event["message"].startswith("UI hang in ")
+        assert event["tags"]["hang"] == "true"
+        assert event["extra"]["hang.samples"] == 3
+        frames = event["threads"]["values"][0]["stacktrace"]["frames"]
+        assert "_block" in [f["function"] for f in frames]
+
+        # the same hang again isn't reported twice
+        beat = watchdog._last_beat
+        watchdog.check(beat + 2)
+        watchdog.heartbeat()
+        watchdog.check()
+        assert len(events) == 1
+    finally:
+        release.set()
+
+
+def test_start_watchdog_disabled():
+    assert start_watchdog(0) is None